@@ -128,4 +128,7 @@ class BaseLabeling(Application):
 
         for current_file in files:
             fX = sequence_labeling(current_file)
-            precomputed.dump(current_file, fX)
+            precomputed.dump_async(current_file, fX)
+
+        # wait for all features to be written
+        precomputed.flush()
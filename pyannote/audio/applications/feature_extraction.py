@@ -30,8 +30,11 @@
 Feature extraction
 
 Usage:
-  pyannote-speech-feature [--robust --parallel --database=<database.yml>] <experiment_dir> <database.task.protocol>
-  pyannote-speech-feature check [--database=<database.yml>] <experiment_dir> <database.task.protocol>
+  pyannote-speech-feature [--robust --parallel --jobs=<n> --chunksize=<n> --chunk=<seconds> --database=<database.yml>] <experiment_dir> <database.task.protocol>
+  pyannote-speech-feature check [--jobs=<n> --report=<report.jsonl> --database=<database.yml>] <experiment_dir> <database.task.protocol>
+  pyannote-speech-feature shard [--shard-size=<bytes> --remove] <experiment_dir>
+  pyannote-speech-feature quantize [--dtype=<dtype>] <experiment_dir> <output_dir> <database.task.protocol>
+  pyannote-speech-feature statistics [--subset=<subset> --jobs=<n>] <experiment_dir> <database.task.protocol>
   pyannote-speech-feature -h | --help
   pyannote-speech-feature --version
 
@@ -44,9 +47,43 @@ Options:
   --database=<database.yml>  Path to pyannote.database configuration file.
   --robust                   When provided, skip files for which feature extraction fails.
   --parallel                 When provided, process files in parallel.
+  --chunksize=<n>            Number of files sent at once to each worker.
+                             [default: 1]
+  --chunk=<seconds>          Extract (and store) features of each file by
+                             chunks of that many seconds, so that very long
+                             files do not need to fit in memory. Chunks are
+                             extracted in parallel threads unless files are
+                             processed in parallel.
+  --report=<report.jsonl>    Where to write the "check" report. Defaults to
+                             <experiment_dir>/check.jsonl.
+  --shard-size=<bytes>       Approximate maximum size of each shard, in bytes.
+                             [default: 1073741824]
+  --remove                   When provided, remove ".npy" files once packed.
+  <output_dir>               Path to directory where quantized features (or
+                             scores) are stored.
+  --dtype=<dtype>            Storage type ("float16" or "int8").
+                             [default: int8]
+  --subset=<subset>          Set subset (train|developement|test).
+                             [default: train]
+  --jobs=<n>                 Number of parallel workers. Defaults to using
+                             all CPUs.
   -h --help                  Show this screen.
   --version                  Show version.
 
+Resuming:
+    Completed (and failed) files are recorded in <experiment_dir>/manifest.jsonl
+    (one JSON object per line). Completed files are skipped when extraction is
+    run again (e.g. after an interruption), failed ones are retried. Files
+    missing from the manifest (e.g. extracted before it existed) are skipped
+    as well when valid features already exist.
+
+Checking:
+    "check" compares the duration of precomputed features with that of audio
+    files and looks for NaNs, in parallel. It writes one JSON object per file
+    (with "uri", "subset" and a list of "issues" among "no_audio",
+    "no_features", "duration_mismatch" and "nan") to the report file and
+    prints a short summary.
+
 Configuration file:
     The configuration of each experiment is described in a file called
     <experiment_dir>/config.yml, that describes the feature extraction process
@@ -63,12 +100,32 @@ Configuration file:
           DD: True                   # energy derivatives
     ...................................................................
 
+"quantize" mode:
+    Store features (or scores) precomputed in <experiment_dir> with a compact
+    storage type into <output_dir>, and report the accuracy impact (root mean
+    square error, maximum absolute error, signal-to-quantization-noise ratio
+    and agreement of the argmax over dimensions) on files of the protocol.
+
+"statistics" mode:
+    Compute per-dimension mean and standard deviation of features
+    precomputed in <experiment_dir>, over the whole <subset> of the protocol,
+    and store them in <experiment_dir>/statistics.yml. Use `normalize: True`
+    (Precomputed) or `statistics: <experiment_dir>/statistics.yml` (other
+    feature extractors) to standardize features with these statistics.
+
+"shard" mode:
+    Pack features stored as one ".npy" file per file into a few large shard
+    files (plus an index) that are memory-mapped once per process. This is
+    recommended for corpora made of many short files.
+
 """
 
 import yaml
+import json
 import os.path
 import numpy as np
 import functools
+from tqdm import tqdm
 from docopt import docopt
 
 from pyannote.database import FileFinder
@@ -79,10 +136,20 @@ from pyannote.core.utils.helper import get_class_by_name
 
 from pyannote.audio.features import Precomputed
 from pyannote.audio.features.utils import get_audio_duration
+from pyannote.audio.features.metadata import AUDIO_METADATA
 from pyannote.audio.features.precomputed import PyannoteFeatureExtractionError
+from pyannote.audio.features.precomputed import convert_to_shards
+from pyannote.audio.features.precomputed import STATISTICS_YML
+from pyannote.audio.features.normalization import FeatureStatistics
 
 from multiprocessing import cpu_count, Pool
 
+# record of completed (and failed) files, in <experiment_dir>
+MANIFEST = 'manifest.jsonl'
+
+# per-worker state (see `init_extract_worker` and `init_precomputed_worker`)
+_worker = dict()
+
 
 def init_feature_extraction(experiment_dir):
 
@@ -99,21 +166,22 @@ def init_feature_extraction(experiment_dir):
 
     return feature_extraction
 
-def process_current_file(current_file, file_finder=None, precomputed=None,
-                         feature_extraction=None, robust=False):
+def process_current_file(current_file, precomputed=None,
+                         feature_extraction=None, chunk_duration=None,
+                         chunk_jobs=1):
+    """Extract and store features of one file
 
-    try:
-        current_file['audio'] = file_finder(current_file)
-    except ValueError as e:
-        if not robust:
-            raise PyannoteFeatureExtractionError(*e.args)
-        return e
+    Files are not checked for existing features: `extract` decides which
+    files are already done (see `load_manifest` and `has_features`).
+    """
 
     uri = get_unique_identifier(current_file)
-    path = precomputed.get_path(current_file)
 
-    if os.path.exists(path):
-        return
+    if chunk_duration is not None:
+        return process_current_file_by_chunks(
+            current_file, precomputed=precomputed,
+            feature_extraction=feature_extraction,
+            chunk_duration=chunk_duration, chunk_jobs=chunk_jobs)
 
     try:
         features = feature_extraction(current_file)
@@ -134,35 +202,106 @@ def process_current_file(current_file, file_finder=None, precomputed=None,
     return
 
 
-def helper_extract(current_file, file_finder=None, experiment_dir=None,
-                   config_yml=None, feature_extraction=None,
-                   robust=False):
+def process_current_file_by_chunks(current_file, precomputed=None,
+                                   feature_extraction=None,
+                                   chunk_duration=None, chunk_jobs=1):
+
+    uri = get_unique_identifier(current_file)
 
+    try:
+        n_frames, chunks = feature_extraction.iter_chunks(
+            current_file, chunk_duration=chunk_duration, n_jobs=chunk_jobs)
+        precomputed.dump_chunks(current_file, n_frames, chunks)
+    except PyannoteFeatureExtractionError as e:
+        msg = 'Feature extraction failed for file "{uri}".'
+        return msg.format(uri=uri)
+
+    # features were written to disk as they came: check them from there
+    if precomputed.count_nan(current_file) > 0:
+        os.remove(precomputed.get_path(current_file))
+        msg = 'Feature extraction returned NaNs for file "{uri}".'
+        return msg.format(uri=uri)
+
+    return
+
+
+def init_extract_worker(experiment_dir, chunk_duration=None, chunk_jobs=1,
+                        feature_extraction=None, precomputed=None):
+    """Instantiate feature extraction and storage once per worker
+
+    Already instantiated `feature_extraction` and `precomputed` may be
+    provided (e.g. when extracting features in the main process).
+    """
     if feature_extraction is None:
         feature_extraction = init_feature_extraction(experiment_dir)
+    if precomputed is None:
+        precomputed = Precomputed(root_dir=experiment_dir)
+    _worker['feature_extraction'] = feature_extraction
+    _worker['precomputed'] = precomputed
+    _worker['chunk_duration'] = chunk_duration
+    _worker['chunk_jobs'] = chunk_jobs
+
+
+def helper_extract(current_file):
+    error = process_current_file(
+        current_file, precomputed=_worker['precomputed'],
+        feature_extraction=_worker['feature_extraction'],
+        chunk_duration=_worker['chunk_duration'],
+        chunk_jobs=_worker['chunk_jobs'])
+    return get_unique_identifier(current_file), error
+
+
+def load_manifest(path):
+    """Get URIs of files whose features were already extracted
+
+    Returns
+    -------
+    done : set
+        URIs of files whose features were extracted.
+    failed : set
+        URIs of files whose (last) extraction failed.
+    """
+
+    done, failed = set(), set()
+    if not os.path.exists(path):
+        return done, failed
+
+    with open(path, 'r') as fp:
+        for line in fp:
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                # last line may have been truncated by an interruption
+                continue
+            if entry['status'] == 'done':
+                done.add(entry['uri'])
+                failed.discard(entry['uri'])
+            else:
+                done.discard(entry['uri'])
+                failed.add(entry['uri'])
 
-    precomputed = Precomputed(root_dir=experiment_dir)
-    return process_current_file(current_file, file_finder=file_finder,
-                                precomputed=precomputed,
-                                feature_extraction=feature_extraction,
-                                robust=robust)
+    return done, failed
 
 
-def extract(protocol_name, file_finder, experiment_dir,
-            robust=False, parallel=False):
-    protocol = get_protocol(protocol_name, progress=False)
+def has_features(precomputed, current_file, dimension):
+    """Check whether valid features were already extracted for this file
 
-    # load configuration file
-    config_yml = experiment_dir + '/config.yml'
-    with open(config_yml, 'r') as fp:
-        config = yaml.load(fp, Loader=yaml.SafeLoader)
+    Only the header of stored features is read.
+    """
+    try:
+        shape = precomputed.shape(current_file)
+    except (OSError, ValueError) as e:
+        return False
+    return len(shape) == 2 and shape[0] > 0 and shape[1] == dimension
 
-    FeatureExtraction = get_class_by_name(
-        config['feature_extraction']['name'],
-        default_module_name='pyannote.audio.features')
-    feature_extraction = FeatureExtraction(
-        **config['feature_extraction'].get('params', {}))
 
+def extract(protocol_name, file_finder, experiment_dir,
+            robust=False, parallel=False, n_jobs=None, chunksize=1,
+            chunk_duration=None):
+
+    protocol = get_protocol(protocol_name, progress=False)
+
+    feature_extraction = init_feature_extraction(experiment_dir)
     sliding_window = feature_extraction.sliding_window
     dimension = feature_extraction.dimension
 
@@ -173,40 +312,132 @@ def extract(protocol_name, file_finder, experiment_dir,
                               sliding_window=sliding_window,
                               dimension=dimension)
 
-    if parallel:
+    manifest = os.path.join(experiment_dir, MANIFEST)
+    done, failed = load_manifest(manifest)
 
-        extract_one = functools.partial(helper_extract,
-                                        file_finder=file_finder,
-                                        experiment_dir=experiment_dir,
-                                        config_yml=config_yml,
-                                        robust=robust)
+    with open(manifest, 'a') as fp:
 
-        n_jobs = cpu_count()
-        pool = Pool(n_jobs)
-        imap = pool.imap
+        def record(uri, error=None):
+            entry = {'uri': uri, 'status': 'done' if error is None
+                                           else 'failed'}
+            if error is not None:
+                entry['error'] = str(error)
+            fp.write(json.dumps(entry) + '\n')
+            fp.flush()
 
-    else:
+        files = []
+        for current_file in FileFinder.protocol_file_iter(
+            protocol, extra_keys=['audio']):
 
-        feature_extraction = init_feature_extraction(experiment_dir)
-        extract_one = functools.partial(helper_extract,
-                                        file_finder=file_finder,
-                                        experiment_dir=experiment_dir,
-                                        feature_extraction=feature_extraction,
-                                        robust=robust)
-        imap = map
+            uri = get_unique_identifier(current_file)
+            if uri in done:
+                continue
 
+            # files missing from the manifest (e.g. extracted before it
+            # existed) are only checked for existing features.
+            if uri not in failed and \
+                    has_features(precomputed, current_file, dimension):
+                record(uri)
+                continue
 
-    for result in imap(extract_one, FileFinder.protocol_file_iter(
-        protocol, extra_keys=['audio'])):
-        if result is None:
-            continue
-        print(result)
+            try:
+                current_file['audio'] = file_finder(current_file)
+            except ValueError as e:
+                if not robust:
+                    raise PyannoteFeatureExtractionError(*e.args)
+                print(e)
+                record(uri, error=e)
+                continue
+
+            files.append(current_file)
+
+        # process longest files first so that no worker is left alone
+        # with a very long file at the very end
+        AUDIO_METADATA.populate(current_file['audio']
+                                for current_file in files)
+        files = sorted(files, key=get_audio_duration, reverse=True)
+
+        if n_jobs is None:
+            n_jobs = cpu_count()
+
+        if parallel:
+            pool = Pool(n_jobs, initializer=init_extract_worker,
+                        initargs=(experiment_dir, chunk_duration))
+            imap = functools.partial(pool.imap_unordered,
+                                     chunksize=chunksize)
+        else:
+            # chunks of each file are extracted in parallel instead
+            init_extract_worker(experiment_dir,
+                                chunk_duration=chunk_duration,
+                                chunk_jobs=n_jobs,
+                                feature_extraction=feature_extraction,
+                                precomputed=precomputed)
+            imap = map
+
+        for uri, error in tqdm(imap(helper_extract, files),
+                               total=len(files), unit='file',
+                               desc='Feature extraction'):
+            if error is not None:
+                tqdm.write(error)
+            record(uri, error=error)
+
+        if parallel:
+            pool.close()
+            pool.join()
+
+def init_precomputed_worker(experiment_dir):
+    _worker['precomputed'] = Precomputed(experiment_dir)
 
-def check(protocol_name, file_finder, experiment_dir):
+
+def helper_check(task):
+
+    subset, current_file, duration = task
+    precomputed = _worker['precomputed']
+
+    record = {'uri': get_unique_identifier(current_file),
+              'subset': subset,
+              'issues': []}
+
+    if duration is None:
+        record['issues'].append('no_audio')
+        return record
+    record['duration'] = float(duration)
+
+    # only the header is read here...
+    try:
+        n_frames = precomputed.shape(current_file)[0]
+    except FileNotFoundError as e:
+        record['issues'].append('no_features')
+        return record
+
+    features_duration = precomputed.sliding_window.rangeToSegment(
+        0, n_frames).duration
+    record['features_duration'] = float(features_duration)
+    if not np.isclose(duration, features_duration, atol=1.):
+        record['issues'].append('duration_mismatch')
+
+    # ... and features are scanned chunk by chunk
+    n_nan = precomputed.count_nan(current_file)
+    if n_nan > 0:
+        record['issues'].append('nan')
+        record['nan_frames'] = int(n_nan)
+
+    return record
+
+
+def check(protocol_name, file_finder, experiment_dir,
+          n_jobs=None, report=None):
 
     protocol = get_protocol(protocol_name)
-    precomputed = Precomputed(experiment_dir)
 
+    if n_jobs is None:
+        n_jobs = cpu_count()
+
+    if report is None:
+        report = os.path.join(experiment_dir, 'check.jsonl')
+
+    # (subset, file, whether audio was found)
+    tasks = []
     for subset in ['development', 'test', 'train']:
 
         try:
@@ -216,37 +447,175 @@ def check(protocol_name, file_finder, experiment_dir):
             continue
 
         for current_file in getattr(protocol, subset)():
-
             try:
-                audio = file_finder(current_file)
-                current_file['audio'] = audio
+                current_file['audio'] = file_finder(current_file)
             except ValueError as e:
-                print(e)
+                tasks.append((subset, current_file, False))
                 continue
+            tasks.append((subset, current_file, True))
 
-            duration = get_audio_duration(current_file)
+    # audio durations are read (in parallel) from files headers
+    AUDIO_METADATA.populate(current_file['audio']
+                            for _, current_file, found in tasks if found)
+    tasks = [(subset, current_file,
+              get_audio_duration(current_file) if found else None)
+             for subset, current_file, found in tasks]
 
-            try:
-                features = precomputed(current_file)
-            except PyannoteFeatureExtractionError as e:
-                print(e)
+    n_issues = dict()
+    with Pool(n_jobs, initializer=init_precomputed_worker,
+              initargs=(experiment_dir, )) as pool, \
+         open(report, 'w') as fp:
+
+        for record in tqdm(pool.imap_unordered(helper_check, tasks,
+                                               chunksize=8),
+                           total=len(tasks), unit='file', desc='Check'):
+            fp.write(json.dumps(record) + '\n')
+            for issue in record['issues']:
+                n_issues[issue] = n_issues.get(issue, 0) + 1
+
+    print(f'Files: {len(tasks)}')
+    for issue, n in sorted(n_issues.items()):
+        print(f'{issue}: {n}')
+    print(f'Report: {report}')
+
+
+def quantize(protocol_name, experiment_dir, output_dir, dtype='int8'):
+
+    protocol = get_protocol(protocol_name, progress=False)
+    precomputed = Precomputed(experiment_dir)
+    quantized = Precomputed(output_dir,
+                            sliding_window=precomputed.sliding_window,
+                            dimension=precomputed.dimension,
+                            labels=precomputed.labels,
+                            dtype=dtype)
+
+    files = []
+    for current_file in FileFinder.protocol_file_iter(protocol):
+        try:
+            precomputed.shape(current_file)
+        except FileNotFoundError as e:
+            uri = get_unique_identifier(current_file)
+            print(f'No precomputed features for "{uri}".')
+            continue
+        files.append(current_file)
+
+    # int8 quantization range is calibrated on the whole protocol
+    if dtype == 'int8':
+        ranges = []
+        for current_file in files:
+            X = precomputed(current_file).data
+            if len(X) == 0:
                 continue
+            ranges.append(np.nanmin(X, axis=0))
+            ranges.append(np.nanmax(X, axis=0))
+        quantized.calibrate(np.vstack(ranges))
+
+    n_values, n_frames, n_agree = 0, 0, 0
+    signal, noise, max_error = 0., 0., 0.
+    original_bytes, quantized_bytes = 0, 0
 
-            if not np.isclose(duration,
-                              features.getExtent().duration,
-                              atol=1.):
-                uri = get_unique_identifier(current_file)
-                print('Duration mismatch for "{uri}"'.format(uri=uri))
+    for current_file in files:
 
-            if np.any(np.isnan(features.data)):
-                uri = get_unique_identifier(current_file)
-                print('NaN for "{uri}"'.format(uri=uri))
+        features = precomputed(current_file)
+        quantized.dump(current_file, features)
+
+        X = np.array(features.data, dtype=np.float64)
+        Y = np.array(quantized(current_file).data, dtype=np.float64)
+        error = np.abs(X - Y)
+
+        n_values += X.size
+        signal += np.sum(X ** 2)
+        noise += np.sum(error ** 2)
+        max_error = max(max_error, np.max(error, initial=0.))
+        original_bytes += features.data.nbytes
+        quantized_bytes += X.size * np.dtype(dtype).itemsize
+
+        if X.shape[1] > 1:
+            n_frames += len(X)
+            n_agree += np.sum(np.argmax(X, axis=1) == np.argmax(Y, axis=1))
+
+    print(f'Files: {len(files)}')
+    print(f'Size: {original_bytes} -> {quantized_bytes} bytes')
+    print(f'RMSE: {np.sqrt(noise / max(1, n_values)):g}')
+    print(f'Maximum absolute error: {max_error:g}')
+    print(f'SQNR: {10 * np.log10(signal / max(noise, 1e-30)):.1f} dB')
+    if n_frames > 0:
+        print(f'Argmax agreement: {100. * n_agree / n_frames:.2f}%')
+
+
+def helper_statistics(current_file):
+
+    try:
+        features = _worker['precomputed'](current_file)
+    except PyannoteFeatureExtractionError as e:
+        return str(e)
+
+    return FeatureStatistics().update(features)
+
+
+def statistics(protocol_name, experiment_dir, subset='train', n_jobs=None):
+
+    protocol = get_protocol(protocol_name, progress=False)
+
+    if n_jobs is None:
+        n_jobs = cpu_count()
+
+    files = getattr(protocol, subset)()
+
+    # statistics of each file are computed in parallel and merged in order
+    # of completion (merging is exact whatever the order)
+    total = FeatureStatistics()
+    n_files = 0
+    with Pool(n_jobs, initializer=init_precomputed_worker,
+              initargs=(experiment_dir, )) as pool:
+        for result in pool.imap_unordered(helper_statistics, files,
+                                          chunksize=8):
+            if isinstance(result, str):
+                print(result)
+                continue
+            total.merge(result)
+            n_files += 1
+
+    if total.count == 0:
+        print('No precomputed features were found.')
+        return
+
+    path = os.path.join(experiment_dir, STATISTICS_YML)
+    total.save(path)
+
+    print(f'Files: {n_files}')
+    print(f'Frames: {total.count}')
+    print(f'Statistics saved to {path}.')
 
 
 def main():
 
     arguments = docopt(__doc__, version='Feature extraction')
 
+    if arguments['shard']:
+        experiment_dir = arguments['<experiment_dir>']
+        shard_size = int(arguments['--shard-size'])
+        remove = arguments['--remove']
+        n_files = convert_to_shards(experiment_dir, shard_size=shard_size,
+                                    remove=remove)
+        print(f'Packed {n_files} files into shards.')
+        return
+
+    if arguments['quantize']:
+        quantize(arguments['<database.task.protocol>'],
+                 arguments['<experiment_dir>'],
+                 arguments['<output_dir>'],
+                 dtype=arguments['--dtype'])
+        return
+
+    if arguments['statistics']:
+        jobs = arguments['--jobs']
+        statistics(arguments['<database.task.protocol>'],
+                   arguments['<experiment_dir>'],
+                   subset=arguments['--subset'],
+                   n_jobs=None if jobs is None else int(jobs))
+        return
+
     db_yml = arguments['--database']
     file_finder = FileFinder(config_yml=db_yml)
 
@@ -254,9 +623,18 @@ def main():
     experiment_dir = arguments['<experiment_dir>']
 
     if arguments['check']:
-        check(protocol_name, file_finder, experiment_dir)
+        jobs = arguments['--jobs']
+        check(protocol_name, file_finder, experiment_dir,
+              n_jobs=None if jobs is None else int(jobs),
+              report=arguments['--report'])
     else:
         robust = arguments['--robust']
         parallel = arguments['--parallel']
+        jobs = arguments['--jobs']
+        chunksize = int(arguments['--chunksize'])
+        chunk = arguments['--chunk']
         extract(protocol_name, file_finder, experiment_dir,
-                robust=robust, parallel=parallel)
+                robust=robust, parallel=parallel,
+                n_jobs=None if jobs is None else int(jobs),
+                chunksize=chunksize,
+                chunk_duration=None if chunk is None else float(chunk))
@@ -457,7 +457,10 @@ class Multilabel(BaseLabeling):
 
         for current_file in files: 
             fX = sequence_labeling(current_file)
-            precomputed.dump(current_file, fX)
+            precomputed.dump_async(current_file, fX)
+
+        # wait for all features to be written
+        precomputed.flush()
 
 
 def main():
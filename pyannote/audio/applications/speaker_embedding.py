@@ -561,7 +561,10 @@ class SpeakerEmbedding(Application):
         for current_file in files:
 
             fX = sequence_embedding(current_file)
-            precomputed.dump(current_file, fX)
+            precomputed.dump_async(current_file, fX)
+
+        # wait for all features to be written
+        precomputed.flush()
 
 def main():
 
@@ -31,5 +31,8 @@
 """
 
 from .base import NoAugmentation
+from .base import Compose
 from .noise import AddNoise
 from .noise import AddNoiseFromGaps
+from .bank import NoiseBank
+from .reverb import AddReverb
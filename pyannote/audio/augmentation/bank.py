@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2018 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+# Preloaded noise
+"""
+
+import os
+import fcntl
+import threading
+from pathlib import Path
+import numpy as np
+from numpy.lib.format import open_memmap
+from pyannote.audio.features.utils import RawAudio
+from pyannote.audio.util import mkdir_p
+
+
+class NoiseBank(object):
+    """Noise waveforms, preloaded into one memory-mapped file
+
+    Noise waveforms (whole files or parts of files) are read, resampled and
+    RMS-normalized once and for all, and concatenated into one single file.
+    This file is memory-mapped by every process, so that noise is drawn
+    without any file access nor resampling (and shared through the page
+    cache rather than copied into each process).
+
+    Parameters
+    ----------
+    root_dir : str
+        Path to bank directory. A bank is created on first use (see `build`)
+        and reused afterwards: use one directory per noise configuration.
+    sample_rate : int
+        Sample rate.
+
+    Usage
+    -----
+    >>> bank = NoiseBank('/path/to/bank', 16000)
+    >>> if not bank.exists():
+    ...     bank.build(pieces)
+    >>> noise = bank.draw(n_samples)
+    """
+
+    def __init__(self, root_dir, sample_rate):
+        super().__init__()
+        self.root_dir = Path(root_dir).expanduser().resolve(strict=False)
+        self.sample_rate = sample_rate
+        self.pid_ = None
+
+    def _reset(self):
+        """(Re)initialize per-process state"""
+        self.pid_ = os.getpid()
+        self.data_ = np.load(self.root_dir / 'noise.npy', mmap_mode='r')
+        self.offsets_ = np.load(self.root_dir / 'offsets.npy')
+
+    def exists(self):
+        """Whether the bank has already been built"""
+        return (self.root_dir / 'noise.npy').exists()
+
+    def build(self, pieces):
+        """Build bank (unless another process did it already)
+
+        Parameters
+        ----------
+        pieces : iterable
+            (current_file, segment) tuples where `segment` is the
+            `pyannote.core.Segment` to use as noise, or None to use the whole
+            file. `current_file` must provide 'audio' or 'waveform' key.
+
+        Raises
+        ------
+        ValueError
+            When `pieces` do not provide any noise.
+        """
+
+        mkdir_p(self.root_dir)
+
+        with open(self.root_dir / '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            if self.exists():
+                return
+
+            raw_audio = RawAudio(sample_rate=self.sample_rate, mono=True)
+
+            # sample ranges of each piece (actual lengths are known without
+            # reading any audio, thanks to the audio metadata index)
+            ranges = []
+            for current_file, segment in pieces:
+                n_samples = raw_audio.get_n_samples(current_file)
+                if segment is None:
+                    start, end = 0, n_samples
+                else:
+                    (start, end), = raw_audio.sliding_window_.crop(
+                        segment, mode='center', fixed=segment.duration,
+                        return_ranges=True)
+                    start, end = max(0, start), min(end, n_samples)
+                if end > start:
+                    ranges.append((current_file, start, end))
+
+            if not ranges:
+                msg = (f'Cannot build noise bank in "{self.root_dir}": '
+                       f'no noise was provided (empty collection or no '
+                       f'non-empty segment).')
+                raise ValueError(msg)
+
+            lengths = [end - start for _, start, end in ranges]
+            offsets = np.cumsum([0] + lengths, dtype=np.int64)
+
+            # pieces are written one after the other
+            tmp = self.root_dir / \
+                f'noise.npy.{os.getpid()}.{threading.get_ident()}.tmp'
+            data = open_memmap(str(tmp), mode='w+', dtype=np.float32,
+                               shape=(int(offsets[-1]), ))
+            for (current_file, start, end), offset in zip(ranges, offsets):
+                y, _ = raw_audio._read(current_file, start, end)
+                y = y[:end - start, 0]
+                data[offset:offset + len(y)] = \
+                    y / (np.sqrt(np.mean(y ** 2)) + 1e-8)
+            data.flush()
+            del data
+
+            np.save(self.root_dir / 'offsets.npy', offsets)
+            os.replace(tmp, self.root_dir / 'noise.npy')
+
+    @property
+    def offsets(self):
+        """(n_pieces + 1, ) array of offsets of each piece in the bank"""
+        if self.pid_ != os.getpid():
+            self._reset()
+        return self.offsets_
+
+    def __len__(self):
+        """Total number of samples"""
+        if self.pid_ != os.getpid():
+            self._reset()
+        return len(self.data_)
+
+    def draw(self, n_samples, random_state=np.random):
+        """Draw noise at random
+
+        Noise starts at a random position (i.e. pieces are chosen with a
+        probability proportional to their duration) and wraps around the end
+        of the bank if needed.
+
+        Parameters
+        ----------
+        n_samples : int
+            Number of samples.
+        random_state : `np.random.RandomState`, optional
+            Defaults to `np.random`.
+
+        Returns
+        -------
+        noise : (n_samples, 1) `np.ndarray`
+            Noise.
+        """
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        start = random_state.randint(len(self.data_))
+        if start + n_samples <= len(self.data_):
+            noise = np.array(self.data_[start:start + n_samples])
+        else:
+            noise = np.take(self.data_, np.arange(start, start + n_samples),
+                            mode='wrap')
+        return noise[:, np.newaxis]
@@ -27,9 +27,62 @@
 # Hervé BREDIN - http://herve.niderb.fr
 
 
+import numpy as np
+
+
 class Augmentation(object):
 
-    def __call__(self, waveform, sample_rate):
+    def __call__(self, waveform, sample_rate, epoch=None):
         return waveform
 
+    def apply_batch(self, waveforms, sample_rate, epoch=None):
+        """Augment a whole batch of waveforms
+
+        Defaults to augmenting waveforms one by one. Subclasses may provide
+        a vectorized implementation.
+
+        Parameters
+        ----------
+        waveforms : `np.ndarray`
+            (batch_size, n_samples, n_channels) waveforms.
+        sample_rate : `int`
+            Sample rate.
+
+        Returns
+        -------
+        augmented : `np.ndarray`
+            (batch_size, n_samples, n_channels) augmented waveforms.
+        """
+        return np.stack([self(waveform, sample_rate, epoch=epoch)
+                         for waveform in waveforms])
+
 NoAugmentation = Augmentation
+
+
+class Compose(Augmentation):
+    """Apply several augmentations, one after the other
+
+    Parameters
+    ----------
+    augmentations : list of `Augmentation`
+        Augmentations, in order of application.
+
+    Usage
+    -----
+    >>> augmentation = Compose([AddReverb(collection), AddNoise()])
+    """
+
+    def __init__(self, augmentations):
+        super().__init__()
+        self.augmentations = list(augmentations)
+
+    def __call__(self, waveform, sample_rate, epoch=None):
+        for augmentation in self.augmentations:
+            waveform = augmentation(waveform, sample_rate, epoch=epoch)
+        return waveform
+
+    def apply_batch(self, waveforms, sample_rate, epoch=None):
+        for augmentation in self.augmentations:
+            waveforms = augmentation.apply_batch(waveforms, sample_rate,
+                                                 epoch=epoch)
+        return waveforms
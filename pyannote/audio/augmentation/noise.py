@@ -31,22 +31,87 @@
 """
 
 
+import os
 import numpy as np
 from pyannote.core import Segment
 from pyannote.audio.features.utils import RawAudio
 from pyannote.audio.features.utils import get_audio_duration
+from pyannote.audio.features.metadata import AUDIO_METADATA
 from pyannote.generators.fragment import random_subsegment
-from pyannote.generators.fragment import random_segment
 from pyannote.database import get_protocol
 from pyannote.database import get_annotated
 from pyannote.database import FileFinder
 from .base import Augmentation
+from .bank import NoiseBank
 
 
 normalize = lambda wav: wav / (np.sqrt(np.mean(wav ** 2)) + 1e-8)
 
 
-class AddNoise(Augmentation):
+class _NoiseAugmentation(Augmentation):
+    """Base class for additive noise data augmentation
+
+    Takes care of (scheduled) signal-to-noise ratio and of noise banks.
+    Subclasses provide the noise itself (see `_pieces`).
+
+    Parameters
+    ----------
+    db_yml : str, optional
+        Path to `pyannote.database` configuration file.
+    snr_min, snr_max : int, optional
+        Defines Signal-to-Noise Ratio (SNR) range in dB. Defaults to [5, 20].
+    noise_bank : str, optional
+        Noise bank directory. Defaults to not using any noise bank.
+    """
+
+    def __init__(self, db_yml=None, snr_min=5, snr_max=20,
+                 max_epoch=None, scheduler=None, noise_bank=None):
+        super().__init__()
+
+        self.db_yml = db_yml
+        self.snr_min = snr_min
+        self.snr_max = snr_max
+        self.scheduler = scheduler
+        self.max_epoch = max_epoch
+        self.noise_bank = noise_bank
+        self.banks_ = dict()
+
+    def _pieces(self):
+        """Noise used to build noise bank
+
+        Returns
+        -------
+        pieces : iterable
+            (current_file, segment) tuples. See `NoiseBank.build`.
+        """
+        raise NotImplementedError()
+
+    def get_bank(self, sample_rate):
+        """Get noise bank (built on first use)"""
+
+        bank = self.banks_.get(sample_rate, None)
+        if bank is None:
+            bank = NoiseBank(os.path.join(self.noise_bank, str(sample_rate)),
+                             sample_rate)
+            if not bank.exists():
+                bank.build(self._pieces())
+            self.banks_[sample_rate] = bank
+        return bank
+
+    def _add(self, original, noise, epoch=None):
+        """Add noise with random (scheduled) signal-to-noise ratio"""
+
+        power = np.random.random_sample()
+        if self.scheduler == "Linear" and self.max_epoch is not None:
+            power = min(epoch, self.max_epoch)/self.max_epoch * power
+
+        snr = (self.snr_max - self.snr_min) * power + self.snr_min
+        alpha = np.exp(-np.log(10) * snr / 20)
+
+        return normalize(original) + alpha * noise
+
+
+class AddNoise(_NoiseAugmentation):
     """Additive noise data augmentation
 
     Parameters
@@ -60,31 +125,42 @@ class AddNoise(Augmentation):
         See `pyannote.database.FileFinder` for more details.
     snr_min, snr_max : int, optional
         Defines Signal-to-Noise Ratio (SNR) range in dB. Defaults to [5, 20].
+    noise_bank : str, optional
+        When provided, noise files are preloaded (once per sample rate) into
+        a `NoiseBank` in this directory, from which noise is drawn without
+        any file access. Noise files are then selected with a probability
+        proportional to their duration. Defaults to reading noise files on
+        every call.
     """
 
-    def __init__(self, collection=None, db_yml=None, snr_min=5, snr_max=20, max_epoch=None, scheduler=None):
-        super().__init__()
+    def __init__(self, collection=None, db_yml=None, snr_min=5, snr_max=20,
+                 max_epoch=None, scheduler=None, noise_bank=None):
+        super().__init__(db_yml=db_yml, snr_min=snr_min, snr_max=snr_max,
+                         max_epoch=max_epoch, scheduler=scheduler,
+                         noise_bank=noise_bank)
 
         if collection is None:
             collection = 'MUSAN.Collection.BackgroundNoise'
         if not isinstance(collection, (list, tuple)):
             collection = [collection]
         self.collection = collection
-        self.db_yml = db_yml
-
-        self.snr_min = snr_min
-        self.snr_max = snr_max
-        self.scheduler = scheduler
-        self.max_epoch = max_epoch
 
         # load noise database
         self.files_ = []
-        preprocessors = {'audio': FileFinder(config_yml=db_yml),
-                         'duration': get_audio_duration}
+        preprocessors = {'audio': FileFinder(config_yml=db_yml)}
         for collection in self.collection:
             protocol = get_protocol(collection, preprocessors=preprocessors)
             self.files_.extend(protocol.files())
 
+        # read audio headers in parallel (and only once, thanks to the index)
+        AUDIO_METADATA.populate(f['audio'] for f in self.files_)
+        for current_file in self.files_:
+            current_file['duration'] = get_audio_duration(current_file)
+
+    def _pieces(self):
+        """Noise used to build noise bank"""
+        return ((current_file, None) for current_file in self.files_)
+
     def __call__(self, original, sample_rate, epoch=None):
         """Augment original waveform
 
@@ -101,6 +177,10 @@ class AddNoise(Augmentation):
             (n_samples, n_channels) noise-augmented waveform.
         """
 
+        if self.noise_bank is not None:
+            noise = self.get_bank(sample_rate).draw(len(original))
+            return self._add(original, noise, epoch=epoch)
+
         raw_audio = RawAudio(sample_rate=sample_rate, mono=True)
 
         original_duration = len(original) / sample_rate
@@ -133,23 +213,18 @@ class AddNoise(Augmentation):
         # FIXME: use fade-in between concatenated noises
         noise = np.vstack(noises)
 
-        power = np.random.random_sample()
-        if self.scheduler == "Linear" and self.max_epoch is not None:
-            power = min(epoch, self.max_epoch)/self.max_epoch * power
-
-        snr = (self.snr_max - self.snr_min) * power + self.snr_min
-        alpha = np.exp(-np.log(10) * snr / 20)
+        return self._add(original, noise, epoch=epoch)
 
-        return normalize(original) + alpha * noise
 
-
-class AddNoiseFromGaps(Augmentation):
+class AddNoiseFromGaps(_NoiseAugmentation):
     """Additive noise data augmentation.
 
     While AddNoise assumes that files contain only noise, this class uses
     non-speech regions (= gaps) as noise. This is expected to generate more
     realistic noises.
 
+    Gaps are selected with a probability proportional to their duration.
+
     Parameters
     ----------
     protocol : `str`
@@ -161,6 +236,10 @@ class AddNoiseFromGaps(Augmentation):
         See `pyannote.database.FileFinder` for more details.
     snr_min, snr_max : int, optional
         Defines Signal-to-Noise Ratio (SNR) range in dB. Defaults to [5, 20].
+    noise_bank : str, optional
+        When provided, gaps are preloaded (once per sample rate) into a
+        `NoiseBank` in this directory, from which noise is drawn without any
+        file access. Defaults to reading gaps on every call.
 
     See also
     --------
@@ -168,17 +247,14 @@ class AddNoiseFromGaps(Augmentation):
     """
 
     def __init__(self, protocol=None, subset='train', db_yml=None,
-                 snr_min=5, snr_max=20, max_epoch=None, scheduler=None):
-        super().__init__()
+                 snr_min=5, snr_max=20, max_epoch=None, scheduler=None,
+                 noise_bank=None):
+        super().__init__(db_yml=db_yml, snr_min=snr_min, snr_max=snr_max,
+                         max_epoch=max_epoch, scheduler=scheduler,
+                         noise_bank=noise_bank)
 
         self.protocol = protocol
         self.subset = subset
-        self.db_yml = db_yml
-
-        self.snr_min = snr_min
-        self.snr_max = snr_max
-        self.scheduler = scheduler
-        self.max_epoch = max_epoch
 
         # returns gaps in annotation as pyannote.core.Timeline instance
         get_gaps = lambda f: f['annotation'].get_timeline().gaps(
@@ -186,14 +262,63 @@ class AddNoiseFromGaps(Augmentation):
 
         preprocessors = {
             'audio': FileFinder(config_yml=db_yml),
-            'duration': get_audio_duration,
             'gaps': get_gaps}
 
         protocol = get_protocol(self.protocol,
                                 preprocessors=preprocessors)
-        self.files_ = list(getattr(protocol, self.subset)())
-        # Filter files that don't have any silence
-        self.files_ = [f for f in self.files_ if f['gaps']]
+
+        # flat index of all gaps: gap #i is [start[i], end[i]] of file #file[i]
+        # only what is needed to read audio is kept from each file (not its
+        # annotation), and files that don't have any silence are skipped.
+        starts, ends, indices = [], [], []
+        self.files_ = []
+        for current_file in getattr(protocol, self.subset)():
+            gaps = current_file['gaps']
+            if not gaps:
+                continue
+            for gap in gaps:
+                starts.append(gap.start)
+                ends.append(gap.end)
+                indices.append(len(self.files_))
+            self.files_.append({key: current_file[key]
+                                for key in ['database', 'uri', 'audio',
+                                            'channel']
+                                if key in current_file})
+
+        self.gap_start_ = np.array(starts, dtype=np.float64)
+        self.gap_end_ = np.array(ends, dtype=np.float64)
+        self.gap_file_ = np.array(indices, dtype=np.int32)
+
+        # gap #i covers [cum_duration[i], cum_duration[i + 1][ of the
+        # concatenation of all gaps
+        self.cum_duration_ = np.cumsum(np.hstack(
+            [[0.], self.gap_end_ - self.gap_start_]))
+
+        # read audio headers in parallel (and only once, thanks to the index)
+        AUDIO_METADATA.populate(f['audio'] for f in self.files_)
+
+    def random_gap(self):
+        """Draw gap at random, with probability proportional to its duration
+
+        Returns
+        -------
+        current_file : dict
+            File the gap belongs to.
+        gap : `pyannote.core.Segment`
+            Gap.
+        """
+        i = np.searchsorted(self.cum_duration_,
+                            np.random.random_sample() * self.cum_duration_[-1],
+                            side='right') - 1
+        i = min(i, len(self.gap_file_) - 1)
+        return (self.files_[self.gap_file_[i]],
+                Segment(self.gap_start_[i], self.gap_end_[i]))
+
+    def _pieces(self):
+        """Noise used to build noise bank"""
+        return ((self.files_[f], Segment(start, end))
+                for start, end, f in zip(self.gap_start_, self.gap_end_,
+                                         self.gap_file_))
 
     def __call__(self, original, sample_rate, epoch=None):
         """Augment original waveform
@@ -211,6 +336,10 @@ class AddNoiseFromGaps(Augmentation):
             (n_samples, n_channels) noise-augmented waveform.
         """
 
+        if self.noise_bank is not None:
+            noise = self.get_bank(sample_rate).draw(len(original))
+            return self._add(original, noise, epoch=epoch)
+
         raw_audio = RawAudio(sample_rate=sample_rate, mono=True)
 
         # accumulate enough noise to cover duration of original waveform
@@ -218,11 +347,8 @@ class AddNoiseFromGaps(Augmentation):
         len_left = len(original)
         while len_left > 0:
 
-            # select noise file at random
-            file = np.random.choice(self.files_)
-
             # select noise segment at random
-            segment = next(random_segment(file['gaps'], weighted=False))
+            file, segment = self.random_gap()
             duration = segment.duration
             segment_len = duration * sample_rate
 
@@ -244,11 +370,4 @@ class AddNoiseFromGaps(Augmentation):
         # FIXME: use fade-in between concatenated noises
         noise = np.vstack(noises)
 
-        power = np.random.random_sample()
-        if self.scheduler == "Linear" and self.max_epoch is not None:
-            power = min(epoch, self.max_epoch) / self.max_epoch * power
-
-        snr = (self.snr_max - self.snr_min) * power + self.snr_min
-        alpha = np.exp(-np.log(10) * snr / 20)
-
-        return normalize(original) + alpha * noise
+        return self._add(original, noise, epoch=epoch)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2019 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+# Reverberation-based data augmentation
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy.fftpack import next_fast_len
+from pyannote.audio.features.utils import RawAudio
+from pyannote.database import get_protocol
+from pyannote.database import FileFinder
+from .base import Augmentation
+
+
+# overlap-save blocks are (at least) that many times longer than filters
+OVERLAP_SAVE_RATIO = 4
+
+
+def fft_convolve(x, h):
+    """Batched FFT convolution, truncated to the length of the input
+
+    Short inputs are convolved with one single FFT. Inputs much longer than
+    filters are convolved by blocks (overlap-save).
+
+    Parameters
+    ----------
+    x : (batch_size, n_samples) `np.ndarray`
+        Inputs.
+    h : (batch_size, n_taps) `np.ndarray`
+        Filters (e.g. room impulse responses).
+
+    Returns
+    -------
+    y : (batch_size, n_samples) `np.ndarray`
+        y[b] = np.convolve(x[b], h[b])[:n_samples]
+    """
+
+    batch_size, n_samples = x.shape
+    n_taps = h.shape[1]
+
+    n_fft = next_fast_len(n_samples + n_taps - 1)
+    block = next_fast_len(OVERLAP_SAVE_RATIO * n_taps)
+
+    if n_fft <= block:
+        y = np.fft.irfft(np.fft.rfft(x, n_fft) * np.fft.rfft(h, n_fft), n_fft)
+        return y[:, :n_samples]
+
+    # each block of `block` samples gives `hop` valid output samples
+    hop = block - n_taps + 1
+    n_blocks = -(-n_samples // hop)
+    padded = np.zeros((batch_size, n_taps - 1 + n_blocks * hop),
+                      dtype=x.dtype)
+    padded[:, n_taps - 1:n_taps - 1 + n_samples] = x
+    blocks = as_strided(padded, shape=(batch_size, n_blocks, block),
+                        strides=(padded.strides[0], hop * padded.strides[1],
+                                 padded.strides[1]))
+
+    H = np.fft.rfft(h, block)[:, np.newaxis, :]
+    y = np.fft.irfft(np.fft.rfft(blocks, block) * H, block)[:, :, n_taps - 1:]
+    return y.reshape(batch_size, -1)[:, :n_samples]
+
+
+class AddReverb(Augmentation):
+    """Reverberation data augmentation
+
+    Waveforms are convolved (in the frequency domain) with room impulse
+    responses drawn at random. Room impulse responses are loaded (and
+    resampled) once per sample rate, shifted to start at their direct path
+    (so that reverberated waveforms are not delayed) and normalized to unit
+    energy. Reverberated waveforms keep the energy of original waveforms.
+
+    Parameters
+    ----------
+    collection : str or list of str
+        `pyannote.database` collection(s) of room impulse responses.
+    db_yml : str, optional
+        Path to `pyannote.database` configuration file.
+        See `pyannote.database.FileFinder` for more details.
+    files : list of dict, optional
+        Room impulse responses, provided as `pyannote.database` files (with
+        an 'audio' key). Used instead of `collection`. One of `collection`
+        and `files` must be provided.
+
+    Usage
+    -----
+    >>> reverb = AddReverb(collection)
+    >>> augmented = reverb(waveform, sample_rate)
+    >>> # vectorized, for a whole batch of waveforms
+    >>> augmented = reverb.apply_batch(waveforms, sample_rate)
+    >>> # reverberation, followed by additive noise
+    >>> augmentation = Compose([AddReverb(collection), AddNoise()])
+
+    See also
+    --------
+    `AddNoise`, `Compose`
+    """
+
+    def __init__(self, collection=None, db_yml=None, files=None):
+        super().__init__()
+
+        if collection is None and files is None:
+            msg = ('AddReverb needs room impulse responses: provide either '
+                   'a `collection` or a list of `files`.')
+            raise ValueError(msg)
+
+        if files is None:
+            if not isinstance(collection, (list, tuple)):
+                collection = [collection]
+            files = []
+            preprocessors = {'audio': FileFinder(config_yml=db_yml)}
+            for name in collection:
+                protocol = get_protocol(name, preprocessors=preprocessors)
+                files.extend(protocol.files())
+
+        self.collection = collection
+        self.db_yml = db_yml
+        self.files_ = list(files)
+        self.rirs_ = dict()
+
+    def get_rirs(self, sample_rate):
+        """Get room impulse responses (loaded once per sample rate)
+
+        Returns
+        -------
+        rirs : list of (n_taps, ) `np.ndarray`
+            Room impulse responses.
+        """
+
+        rirs = self.rirs_.get(sample_rate, None)
+        if rirs is not None:
+            return rirs
+
+        raw_audio = RawAudio(sample_rate=sample_rate, mono=True)
+        rirs = []
+        for current_file in self.files_:
+            h = raw_audio(current_file).data[:, 0]
+            # start at direct path
+            h = h[np.argmax(np.abs(h)):]
+            rirs.append(np.array(h / (np.sqrt(np.sum(h ** 2)) + 1e-8),
+                                 dtype=np.float32))
+
+        self.rirs_[sample_rate] = rirs
+        return rirs
+
+    def __call__(self, original, sample_rate, epoch=None):
+        """Augment original waveform
+
+        Parameters
+        ----------
+        original : `np.ndarray`
+            (n_samples, n_channels) waveform.
+        sample_rate : `int`
+            Sample rate.
+
+        Returns
+        -------
+        augmented : `np.ndarray`
+            (n_samples, n_channels) reverberated waveform.
+        """
+        return self.apply_batch(original[np.newaxis], sample_rate,
+                                epoch=epoch)[0]
+
+    def apply_batch(self, waveforms, sample_rate, epoch=None):
+        """Augment a whole batch of waveforms at once
+
+        Parameters
+        ----------
+        waveforms : `np.ndarray`
+            (batch_size, n_samples, n_channels) waveforms.
+        sample_rate : `int`
+            Sample rate.
+
+        Returns
+        -------
+        augmented : `np.ndarray`
+            (batch_size, n_samples, n_channels) reverberated waveforms.
+        """
+
+        batch_size, n_samples, n_channels = waveforms.shape
+
+        # one room impulse response per waveform, zero-padded to the same
+        # number of taps
+        rirs = self.get_rirs(sample_rate)
+        chosen = [rirs[i] for i in np.random.randint(len(rirs),
+                                                     size=batch_size)]
+        h = np.zeros((batch_size, max(len(rir) for rir in chosen)),
+                     dtype=np.float32)
+        for b, rir in enumerate(chosen):
+            h[b, :len(rir)] = rir
+
+        # all channels of a waveform go through the same room
+        x = waveforms.transpose(0, 2, 1).reshape(-1, n_samples)
+        y = fft_convolve(x, np.repeat(h, n_channels, axis=0))
+
+        # keep original energy
+        y *= np.sqrt(np.sum(x ** 2, axis=1, keepdims=True) /
+                     (np.sum(y ** 2, axis=1, keepdims=True) + 1e-8))
+
+        y = y.reshape(batch_size, n_channels, n_samples).transpose(0, 2, 1)
+        return y.astype(waveforms.dtype)
@@ -56,8 +56,10 @@ class Classification(EmbeddingApproach):
         Defaults to 0 (i.e. keep them all).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
     """
 
     # TODO. add option to **not** use bias in classification layer
@@ -68,7 +70,7 @@ class Classification(EmbeddingApproach):
 
     def __init__(self, duration=None, min_duration=None, max_duration=None,
                  per_label=1, per_fold=32, per_epoch=7, parallel=1,
-                 label_min_duration=0.):
+                 prefetch=16, prefetch_bytes=None, label_min_duration=0.):
         super().__init__()
 
         self.per_label = per_label
@@ -81,6 +83,8 @@ class Classification(EmbeddingApproach):
         self.max_duration = max_duration
 
         self.parallel = parallel
+        self.prefetch = prefetch
+        self.prefetch_bytes = prefetch_bytes
 
         self.logsoftmax_ = nn.LogSoftmax(dim=1)
         self.loss_ = nn.NLLLoss()
@@ -162,7 +166,8 @@ class Classification(EmbeddingApproach):
             per_label=self.per_label, per_fold=self.per_fold,
             per_epoch=self.per_epoch, duration=self.duration,
             min_duration=self.min_duration, max_duration=self.max_duration,
-            parallel=self.parallel)
+            parallel=self.parallel, prefetch=self.prefetch,
+            prefetch_bytes=self.prefetch_bytes)
 
     def batch_loss(self, batch):
         """Compute loss for current `batch`
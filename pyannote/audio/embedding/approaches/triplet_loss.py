@@ -71,8 +71,10 @@ class TripletLoss(EmbeddingApproach):
         Number of days per epoch. Defaults to 7 (a week).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
 
     Notes
     -----
@@ -90,7 +92,8 @@ class TripletLoss(EmbeddingApproach):
     def __init__(self, duration=None, min_duration=None, max_duration=None,
                  metric='cosine', margin=0.2, clamp='positive',
                  sampling='all', per_label=3, per_fold=None, per_epoch=7,
-                 parallel=1, label_min_duration=0.):
+                 parallel=1, prefetch=16, prefetch_bytes=None,
+                 label_min_duration=0.):
 
         super().__init__()
 
@@ -119,6 +122,8 @@ class TripletLoss(EmbeddingApproach):
         self.max_duration = max_duration
 
         self.parallel = parallel
+        self.prefetch = prefetch
+        self.prefetch_bytes = prefetch_bytes
 
 
     def batch_easy(self, y, distances):
@@ -336,7 +341,8 @@ class TripletLoss(EmbeddingApproach):
             per_label=self.per_label, per_fold=self.per_fold,
             per_epoch=self.per_epoch, duration=self.duration,
             min_duration=self.min_duration, max_duration=self.max_duration,
-            parallel=self.parallel)
+            parallel=self.parallel, prefetch=self.prefetch,
+            prefetch_bytes=self.prefetch_bytes)
 
     def batch_loss(self, batch):
         """Compute loss for current `batch`
@@ -31,6 +31,7 @@ import numpy as np
 from pyannote.generators.fragment import random_segment
 from pyannote.generators.fragment import random_subsegment
 from pyannote.generators.batch import batchify
+from pyannote.audio.train.prefetch import BoundedPrefetch
 from ..models import TASK_REPRESENTATION_LEARNING
 
 
@@ -61,14 +62,17 @@ class SpeechSegmentGenerator(object):
         In case `duration` is None, set segment maximum duration.
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
     """
 
     def __init__(self, feature_extraction, protocol, subset='train',
                  per_label=3, per_fold=None, per_epoch=7,
                  duration=None, min_duration=None, max_duration=None,
-                 label_min_duration=0., parallel=1):
+                 label_min_duration=0., parallel=1, prefetch=16,
+                 prefetch_bytes=None):
 
         super(SpeechSegmentGenerator, self).__init__()
 
@@ -78,6 +82,8 @@ class SpeechSegmentGenerator(object):
         self.per_epoch = per_epoch
         self.duration = duration
         self.parallel = parallel
+        self.prefetch = prefetch
+        self.prefetch_bytes = prefetch_bytes
         self.label_min_duration = label_min_duration
 
         if self.duration is None:
@@ -92,6 +98,9 @@ class SpeechSegmentGenerator(object):
 
         self.weighted_ = True
 
+        # Iteration counter
+        self.iteration = 0
+
         self._load_metadata(protocol, subset=subset)
 
     def _load_metadata(self, protocol, subset='train'):
@@ -153,6 +162,21 @@ class SpeechSegmentGenerator(object):
 
     def generator(self):
 
+        # number of sequences after which `iteration` is incremented
+        nb_sequences_per_epoch = self.batches_per_epoch * self.batch_size
+
+        i = 0
+        for sample in self._samples():
+            yield sample
+
+            # Update counters
+            i = i + 1
+            if (i % nb_sequences_per_epoch) == 0:
+                self.iteration = self.iteration + 1
+                i = 0
+
+    def _samples(self):
+
         labels = list(self.data_)
 
         while True:
@@ -174,6 +198,30 @@ class SpeechSegmentGenerator(object):
                 chosen = np.random.choice(len(files), size=self.per_label,
                                           p=probabilities)
 
+                y = self.segment_labels_.index(label)
+
+                if self.duration is not None:
+
+                    # choose one segment at random with probability
+                    # proportional to duration, and sub-segment at random at
+                    # exactly duration
+                    sub_segments = dict()
+                    for i in chosen:
+                        segment = next(random_segment(
+                            segments[i], weighted=self.weighted_))
+                        sub_segments.setdefault(i, []).append(next(
+                            random_subsegment(segment, self.duration)))
+
+                    # sub-segments of the same file are cropped at once
+                    for i, file_sub_segments in sub_segments.items():
+                        X = self.feature_extraction.crop_many(
+                            files[i], file_sub_segments, mode='center',
+                            fixed=self.duration)
+                        for x in X:
+                            yield {'X': x, 'y': y}
+
+                    continue
+
                 # loop on (randomly) chosen files
                 for i in chosen:
 
@@ -183,57 +231,45 @@ class SpeechSegmentGenerator(object):
                     segment = next(
                         random_segment(segments[i], weighted=self.weighted_))
 
-                    if self.duration is None:
-
-                        if self.min_duration is None:
-
-                            # case: no duration | no min | no max
-                            # keep segment as it is
-                            if self.max_duration is None:
-                                sub_segment = segment
-
-                            # case: no duration | no min | max
-                            else:
-
-                                # if segment is too long, choose sub-segment
-                                # at random at exactly max_duration
-                                if segment.duration > self.max_duration:
-                                    sub_segment = next(random_subsegment(
-                                        segment, self.max_duration))
+                    if self.min_duration is None:
 
-                                # otherwise, keep segment as it is
-                                else:
-                                    sub_segment = segment
+                        # case: no duration | no min | no max
+                        # keep segment as it is
+                        if self.max_duration is None:
+                            sub_segment = segment
 
+                        # case: no duration | no min | max
                         else:
-                            # case: no duration | min | no max
-                            # keep segment as it is (too short segments have
-                            # already been filtered out)
-                            if self.max_duration is None:
-                                sub_segment = segment
 
-                            # case: no duration | min | max
-                            else:
-                                # choose sub-segment at random between
-                                # min_duration and max_duration
+                            # if segment is too long, choose sub-segment
+                            # at random at exactly max_duration
+                            if segment.duration > self.max_duration:
                                 sub_segment = next(random_subsegment(
-                                    segment, self.max_duration,
-                                    min_duration=self.min_duration))
+                                    segment, self.max_duration))
 
-                        X = self.feature_extraction.crop(
-                            files[i], sub_segment, mode='center')
+                            # otherwise, keep segment as it is
+                            else:
+                                sub_segment = segment
 
                     else:
+                        # case: no duration | min | no max
+                        # keep segment as it is (too short segments have
+                        # already been filtered out)
+                        if self.max_duration is None:
+                            sub_segment = segment
 
-                        # choose sub-segment at random at exactly duration
-                        sub_segment = next(random_subsegment(
-                            segment, self.duration))
+                        # case: no duration | min | max
+                        else:
+                            # choose sub-segment at random between
+                            # min_duration and max_duration
+                            sub_segment = next(random_subsegment(
+                                segment, self.max_duration,
+                                min_duration=self.min_duration))
 
-                        X = self.feature_extraction.crop(
-                            files[i], sub_segment, mode='center',
-                            fixed=self.duration)
+                    X = self.feature_extraction.crop(
+                        files[i], sub_segment, mode='center')
 
-                    yield {'X': X, 'y': self.segment_labels_.index(label)}
+                    yield {'X': X, 'y': y}
 
     @property
     def batch_size(self):
@@ -261,10 +297,34 @@ class SpeechSegmentGenerator(object):
         # number of batches per epoch
         return int(np.ceil(duration_per_epoch / duration_per_batch))
 
+    def collate_X(self, X):
+        """Apply batch-level data augmentation (e.g. SpecAugment)
+
+        Sequences may have different durations: sequences with the same
+        number of frames are stacked and augmented together, and the batch is
+        returned as a list (in its original order).
+        """
+        augment_batch = getattr(self.feature_extraction, 'augment_batch', None)
+        if augment_batch is None:
+            return X
+
+        # group sequences by number of frames
+        groups = dict()
+        for i, x in enumerate(X):
+            groups.setdefault(len(x), []).append(i)
+
+        augmented = [None] * len(X)
+        for indices in groups.values():
+            A = augment_batch(np.stack([X[i] for i in indices]),
+                              epoch=self.iteration)
+            for i, a in zip(indices, A):
+                augmented[i] = a
+        return augmented
+
     @property
     def signature(self):
         return {
-            'X': {'@': (None, None)},
+            'X': {'@': (None, self.collate_X)},
             'y': {'@': (None, np.stack)},
         }
 
@@ -278,26 +338,17 @@ class SpeechSegmentGenerator(object):
 
     def __call__(self):
 
-        batch_size = self.batch_size
-        batches_per_epoch = self.batches_per_epoch
-
-        generators = []
         if self.parallel:
-
-            for i in range(self.parallel):
-                generator = self.generator()
-                batches = batchify(generator, self.signature,
-                                   batch_size=batch_size,
-                                   prefetch=batches_per_epoch)
-                generators.append(batches)
-        else:
-            generator = self.generator()
-            batches = batchify(generator, self.signature,
-                               batch_size=batch_size, prefetch=0)
-            generators.append(batches)
-
-        while True:
-            # get `batches_per_epoch` batches from each generator
-            for batches in generators:
-                for _ in range(batches_per_epoch):
-                    yield next(batches)
+            # background generators share one bounded prefetch buffer
+            self.prefetch_ = BoundedPrefetch(
+                [batchify(self.generator(), self.signature,
+                          batch_size=self.batch_size, prefetch=0)
+                 for _ in range(self.parallel)],
+                max_batches=self.prefetch, max_bytes=self.prefetch_bytes)
+            for batch in self.prefetch_:
+                yield batch
+
+        batches = batchify(self.generator(), self.signature,
+                           batch_size=self.batch_size, prefetch=0)
+        for batch in batches:
+            yield batch
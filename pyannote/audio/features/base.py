@@ -28,10 +28,16 @@
 
 import warnings
 import inspect
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import numpy as np
 
 from .utils import RawAudio
 from .utils import get_audio_duration
+from .utils import coalesce_ranges
+from .cache import FeatureCache
+from .normalization import FeatureStatistics
 
 from pyannote.core import Segment
 from pyannote.core import SlidingWindow
@@ -42,6 +48,10 @@ from pyannote.database import get_unique_identifier
 from librosa.util import valid_audio
 from librosa.util.exceptions import ParameterError
 
+# chunked extraction: see `FeatureExtraction.iter_chunks`
+CHUNK_DURATION = 60.
+CHUNK_MARGIN = 1.
+
 
 class FeatureExtraction(object):
     """Base class for feature extraction
@@ -52,13 +62,29 @@ class FeatureExtraction(object):
         Data augmentation.
     sample_rate : int, optional
         Convert audio to use this sample rate.
+    cache_size : int, optional
+        When provided, features extracted by `crop` are cached in memory,
+        within this budget (in bytes). Caching is automatically bypassed when
+        data augmentation is active. Defaults to no caching.
+    cache_policy : {'lru', 'lfu'}, optional
+        Cache eviction policy. Defaults to 'lru' (least recently used).
+    cache_chunk : float, optional
+        Cache features by chunks of this duration (in seconds). Defaults to
+        caching features of whole files.
+    statistics : `FeatureStatistics` or `str`, optional
+        Corpus-level statistics (or path to "statistics.yml" file, see
+        "pyannote-speech-feature statistics") used to standardize features
+        with a single in-place affine transform. Defaults to no
+        standardization.
 
     See also
     --------
     `pyannote.audio.augmentation.AddNoise`
     """
 
-    def __init__(self, augmentation=None, sample_rate=None):
+    def __init__(self, augmentation=None, sample_rate=None,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 statistics=None):
         super().__init__()
         self.sample_rate = sample_rate
 
@@ -67,6 +93,18 @@ class FeatureExtraction(object):
             sample_rate=self.sample_rate, mono=True,
             augmentation=augmentation)
 
+        self.cache_chunk = cache_chunk
+        self.cache_ = None
+        if cache_size is not None:
+            self.cache_ = FeatureCache(cache_size, policy=cache_policy)
+
+        self.statistics = statistics
+        self.affine_ = None
+        if statistics is not None:
+            if not isinstance(statistics, FeatureStatistics):
+                statistics = FeatureStatistics.load(statistics)
+            self.affine_ = statistics.affine()
+
     def get_dimension(self):
         """Get dimension of feature vectors
 
@@ -84,6 +122,43 @@ class FeatureExtraction(object):
         """Dimension of feature vectors"""
         return self.get_dimension()
 
+    @property
+    def augmented(self):
+        """Whether features are (randomly) augmented"""
+        return self.raw_audio_.augmentation is not None
+
+    def cache_info(self):
+        """Get feature cache statistics (for the current process)
+
+        Returns
+        -------
+        info : dict or None
+            'hits', 'misses', 'size' and 'max_size' (in bytes) statistics.
+            None when caching is disabled.
+        """
+        if self.cache_ is None:
+            return None
+        return self.cache_.info()
+
+    def augment_batch(self, features, epoch=None):
+        """Apply batch-level data augmentation (e.g. SpecAugment)
+
+        Called by batch generators once features of a whole batch have been
+        collated. Defaults to no augmentation.
+
+        Parameters
+        ----------
+        features : (batch_size, n_frames, dimension) numpy array
+            Batch of features.
+        epoch : int, optional
+            Current epoch.
+
+        Returns
+        -------
+        augmented : (batch_size, n_frames, dimension) numpy array
+        """
+        return features
+
     def get_frame_info(self):
         """Get sliding window used for feature extraction
 
@@ -141,7 +216,7 @@ class FeatureExtraction(object):
         y, sample_rate = self.raw_audio_(current_file, return_sr=True)
 
         # compute features
-        features = self.get_features(y.data, sample_rate)
+        features = self._standardize(self.get_features(y.data, sample_rate))
 
         # basic quality check
         if np.any(np.isnan(features)):
@@ -152,6 +227,159 @@ class FeatureExtraction(object):
         # wrap features in a `SlidingWindowFeature` instance
         return SlidingWindowFeature(features, self.sliding_window)
 
+    def iter_chunks(self, current_file, chunk_duration=CHUNK_DURATION,
+                    context=None, n_jobs=1, backend='thread'):
+        """Extract features chunk by chunk
+
+        The waveform is split into chunks of `chunk_duration` seconds, each
+        padded with `context` on both sides. Chunks are extracted (in
+        parallel when `n_jobs` > 1) and context is trimmed afterwards.
+        Chunks start on frame boundaries, so that stitching them gives the
+        same features as `__call__` (up to floating point rounding) for
+        extractors whose frames only depend on samples within `context`.
+        Extractors relying on whole-file statistics differ: e.g.
+        `LibrosaMelSpectrogram` (decibels relative to the maximum) or
+        `LibrosaMFCC` (wherever log-mel energy is clipped 80dB below the
+        maximum, as happens in empty bands of upsampled audio). Data
+        augmentation, if any, is applied to each chunk independently.
+
+        Parameters
+        ----------
+        current_file : dict
+            `pyannote.database` file.
+        chunk_duration : float, optional
+            Chunk duration, in seconds. Defaults to 60s.
+        context : float, optional
+            Context added on both sides of each chunk, in seconds. Defaults
+            to `get_context_duration()` plus one second, which is enough for
+            frame-based features (e.g. MFCC and their derivatives).
+        n_jobs : int, optional
+            Number of chunks extracted in parallel. Defaults to 1.
+        backend : {'thread', 'process'}, optional
+            Whether to extract chunks in a thread pool (for extractors that
+            release the GIL) or in a process pool. Defaults to 'thread'.
+
+        Returns
+        -------
+        n_frames : int
+            Total number of frames.
+        chunks : iterator
+            Yields (start, features) tuples in chronological order, where
+            `features` is a (n_chunk_frames, dimension) numpy array
+            of features for frames #start to #start + n_chunk_frames - 1.
+
+        Usage
+        -----
+        >>> n_frames, chunks = feature_extraction.iter_chunks(current_file)
+        >>> precomputed.dump_chunks(current_file, n_frames, chunks)
+
+        See also
+        --------
+        `extract_chunked`
+        `pyannote.audio.features.Precomputed.dump_chunks`
+        """
+
+        if self.sample_rate is None:
+            msg = ('`FeatureExtraction` needs to be instantiated with an '
+                   'actual `sample_rate` to extract features by chunks.')
+            raise ValueError(msg)
+
+        frames = self.sliding_window
+        hop = int(round(frames.step * self.sample_rate))
+        if hop < 1 or not np.isclose(hop, frames.step * self.sample_rate):
+            msg = ('Chunked feature extraction requires frame step to be '
+                   'a whole number of samples.')
+            raise ValueError(msg)
+
+        if context is None:
+            context = self.get_context_duration() + CHUNK_MARGIN
+
+        # chunk #c is made of `n` frames, starting with frame #c x n.
+        # the last chunk also contains all remaining frames.
+        n = max(1, int(round(chunk_duration / frames.step)))
+        n_samples = self.raw_audio_.get_n_samples(current_file)
+        n_chunks = max(1, n_samples // (n * hop))
+        extract = functools.partial(
+            self._extract_chunk, current_file, n=n, hop=hop,
+            context=int(np.ceil(context * self.sample_rate / hop)),
+            n_samples=n_samples, n_chunks=n_chunks)
+
+        # extract last chunk first so that total number of frames is known
+        last = n_chunks - 1
+        last_features = extract(last)
+        n_frames = last * n + len(last_features)
+
+        def chunks():
+
+            if n_jobs > 1 and last > 0:
+                Executor = ThreadPoolExecutor if backend == 'thread' \
+                    else ProcessPoolExecutor
+                with Executor(max_workers=n_jobs) as executor:
+                    # bounded number of pending chunks
+                    pending = deque()
+                    for c in range(last):
+                        pending.append((c, executor.submit(extract, c)))
+                        if len(pending) >= 2 * n_jobs:
+                            c, future = pending.popleft()
+                            yield c * n, future.result()
+                    for c, future in pending:
+                        yield c * n, future.result()
+
+            else:
+                for c in range(last):
+                    yield c * n, extract(c)
+
+            yield last * n, last_features
+
+        return n_frames, chunks()
+
+    def _extract_chunk(self, current_file, c, n=None, hop=None, context=None,
+                       n_samples=None, n_chunks=None):
+        """Extract features of chunk #c (see `iter_chunks`)"""
+
+        is_last = c == n_chunks - 1
+
+        # first frame of chunk #c and its context
+        first = max(0, c * n - context)
+        start = first * hop
+        end = n_samples if is_last else (c * n + n + context) * hop
+
+        y, _ = self.raw_audio_._read(current_file, start, end)
+        segment = Segment(start / self.sample_rate, end / self.sample_rate)
+        y = self.raw_audio_._check_and_augment(current_file, segment, y)
+        features = self._get_features(y)
+
+        # get rid of context
+        offset = c * n - first
+        if is_last:
+            return features[offset:]
+        return features[offset:offset + n]
+
+    def extract_chunked(self, current_file, chunk_duration=CHUNK_DURATION,
+                        context=None, n_jobs=1, backend='thread'):
+        """Same as `__call__` but extracts features chunk by chunk
+
+        See `iter_chunks` for a description of parameters.
+
+        Returns
+        -------
+        features : `pyannote.core.SlidingWindowFeature`
+            Extracted features
+        """
+
+        n_frames, chunks = self.iter_chunks(
+            current_file, chunk_duration=chunk_duration, context=context,
+            n_jobs=n_jobs, backend=backend)
+
+        data = None
+        for start, features in chunks:
+            if data is None:
+                data = np.empty((n_frames, ) + features.shape[1:],
+                                dtype=features.dtype)
+            data[start:start + len(features)] = features
+
+        return SlidingWindowFeature(data, self.sliding_window)
+
     def get_context_duration(self):
         """
 
@@ -181,6 +409,12 @@ class FeatureExtraction(object):
         features : (n_frames, dimension) numpy array
             Extracted features
 
+        Notes
+        -----
+        When caching is enabled (see `cache_size`), features are cropped from
+        whole-file (or whole-chunk) features, as would `Precomputed.crop`.
+        This may result in a one-frame shift compared to non-cached `crop`.
+
         See also
         --------
         `pyannote.core.SlidingWindowFeature.crop`
@@ -192,8 +426,20 @@ class FeatureExtraction(object):
             msg = ('`FeatureExtraction.crop` method expects `current_file` to '
                    'contain a precomputed "duration" key.')
             raise ValueError(msg)
-        duration = current_file['duration']
 
+        # augmented features are not reusable: bypass cache
+        if self.cache_ is not None and not self.augmented:
+            return self._cached_crop(current_file, segment, mode=mode,
+                                     fixed=fixed)
+
+        return self._crop(current_file, segment, mode=mode, fixed=fixed,
+                          epoch=epoch)
+
+    def _crop(self, current_file, segment, mode='center', fixed=None,
+              epoch=None):
+        """Extract features from `segment` (and its context) only"""
+
+        duration = current_file['duration']
         context = self.get_context_duration()
 
         # extend segment on both sides with requested context
@@ -204,12 +450,81 @@ class FeatureExtraction(object):
         y = self.raw_audio_.crop(current_file, xsegment, mode='center',
                                  fixed=xsegment.duration, epoch=epoch)
 
+        features = self._get_features(y, epoch=epoch)
+
+        # get rid of additional context before returning
+        return self._trim(features, xsegment, segment, mode=mode, fixed=fixed)
+
+    def _cached_crop(self, current_file, segment, mode='center', fixed=None):
+        """Crop features from cached whole-file (or whole-chunk) features"""
+
+        uri = get_unique_identifier(current_file)
+        frames = self.sliding_window
+
+        if self.cache_chunk is None:
+            data = self.cache_(uri, lambda: self(current_file).data)
+            swf = SlidingWindowFeature(data, frames)
+            return swf.crop(segment, mode=mode, fixed=fixed)
+
+        # chunk #c contains frames #c x n to #(c + 1) x n - 1
+        n = frames.samples(self.cache_chunk, mode='center')
+        n_chunks = int(np.ceil(current_file['duration'] / (n * frames.step)))
+        (start, end), = frames.crop(segment, mode=mode, fixed=fixed,
+                                    return_ranges=True)
+        first = min(max(0, start // n), n_chunks - 1)
+        last = min(max(0, (end - 1) // n), n_chunks - 1)
+
+        data = np.vstack([
+            self.cache_((uri, c), lambda c=c: self._crop_chunk(
+                current_file, c, n, last=c == n_chunks - 1))
+            for c in range(first, last + 1)])
+
+        # sliding window whose first frame is the first frame of chunk #first
+        sliding_window = SlidingWindow(
+            start=frames.start + first * n * frames.step,
+            duration=frames.duration, step=frames.step)
+        swf = SlidingWindowFeature(data, sliding_window)
+        return swf.crop(segment, mode=mode, fixed=fixed)
+
+    def _crop_chunk(self, current_file, c, n, last=False):
+        """Extract features of chunk #c (made of `n` frames)"""
+
+        frames = self.sliding_window
+        start = frames[c * n].middle
+        if last:
+            segment = Segment(start, current_file['duration'])
+            return self._crop(current_file, segment, mode='center')
+
+        segment = Segment(start, start + n * frames.step)
+        return self._crop(current_file, segment, mode='center',
+                          fixed=segment.duration)
+
+    def _get_features(self, y, epoch=None):
+        """Extract features from waveform (passing `epoch` when supported)"""
         if "epoch" in inspect.signature(self.get_features).parameters:
             features = self.get_features(y, self.sample_rate, epoch)
         else:
             features = self.get_features(y, self.sample_rate)
+        return self._standardize(features)
+
+    def _standardize(self, features):
+        """Apply corpus-level standardization (in place, when possible)"""
+
+        if self.affine_ is None:
+            return features
+
+        scale, shift = self.affine_
+        if not features.flags.writeable or \
+           not np.can_cast(scale.dtype, features.dtype, casting='same_kind'):
+            return features * scale + shift
+
+        features *= scale
+        features += shift
+        return features
+
+    def _trim(self, features, xsegment, segment, mode='center', fixed=None):
+        """Extract `segment` features from features of (larger) `xsegment`"""
 
-        # get rid of additional context before returning
         frames = self.sliding_window
         shifted_frames = SlidingWindow(start=xsegment.start - frames.step,
                                        step=frames.step,
@@ -224,3 +539,89 @@ class FeatureExtraction(object):
             start = 0
 
         return features[start:end]
+
+    def crop_many(self, current_file, segments, mode='center', fixed=None,
+                  epoch=None):
+        """Batched version of `crop`
+
+        Segments are sorted and overlapping (or adjacent) segments (extended
+        with context) are read from disk at once. Features are then extracted
+        segment by segment from this shared waveform (and only once for
+        identical segments when no data augmentation is used), so that they
+        are the same as those returned by `crop`: extracting features of a
+        whole group at once would shift the frame grid and change frames
+        close to segment boundaries (padding, input-level normalization).
+
+        Parameters
+        ----------
+        current_file : dict
+            `pyannote.database` file. Must contain a 'duration' key that
+            provides the duration (in seconds) of the audio file.
+        segments : iterable of `pyannote.core.Segment`
+            Segments from which to extract features.
+        mode : {'loose', 'strict', 'center'}, optional
+            See `crop`. Defaults to 'center'.
+        fixed : float, optional
+            See `crop`. Should be provided to ensure that all feature
+            sequences have the same number of frames.
+
+        Returns
+        -------
+        features : (n_segments, n_frames, dimension) numpy array
+            Extracted features, in the same order as `segments`.
+
+        See also
+        --------
+        `FeatureExtraction.crop`
+        """
+
+        if 'duration' not in current_file:
+            msg = ('`FeatureExtraction.crop_many` method expects '
+                   '`current_file` to contain a precomputed "duration" key.')
+            raise ValueError(msg)
+        duration = current_file['duration']
+
+        # cached features are cropped one segment at a time
+        if self.cache_ is not None and not self.augmented:
+            return np.stack([
+                self._cached_crop(current_file, segment, mode=mode,
+                                  fixed=fixed) for segment in segments])
+
+        context = self.get_context_duration()
+        raw_audio = self.raw_audio_
+        augment = self.augmented
+
+        segments = list(segments)
+        xsegments, ranges = [], []
+        for segment in segments:
+            # extend segment on both sides with requested context
+            xsegment = Segment(max(0, segment.start - context),
+                               min(duration, segment.end + context))
+            xsegments.append(xsegment)
+            ranges.append(raw_audio.sliding_window_.crop(
+                xsegment, mode='center', fixed=xsegment.duration,
+                return_ranges=True)[0])
+
+        # coalesce overlapping (or adjacent) waveform ranges
+        features = [None] * len(segments)
+        for start, end, indices in coalesce_ranges(ranges):
+
+            # one single read for the whole group
+            y, offset = raw_audio._read(current_file, start, end)
+
+            # features of each segment are extracted from its own waveform
+            # range (as would `crop`). augmented waveforms cannot be shared.
+            extracted = dict()
+            for i in indices:
+                key = (tuple(ranges[i]), xsegments[i])
+                if augment or key not in extracted:
+                    first = max(0, ranges[i][0] - offset)
+                    last = max(0, ranges[i][1] - offset)
+                    y_i = raw_audio._check_and_augment(
+                        current_file, xsegments[i], y[first:last],
+                        epoch=epoch)
+                    extracted[key] = self._get_features(y_i, epoch=epoch)
+                features[i] = self._trim(extracted[key], xsegments[i],
+                                         segments[i], mode=mode, fixed=fixed)
+
+        return np.stack(features)
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2019 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+Caching of (resampled) waveforms and extracted features
+"""
+
+import os
+import time
+import hashlib
+import threading
+from pathlib import Path
+
+import numpy as np
+from cachetools import LRUCache, LFUCache
+
+from pyannote.audio.util import mkdir_p
+
+# maximum number of memory-mapped files kept open by each cache
+CACHE_MAXSIZE = 64
+
+# cached waveforms are marked as recently used at most once every
+# CACHE_TOUCH_INTERVAL seconds (per process)
+CACHE_TOUCH_INTERVAL = 60.
+
+# int16 <-> float32 conversion factor
+INT16_SCALE = 32768.
+
+
+def _hash_file(path, chunk_size=1 << 20):
+    """Return SHA1 digest of file content"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class ResampledAudioCache(object):
+    """Persistent on-disk cache of resampled waveforms
+
+    Waveforms are stored as (memory-mapped) .npy files, keyed by the content
+    of the original audio file, the target sample rate, the requested channel
+    and whether they were converted to mono.
+
+    Parameters
+    ----------
+    root_dir : `str`
+        Path to cache directory.
+    sample_rate : `int`
+        Target sample rate.
+    max_size : `int`, optional
+        Disk budget, in bytes. Least recently used waveforms are removed from
+        the cache when it is exceeded. Recency is tracked with the
+        modification time of cached files, updated on access (at most once a
+        minute per process and file). Defaults to no limit.
+    dtype : {'float32', 'int16'}, optional
+        Storage type. 'int16' halves the disk (and page cache) footprint but
+        data has to be converted back to float32 on read. Defaults to
+        'float32', for which reads are zero-copy.
+
+    Usage
+    -----
+    >>> cache = ResampledAudioCache('/path/to/cache', 16000)
+    >>> y = cache(current_file)  # (n_samples, n_channels) np.memmap
+    """
+
+    def __init__(self, root_dir, sample_rate, max_size=None, dtype='float32'):
+        super().__init__()
+
+        self.root_dir = Path(root_dir).expanduser().resolve(strict=False)
+        self.sample_rate = sample_rate
+        self.max_size = max_size
+
+        if dtype not in ['float32', 'int16']:
+            msg = '`dtype` must be one of "float32" or "int16".'
+            raise ValueError(msg)
+        self.dtype = dtype
+
+        mkdir_p(self.root_dir / 'hash')
+
+        self.pid_ = None
+
+    def _reset(self):
+        """(Re)initialize per-process state"""
+        self.pid_ = os.getpid()
+        self.memmaps_ = LRUCache(maxsize=CACHE_MAXSIZE)
+        self.hashes_ = dict()
+        self.touched_ = dict()
+
+    def __getstate__(self):
+        # per-process state is not picklable: it is rebuilt after unpickling
+        state = dict(self.__dict__)
+        for key in ['memmaps_', 'hashes_', 'touched_']:
+            state.pop(key, None)
+        state['pid_'] = None
+        return state
+
+    def get_hash(self, audio):
+        """Get (persistently cached) hash of audio file content
+
+        Hashing the whole content of an audio file is expensive. Therefore,
+        hashes are stored in the cache directory, keyed by file path,
+        modification time and size.
+        """
+
+        stat = os.stat(audio)
+        key = f'{os.path.abspath(audio)}:{stat.st_mtime_ns}:{stat.st_size}'
+        if key in self.hashes_:
+            return self.hashes_[key]
+
+        path = self.root_dir / 'hash' / hashlib.sha1(key.encode()).hexdigest()
+        try:
+            with open(path, 'r') as fp:
+                digest = fp.read().strip()
+        except FileNotFoundError:
+            digest = _hash_file(audio)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as fp:
+                fp.write(digest)
+            os.replace(tmp, path)
+
+        self.hashes_[key] = digest
+        return digest
+
+    def get_path(self, current_file, mono=True):
+        """Get path to cached waveform"""
+        digest = self.get_hash(current_file['audio'])
+        channel = current_file.get('channel', None)
+        channel = 'all' if channel is None else f'{channel:d}'
+        mono = 'mono' if mono else 'multi'
+        return self.root_dir / \
+            f'{digest}.{self.sample_rate:d}.{channel}.{mono}.{self.dtype}.npy'
+
+    def _write(self, path, y):
+        """Atomically write waveform to cache"""
+
+        if self.dtype == 'int16':
+            y = np.clip(np.round(y * INT16_SCALE),
+                        -INT16_SCALE, INT16_SCALE - 1).astype(np.int16)
+        else:
+            y = y.astype(np.float32, copy=False)
+
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as fp:
+            np.save(fp, y)
+        os.replace(tmp, path)
+
+        self._evict(keep=path)
+
+    def _evict(self, keep=None):
+        """Remove least recently used waveforms until disk budget is met"""
+
+        if self.max_size is None:
+            return
+
+        entries = []
+        for path in self.root_dir.glob('*.npy'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # removed in the meantime by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _touch(self, path):
+        """Mark waveform as recently used (see `CACHE_TOUCH_INTERVAL`)"""
+
+        now = time.monotonic()
+        if now - self.touched_.get(path, -CACHE_TOUCH_INTERVAL) < \
+                CACHE_TOUCH_INTERVAL:
+            return
+        self.touched_[path] = now
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # removed in the meantime by another process
+            pass
+
+    def __call__(self, current_file, mono=True, load=None):
+        """Get cached waveform
+
+        Parameters
+        ----------
+        current_file : dict
+            `pyannote.database` file.
+        mono : `bool`, optional
+            Whether waveform is converted to mono. Defaults to True.
+        load : callable, optional
+            Called as `load(current_file)` to obtain the (n_samples,
+            n_channels) waveform when it is not cached yet. Defaults to
+            `read_audio` with `sample_rate` and `mono` options.
+
+        Returns
+        -------
+        y : (n_samples, n_channels) `np.memmap`
+            Cached waveform. Use `to_float32` to convert it to float32 in case
+            cache uses 'int16' storage.
+        """
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        path = self.get_path(current_file, mono=mono)
+
+        y = self.memmaps_.get(path, None)
+        if y is not None:
+            self._touch(path)
+            return y
+
+        if not path.exists():
+            if load is None:
+                from .utils import read_audio
+                y, _ = read_audio(current_file, sample_rate=self.sample_rate,
+                                  mono=mono)
+            else:
+                y = load(current_file)
+            self._write(path, y)
+
+        self._touch(path)
+
+        y = np.load(str(path), mmap_mode='r')
+        self.memmaps_[path] = y
+        return y
+
+    def to_float32(self, y):
+        """Convert (a slice of) cached waveform to float32"""
+        if self.dtype == 'int16':
+            return y.astype(np.float32) / INT16_SCALE
+        return y
+
+
+class FeatureCache(object):
+    """In-memory cache of extracted features, with a byte budget
+
+    Parameters
+    ----------
+    max_size : `int`
+        Memory budget, in bytes.
+    policy : {'lru', 'lfu'}, optional
+        Evict least recently used ('lru') or least frequently used ('lfu')
+        entries when memory budget is exceeded. Defaults to 'lru'.
+
+    Usage
+    -----
+    >>> cache = FeatureCache(1 << 30)
+    >>> features = cache(key, lambda: extract_features(...))
+    >>> cache.hits, cache.misses
+    """
+
+    def __init__(self, max_size, policy='lru'):
+        super().__init__()
+
+        if policy not in ['lru', 'lfu']:
+            msg = '`policy` must be one of "lru" or "lfu".'
+            raise ValueError(msg)
+
+        self.max_size = max_size
+        self.policy = policy
+
+        self.pid_ = None
+
+    def _reset(self):
+        """(Re)initialize per-process state"""
+        self.pid_ = os.getpid()
+        self.lock_ = threading.Lock()
+        Cache = LRUCache if self.policy == 'lru' else LFUCache
+        self.cache_ = Cache(maxsize=self.max_size,
+                            getsizeof=lambda data: data.nbytes)
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # per-process state is not picklable: it is rebuilt after unpickling
+        state = dict(self.__dict__)
+        for key in ['lock_', 'cache_', 'hits', 'misses']:
+            state.pop(key, None)
+        state['pid_'] = None
+        return state
+
+    def __call__(self, key, compute):
+        """Get cached features
+
+        Parameters
+        ----------
+        key : hashable
+            Cache key.
+        compute : callable
+            Called as `compute()` to obtain features when they are not cached.
+
+        Returns
+        -------
+        data : `np.ndarray`
+            Features. They are shared with the cache and must not be modified.
+        """
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        with self.lock_:
+            data = self.cache_.get(key, None)
+            if data is not None:
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        # features are computed outside of the lock so that concurrent
+        # (e.g. prefetching) threads are not serialized
+        data = compute()
+
+        with self.lock_:
+            try:
+                self.cache_[key] = data
+            except ValueError:
+                # larger than the whole budget
+                pass
+
+        return data
+
+    @property
+    def size(self):
+        """Memory currently used, in bytes"""
+        if self.pid_ != os.getpid():
+            return 0
+        return self.cache_.currsize
+
+    def info(self):
+        """Get cache statistics (for the current process)
+
+        Returns
+        -------
+        info : dict
+            'hits', 'misses', 'size' and 'max_size' (in bytes) statistics.
+        """
+        if self.pid_ != os.getpid():
+            self._reset()
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': self.size, 'max_size': self.max_size}
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2019 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+Persistent index of audio file metadata
+"""
+
+import os
+import sqlite3
+import warnings
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import soundfile as sf
+
+from pyannote.audio.util import mkdir_p
+
+# metadata is only kept in memory by default. set PYANNOTE_AUDIO_METADATA
+# environment variable to the path of a sqlite database (e.g.
+# ~/.pyannote/audio_metadata.db) to keep it across runs.
+METADATA_DB = os.environ.get('PYANNOTE_AUDIO_METADATA', None)
+
+# number of threads used to read audio headers in `populate`
+METADATA_JOBS = 16
+
+FIELDS = ['frames', 'sample_rate', 'channels', 'format', 'subtype']
+
+
+def _read_metadata(path):
+    """Read (stat and header) metadata of audio file"""
+    stat = os.stat(path)
+    info = sf.info(path)
+    return (path, stat.st_mtime_ns, stat.st_size, info.frames,
+            info.samplerate, info.channels, info.format, info.subtype)
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+class AudioMetadataIndex(object):
+    """Persistent index of audio file metadata
+
+    Reading the header of an audio file (e.g. to get its duration) is cheap
+    on local storage but can be very slow on network storage, especially when
+    it has to be done for thousands of files at startup. This index stores
+    audio metadata in a sqlite database, keyed by file path, modification time
+    and size, so that headers are only read once.
+
+    Parameters
+    ----------
+    path : `str`, optional
+        Path to sqlite database. Defaults to only keeping metadata in memory.
+
+    Usage
+    -----
+    >>> index = AudioMetadataIndex('/path/to/audio_metadata.db')
+    >>> index.populate(paths)  # read missing headers in parallel
+    >>> index('/path/to/file.wav')['duration']
+    """
+
+    def __init__(self, path=None):
+        super().__init__()
+        if path:
+            path = Path(path).expanduser().resolve(strict=False)
+        self.path = path
+        self.pid_ = None
+
+    def _reset(self):
+        """(Re)initialize per-process state"""
+        self.pid_ = os.getpid()
+        self.lock_ = threading.RLock()
+        self.memo_ = dict()
+        self.connection_ = None
+
+    def _connect(self):
+        """Lazily open (and create) the sqlite database"""
+
+        if self.connection_ is not None or self.path is None:
+            return self.connection_
+
+        try:
+            mkdir_p(self.path.parent)
+            connection = sqlite3.connect(str(self.path), timeout=30.,
+                                         check_same_thread=False)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS audio ('
+                'path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, '
+                'frames INTEGER, sample_rate INTEGER, channels INTEGER, '
+                'format TEXT, subtype TEXT)')
+            connection.commit()
+        except (OSError, sqlite3.Error) as e:
+            msg = (f'Audio metadata index "{self.path}" is not available '
+                   f'({e}): metadata will only be kept in memory.')
+            warnings.warn(msg)
+            self.path = None
+            return None
+
+        self.connection_ = connection
+        return connection
+
+    def _select(self, path, mtime_ns, size):
+        """Get metadata from database (None if missing or outdated)"""
+        connection = self._connect()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute(
+                'SELECT frames, sample_rate, channels, format, subtype '
+                'FROM audio WHERE path = ? AND mtime_ns = ? AND size = ?',
+                (path, mtime_ns, size)).fetchone()
+        except sqlite3.Error:
+            return None
+        return row
+
+    def _insert(self, rows):
+        """Store metadata in database"""
+        connection = self._connect()
+        if connection is None or not rows:
+            return
+        try:
+            with connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO audio VALUES (?,?,?,?,?,?,?,?)',
+                    rows)
+        except sqlite3.Error as e:
+            # e.g. database locked for too long by another process
+            msg = f'Could not update audio metadata index ({e}).'
+            warnings.warn(msg)
+
+    def _memoize(self, path, values):
+        metadata = dict(zip(FIELDS, values))
+        metadata['duration'] = float(metadata['frames']) / \
+            metadata['sample_rate']
+        self.memo_[path] = metadata
+        return metadata
+
+    def __call__(self, audio):
+        """Get audio file metadata
+
+        Parameters
+        ----------
+        audio : `str` or `Path`
+            Path to audio file.
+
+        Returns
+        -------
+        metadata : dict
+            'duration' (in seconds), 'frames', 'sample_rate', 'channels',
+            'format' and 'subtype' of audio file.
+        """
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        path = os.path.abspath(str(audio))
+
+        with self.lock_:
+            metadata = self.memo_.get(path, None)
+            if metadata is not None:
+                return metadata
+
+            path, mtime_ns, size = _stat(path)
+            row = self._select(path, mtime_ns, size)
+            if row is not None:
+                return self._memoize(path, row)
+
+        row = _read_metadata(path)
+        with self.lock_:
+            self._insert([row])
+            return self._memoize(path, row[3:])
+
+    def populate(self, audios, n_jobs=METADATA_JOBS):
+        """Read metadata of many audio files in parallel
+
+        Parameters
+        ----------
+        audios : iterable of `str` or `Path`
+            Paths to audio files.
+        n_jobs : int, optional
+            Number of threads. Defaults to 16, since this is I/O bound.
+        """
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        paths = set(os.path.abspath(str(audio)) for audio in audios)
+        with self.lock_:
+            paths = sorted(path for path in paths if path not in self.memo_)
+        if not paths:
+            return
+
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+
+            # look for up-to-date metadata in database
+            missing = []
+            with self.lock_:
+                for path, mtime_ns, size in executor.map(_stat, paths):
+                    row = self._select(path, mtime_ns, size)
+                    if row is None:
+                        missing.append(path)
+                    else:
+                        self._memoize(path, row)
+
+            # read headers of the other ones
+            rows = list(executor.map(_read_metadata, missing))
+
+        with self.lock_:
+            self._insert(rows)
+            for row in rows:
+                self._memoize(row[0], row[3:])
+
+
+# shared by get_audio_duration, get_audio_sample_rate and RawAudio
+AUDIO_METADATA = AudioMetadataIndex(path=METADATA_DB)
@@ -27,13 +27,202 @@
 # Hervé BREDIN - http://herve.niderb.fr
 
 
+import io
+import os
+import yaml
 import numpy as np
-import pandas as pd
 from pyannote.core import SlidingWindowFeature
 
 
+def short_term_moments(data, half, start=0, end=None):
+    """Compute short-term mean and standard deviation
+
+    Frame #t statistics are computed over frames #t - half to #t + half,
+    clipped to the available frames (i.e. windows are smaller at both ends).
+    Running sums make it O(n_samples) whatever the window length.
+
+    Parameters
+    ----------
+    data : (n_samples, n_features) `numpy.ndarray`
+        Features.
+    half : int
+        Half window length, in frames.
+    start, end : int, optional
+        Only compute statistics of frames #start to #end - 1.
+        Defaults to all frames.
+
+    Returns
+    -------
+    mu, sigma : (end - start, n_features) `numpy.ndarray`
+        Mean and (unbiased) standard deviation.
+    """
+
+    n_samples, n_features = data.shape
+    if end is None:
+        end = n_samples
+
+    if end <= start:
+        empty = np.zeros((0, n_features))
+        return empty, empty
+
+    # remove global mean to limit loss of precision in running sums
+    shift = np.mean(data, axis=0)
+    x = data - shift
+
+    S1 = np.zeros((n_samples + 1, n_features))
+    np.cumsum(x, axis=0, out=S1[1:])
+    S2 = np.zeros((n_samples + 1, n_features))
+    np.cumsum(x ** 2, axis=0, out=S2[1:])
+
+    t = np.arange(start, end)
+    lo = np.maximum(0, t - half)
+    hi = np.minimum(n_samples, t + half + 1)
+    k = (hi - lo)[:, np.newaxis]
+
+    s1 = S1[hi] - S1[lo]
+    s2 = S2[hi] - S2[lo]
+    mu = s1 / k
+    var = np.maximum(s2 - s1 * mu, 0.) / np.maximum(k - 1, 1)
+
+    return mu + shift, np.sqrt(var)
+
+
+class FeatureStatistics(object):
+    """Per-dimension feature statistics (count, mean and variance)
+
+    Statistics are accumulated with Welford's algorithm, generalized to
+    batches of frames, and partial statistics (e.g. computed on different
+    files by different workers) can be merged exactly.
+
+    Usage
+    -----
+    >>> statistics = FeatureStatistics()
+    >>> for features in all_features:
+    ...     statistics.update(features)
+    >>> statistics.merge(other_statistics)
+    >>> statistics.save('statistics.yml')
+    >>> statistics = FeatureStatistics.load('statistics.yml')
+    >>> statistics.mean, statistics.std
+    """
+
+    def __init__(self, count=0, mean=None, m2=None):
+        super(FeatureStatistics, self).__init__()
+        self.count = count
+        self.mean = None if mean is None else np.array(mean, dtype=np.float64)
+        self.m2 = None if m2 is None else np.array(m2, dtype=np.float64)
+
+    def merge(self, other):
+        """Merge statistics of another set of frames (in place)
+
+        Parameters
+        ----------
+        other : `FeatureStatistics`
+
+        Returns
+        -------
+        self : `FeatureStatistics`
+        """
+
+        if other.count == 0:
+            return self
+
+        if self.count == 0:
+            self.count = other.count
+            self.mean = np.array(other.mean)
+            self.m2 = np.array(other.m2)
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.m2 = self.m2 + other.m2 + \
+            delta ** 2 * (self.count * other.count / count)
+        self.count = count
+        return self
+
+    def update(self, features):
+        """Accumulate statistics of new frames (in place)
+
+        Parameters
+        ----------
+        features : `SlidingWindowFeature` or (n_samples, n_features) `numpy.ndarray`
+
+        Returns
+        -------
+        self : `FeatureStatistics`
+        """
+
+        if isinstance(features, SlidingWindowFeature):
+            features = features.data
+
+        data = np.asarray(features, dtype=np.float64)
+        if len(data) == 0:
+            return self
+
+        mean = np.mean(data, axis=0)
+        m2 = np.sum((data - mean) ** 2, axis=0)
+        return self.merge(FeatureStatistics(count=len(data), mean=mean, m2=m2))
+
+    @property
+    def var(self):
+        """Unbiased variance"""
+        return self.m2 / max(1, self.count - 1)
+
+    @property
+    def std(self):
+        """Unbiased standard deviation"""
+        return np.sqrt(self.var)
+
+    def affine(self, dtype=np.float32):
+        """Get standardization as an affine transform
+
+        Returns
+        -------
+        scale, shift : (n_features, ) `numpy.ndarray`
+            Standardized features are obtained as features x scale + shift.
+        """
+        std = self.std
+        std[std == 0.] = 1e-6
+        scale = 1. / std
+        return scale.astype(dtype), (-self.mean * scale).astype(dtype)
+
+    def save(self, path):
+        """Atomically save statistics to YAML file"""
+        params = {'count': int(self.count),
+                  'mean': [float(m) for m in self.mean],
+                  'std': [float(s) for s in self.std]}
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with io.open(tmp, 'w') as f:
+            yaml.dump(params, f, default_flow_style=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load statistics from YAML file (as saved by `save`)"""
+        with io.open(path, 'r') as f:
+            params = yaml.load(f, Loader=yaml.SafeLoader)
+        count = params['count']
+        std = np.array(params['std'], dtype=np.float64)
+        return cls(count=count, mean=params['mean'],
+                   m2=std ** 2 * max(1, count - 1))
+
+
 class GlobalStandardization(object):
-    """Mean/variance normalization"""
+    """Mean/variance normalization
+
+    Parameters
+    ----------
+    statistics : `FeatureStatistics` or `str`, optional
+        Corpus-level statistics (or path to file where they were saved).
+        Defaults to standardizing each input with its own mean and variance.
+    """
+
+    def __init__(self, statistics=None):
+        super(GlobalStandardization, self).__init__()
+        if statistics is not None and \
+           not isinstance(statistics, FeatureStatistics):
+            statistics = FeatureStatistics.load(statistics)
+        self.statistics = statistics
 
     def get_context_duration(self):
         return 0.
@@ -59,11 +248,15 @@ class GlobalStandardization(object):
         else:
             data = features
 
-        mu = np.mean(data, axis=0)
-        sigma = np.std(data, axis=0, ddof=1)
-        sigma[sigma == 0.] = 1e-6
+        if self.statistics is None:
+            mu = np.mean(data, axis=0)
+            sigma = np.std(data, axis=0, ddof=1)
+            sigma[sigma == 0.] = 1e-6
+            normalized = (data - mu) / sigma
 
-        normalized = (data - mu) / sigma
+        else:
+            scale, shift = self.statistics.affine(dtype=data.dtype)
+            normalized = data * scale + shift
 
         if isinstance(features, SlidingWindowFeature):
             return SlidingWindowFeature(normalized, features.sliding_window)
@@ -111,24 +304,8 @@ class ShortTermStandardization(object):
 
         window = features_.sliding_window.samples(self.duration,
                                                   mode='center')
-        if not window % 2:
-            window += 1
-
-        rolling = pd.DataFrame(features_.data).rolling(
-            window=window, center=True, min_periods=window)
-        mu = np.array(rolling.mean())
-        sigma = np.array(rolling.std(ddof=1))
-
-        for i in range(window // 2):
-
-            data = features_.data[:i + window // 2 + 1, :]
-            mu[i] = np.mean(data, axis=0)
-            sigma[i] = np.std(data, axis=0, ddof=1)
-
-            data = features_.data[-i - window // 2 - 1:, :]
-            mu[-i - 1] = np.mean(data, axis=0)
-            sigma[-i - 1] = np.std(data, axis=0, ddof=1)
 
+        mu, sigma = short_term_moments(features_.data, window // 2)
         sigma[sigma == 0.] = 1e-6
 
         normalized_ = (features_.data - mu) / sigma
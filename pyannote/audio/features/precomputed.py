@@ -27,23 +27,88 @@
 # Hervé BREDIN - http://herve.niderb.fr
 
 
-import yaml
+import os
 import io
+import json
+import time
+import yaml
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 import numpy as np
 from numpy.lib.format import open_memmap
+from cachetools import LRUCache
 from struct import unpack
 
 from pyannote.core import SlidingWindow, SlidingWindowFeature
 from pyannote.database.util import get_unique_identifier
 from pyannote.audio.util import mkdir_p
 
+from .cache import CACHE_MAXSIZE
+from .normalization import FeatureStatistics
+
+
+# sharded storage: see `convert_to_shards`
+SHARDS_DIR = 'shards'
+SHARDS_INDEX = 'index.json'
+SHARD_SIZE = 1 << 30
+SHARD_ALIGNMENT = 64
+
+# storage types supported by `Precomputed` (besides original dtype)
+STORAGE_DTYPES = ['float16', 'int8']
+
+# int8 quantization headroom (as a fraction of the calibration range)
+INT8_MARGIN = 0.1
+
+# corpus-level statistics: see "pyannote-speech-feature statistics"
+STATISTICS_YML = 'statistics.yml'
+
+# number of frames read at once by `Precomputed.count_nan`
+SCAN_CHUNK = 1 << 16
+
+# background writing: see `Precomputed.dump_async`
+WRITER_JOBS = 2
+WRITER_QUEUE = 4
+
 
 class PyannoteFeatureExtractionError(Exception):
     pass
 
 
+def _npy_files(root_dir):
+    """Get features stored in their own .npy file, indexed by uri"""
+    npy = dict()
+    for directory, subdirectories, filenames in os.walk(root_dir):
+        if Path(directory) == root_dir and SHARDS_DIR in subdirectories:
+            subdirectories.remove(SHARDS_DIR)
+        for filename in filenames:
+            if not filename.endswith('.npy'):
+                continue
+            path = Path(directory) / filename
+            npy[str(path.relative_to(root_dir))[:-4]] = path
+    return npy
+
+
+def _crop_frames(data, sliding_window, segment, mode='center', fixed=None):
+    """Same as SlidingWindowFeature(data, sliding_window).crop(...)
+
+    ...but without instantiating a `SlidingWindowFeature`, and returning
+    a copy (not a view) of memory-mapped features.
+    """
+
+    (start, end), = sliding_window.crop(
+        segment, mode=mode, fixed=fixed, return_ranges=True)
+    n_samples = len(data)
+
+    # repeat first (or last) frame when out of bounds
+    if fixed is not None:
+        return data[np.clip(np.arange(start, end), 0, n_samples - 1)]
+
+    start, end = max(0, start), min(end, n_samples)
+    return np.array(data[start:max(start, end)])
+
+
 class Precomputed(object):
     """Precomputed features
 
@@ -61,6 +126,17 @@ class Precomputed(object):
         exists and contains `metadata.yml`.
     labels : iterable, optional
         Human-readable name for each dimension.
+    dtype : {'float16', 'int8'}, optional
+        Storage type. Defaults to storing features with their original type.
+        'int8' relies on per-dimension affine quantization whose scale and
+        offset are stored in `metadata.yml` (see `calibrate`). In both cases,
+        features are converted back to float32 on read. This is not used when
+        `root_dir` already exists and contains `metadata.yml`.
+    normalize : `bool`, optional
+        Standardize features using corpus-level statistics stored in
+        `root_dir/statistics.yml` (see "pyannote-speech-feature statistics").
+        Standardization is fused with the conversion back to float32.
+        Defaults to False.
 
     Notes
     -----
@@ -68,6 +144,17 @@ class Precomputed(object):
     `sliding_window` and `dimension` parameters in order to create and
     populate file `root_dir/metadata.yml` when instantiating.
 
+    With 'int8' storage, `calibrate` must be called (e.g. by
+    "pyannote-speech-feature quantize") before dumping features, and dumping
+    values outside of the calibration range (extended by 10% on both sides)
+    raises an error.
+
+    Features packed by `convert_to_shards` are read from shards (memory-mapped
+    once per process), and other features from their own `root_dir/{uri}.npy`
+    file. Features dumped after conversion take precedence over (stale)
+    sharded ones: `.npy` files modified since they were packed are looked for
+    once, when the shards index is loaded.
+
     """
 
     def get_path(self, item):
@@ -77,12 +164,16 @@ class Precomputed(object):
 
     def __init__(self, root_dir=None, use_memmap=True,
                  sliding_window=None, dimension=None, labels=None,
-                 augmentation=None):
+                 augmentation=None, dtype=None, normalize=False):
 
         if augmentation is not None:
             msg = 'Data augmentation is not supported by `Precomputed`.'
             raise ValueError(msg)
 
+        if dtype is not None and dtype not in STORAGE_DTYPES:
+            msg = '`dtype` must be one of "float16" or "int8".'
+            raise ValueError(msg)
+
         super(Precomputed, self).__init__()
         self.root_dir = Path(root_dir).expanduser().resolve(strict=False)
         self.use_memmap = use_memmap
@@ -95,6 +186,9 @@ class Precomputed(object):
 
             self.dimension_ = params.pop('dimension')
             self.labels_ = params.pop('labels', None)
+            self.dtype_ = params.pop('dtype', None)
+            self.scale_ = params.pop('scale', None)
+            self.offset_ = params.pop('offset', None)
             self.sliding_window_ = SlidingWindow(**params)
 
             if dimension is not None and self.dimension_ != dimension:
@@ -112,6 +206,10 @@ class Precomputed(object):
                 msg = 'inconsistent "sliding_window"'
                 raise ValueError(msg)
 
+            if dtype is not None and self.dtype_ != dtype:
+                msg = 'inconsistent "dtype" (is {0}, should be: {1})'
+                raise ValueError(msg.format(dtype, self.dtype_))
+
         else:
 
             if dimension is None:
@@ -142,6 +240,8 @@ class Precomputed(object):
                       'dimension': dimension}
             if labels is not None:
                 params['labels'] = labels
+            if dtype is not None:
+                params['dtype'] = dtype
 
             with io.open(path, 'w') as f:
                 yaml.dump(params, f, default_flow_style=False)
@@ -149,6 +249,132 @@ class Precomputed(object):
             self.sliding_window_ = sliding_window
             self.dimension_ = dimension
             self.labels_ = labels
+            self.dtype_ = dtype
+            self.scale_ = None
+            self.offset_ = None
+
+        # load index of sharded features (if any)
+        self.shards_ = None
+        path = self.root_dir / SHARDS_DIR / SHARDS_INDEX
+        if path.exists():
+            with io.open(path, 'r') as f:
+                index = json.load(f)
+            self.shards_ = index['shards']
+            self.index_ = index['files']
+            self._drop_stale(default=path.stat().st_mtime_ns)
+
+        # corpus-level standardization (as an affine transform)
+        self.normalize = normalize
+        self.affine_ = None
+        if normalize:
+            path = self.root_dir / STATISTICS_YML
+            if not path.exists():
+                msg = (f'Cannot normalize features because {path} does not '
+                       f'exist. Use "pyannote-speech-feature statistics" to '
+                       f'compute it.')
+                raise ValueError(msg)
+            self.affine_ = FeatureStatistics.load(path).affine()
+
+        self.pid_ = None
+
+    def _reset(self):
+        """(Re)initialize per-process state"""
+        self.pid_ = os.getpid()
+        # memory-mapped shards
+        self.shard_memmaps_ = dict()
+        # memory-mapped .npy files (least recently used are closed)
+        self.memmaps_ = LRUCache(maxsize=CACHE_MAXSIZE)
+        # background writers
+        self.writer_ = None
+        self.pending_ = []
+
+    def _drop_stale(self, default=0):
+        """Remove features dumped again since packing from shards index
+
+        Parameters
+        ----------
+        default : int, optional
+            Packing time (in ns) of index entries that do not record the
+            modification time of their original .npy file.
+        """
+        for uri, path in _npy_files(self.root_dir).items():
+            entry = self.index_.get(uri, None)
+            if entry is None:
+                continue
+            mtime = path.stat().st_mtime_ns
+            if len(entry) > 4:
+                stale = mtime != entry[4]
+            else:
+                stale = mtime > default
+            if stale:
+                del self.index_[uri]
+
+    def _forget_shard(self, item):
+        """Stop serving sharded features of a file that is dumped again"""
+        if self.shards_ is not None:
+            self.index_.pop(get_unique_identifier(item), None)
+
+    def _load_from_shards(self, uri):
+        """Get (memory-mapped) features from shards
+
+        Parameters
+        ----------
+        uri : `str`
+            Unique file identifier.
+
+        Returns
+        -------
+        data : `np.ndarray` or None
+            Features. None when `uri` is not part of any shard.
+        """
+
+        if self.shards_ is None:
+            return None
+
+        entry = self.index_.get(uri, None)
+        if entry is None:
+            return None
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        shard, offset, shape, dtype = entry[:4]
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        if np.prod(shape) == 0:
+            return np.empty(shape, dtype=dtype)
+
+        memmap = self.shard_memmaps_.get(shard, None)
+        if memmap is None:
+            path = self.root_dir / SHARDS_DIR / self.shards_[shard]
+            memmap = np.memmap(str(path), dtype=np.uint8, mode='r')
+            self.shard_memmaps_[shard] = memmap
+
+        return np.ndarray(shape, dtype=dtype, buffer=memmap, offset=offset)
+
+    def _load(self, current_file):
+        """Get (cached) memory-mapped features
+
+        Raises
+        ------
+        FileNotFoundError when no features were precomputed for this file.
+        """
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        path = self.get_path(current_file)
+        data = self.memmaps_.get(path, None)
+        if data is not None:
+            return data
+
+        # stale sharded features were removed from the index (see
+        # `_drop_stale` and `_forget_shard`)
+        data = self._load_from_shards(get_unique_identifier(current_file))
+        if data is None:
+            data = open_memmap(path, mode='r')
+
+        self.memmaps_[path] = data
+        return data
 
     @property
     def sliding_window(self):
@@ -165,6 +391,119 @@ class Precomputed(object):
         """Human-readable label of each dimension"""
         return self.labels_
 
+    @property
+    def dtype(self):
+        """Storage type (None when features are stored as is)"""
+        return self.dtype_
+
+    def calibrate(self, data):
+        """Set int8 quantization range
+
+        Scale and offset of each dimension are chosen so that the range of
+        `data` (extended by 10% on both sides) is covered, and stored in
+        `metadata.yml`. This must be done before dumping any features.
+
+        Parameters
+        ----------
+        data : (n_samples, dimension) numpy array
+            Representative features (or simply their per-dimension minimum
+            and maximum values, stacked).
+        """
+
+        if self.dtype_ != 'int8':
+            msg = 'Only "int8" storage needs to be calibrated.'
+            raise ValueError(msg)
+
+        data = np.asarray(data, dtype=np.float64)
+        minimum = np.nanmin(data, axis=0)
+        maximum = np.nanmax(data, axis=0)
+        margin = INT8_MARGIN * (maximum - minimum)
+        minimum, maximum = minimum - margin, maximum + margin
+
+        scale = np.maximum(maximum - minimum, 1e-8) / 255.
+        offset = minimum + 128. * scale
+
+        self.scale_ = [float(s) for s in scale]
+        self.offset_ = [float(o) for o in offset]
+        self._update_metadata(scale=self.scale_, offset=self.offset_)
+
+    def _update_metadata(self, **kwargs):
+        """Atomically update `metadata.yml`"""
+
+        path = self.root_dir / 'metadata.yml'
+        with io.open(path, 'r') as f:
+            params = yaml.load(f, Loader=yaml.Loader)
+        params.update(kwargs)
+
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with io.open(tmp, 'w') as f:
+            yaml.dump(params, f, default_flow_style=False)
+        os.replace(tmp, path)
+
+    def _load_calibration(self):
+        """Get int8 quantization range (possibly set by another process)"""
+
+        if self.scale_ is None:
+            with io.open(self.root_dir / 'metadata.yml', 'r') as f:
+                params = yaml.load(f, Loader=yaml.Loader)
+            self.scale_ = params.get('scale', None)
+            self.offset_ = params.get('offset', None)
+
+        if self.scale_ is None:
+            msg = (f'"int8" storage in {self.root_dir} is not calibrated. '
+                   f'Use "pyannote-speech-feature quantize" or `calibrate`.')
+            raise PyannoteFeatureExtractionError(msg)
+
+        return (np.array(self.scale_, dtype=np.float32),
+                np.array(self.offset_, dtype=np.float32))
+
+    def quantize(self, data):
+        """Convert features to storage type"""
+
+        if self.dtype_ == 'float16':
+            return data.astype(np.float16)
+
+        if self.dtype_ == 'int8':
+            scale, offset = self._load_calibration()
+            quantized = np.round((data - offset) / scale)
+            if np.any(quantized < -128) or np.any(quantized > 127):
+                msg = (f'Features fall outside of the "int8" calibration '
+                       f'range of {self.root_dir}: calibrate on data that '
+                       f'is representative of the whole corpus.')
+                raise PyannoteFeatureExtractionError(msg)
+            return quantized.astype(np.int8)
+
+        return data
+
+    def dequantize(self, data):
+        """Convert (a crop of) stored features back to float32
+
+        When `normalize` is True, standardization is applied as well (at no
+        extra cost for 'int8' storage, whose affine dequantization absorbs
+        it).
+        """
+
+        if self.dtype_ == 'int8':
+            scale, offset = self._load_calibration()
+            if self.affine_ is not None:
+                a, b = self.affine_
+                scale, offset = scale * a, offset * a + b
+            return data.astype(np.float32) * scale + offset
+
+        if self.dtype_ == 'float16':
+            data = data.astype(np.float32)
+
+        if self.affine_ is None:
+            return data
+
+        a, b = self.affine_
+        # memory-mapped features are read-only
+        if not data.flags.writeable:
+            return data * a + b
+        data *= a
+        data += b
+        return data
+
     def __call__(self, current_file):
         """Obtain features for file
 
@@ -179,19 +518,18 @@ class Precomputed(object):
             Features
         """
 
-        path = Path(self.get_path(current_file))
-
-        if not path.exists():
+        try:
+            data = self._load(current_file)
+        except FileNotFoundError as e:
             uri = get_unique_identifier(current_file)
             msg = f'No precomputed features for "{uri}".'
             raise PyannoteFeatureExtractionError(msg)
 
-        if self.use_memmap:
-            data = np.load(str(path), mmap_mode='r')
-        else:
-            data = np.load(str(path))
+        if not self.use_memmap:
+            data = np.array(data)
 
-        return SlidingWindowFeature(data, self.sliding_window_)
+        return SlidingWindowFeature(self.dequantize(data),
+                                    self.sliding_window_)
 
     def crop(self, current_file, segment, mode='center', fixed=None):
         """Fast version of self(current_file).crop(segment, **kwargs)
@@ -217,23 +555,305 @@ class Precomputed(object):
         if mode == 'center' and fixed is None:
             fixed = segment.duration
 
-        memmap = open_memmap(self.get_path(current_file), mode='r')
-        swf = SlidingWindowFeature(memmap, self.sliding_window_)
-        result = swf.crop(segment, mode=mode, fixed=fixed)
-        del memmap
-        return result
+        data = self._load(current_file)
+        features = _crop_frames(data, self.sliding_window_, segment,
+                                mode=mode, fixed=fixed)
+        return self.dequantize(features)
+
+    def crop_many(self, current_file, segments, mode='center', fixed=None):
+        """Batched version of `crop`
+
+        Parameters
+        ----------
+        current_file : dict
+            `pyannote.database` file.
+        segments : iterable of `pyannote.core.Segment`
+            Segments from which to extract features.
+        mode : {'loose', 'strict', 'center'}, optional
+            See `crop`. Defaults to 'center'.
+        fixed : float, optional
+            See `crop`. Should be provided to ensure that all feature
+            sequences have the same number of frames.
+
+        Returns
+        -------
+        features : (n_segments, n_frames, dimension) numpy array
+            Extracted features, in the same order as `segments`.
+        """
+
+        segments = list(segments)
+
+        data = self._load(current_file)
+
+        # read segments in chronological order for better locality
+        features = [None] * len(segments)
+        for i in sorted(range(len(segments)), key=lambda i: segments[i]):
+            segment = segments[i]
+            # match default FeatureExtraction.crop behavior
+            if mode == 'center' and fixed is None:
+                features[i] = _crop_frames(data, self.sliding_window_,
+                                           segment, mode=mode,
+                                           fixed=segment.duration)
+            else:
+                features[i] = _crop_frames(data, self.sliding_window_,
+                                           segment, mode=mode, fixed=fixed)
+
+        return self.dequantize(np.stack(features))
 
     def shape(self, item):
         """Faster version of precomputed(item).data.shape"""
-        memmap = open_memmap(self.get_path(item), mode='r')
-        shape = memmap.shape
-        del memmap
-        return shape
+        return self._load(item).shape
+
+    def count_nan(self, item, chunk=SCAN_CHUNK):
+        """Count frames containing NaNs
+
+        Features are scanned `chunk` frames at a time, so that whole files
+        are never loaded in memory.
+        """
+
+        data = self._load(item)
+
+        # integer storage cannot hold NaNs
+        if not np.issubdtype(data.dtype, np.floating):
+            return 0
+
+        n_nan = 0
+        for i in range(0, len(data), chunk):
+            block = data[i:i + chunk]
+            n_nan += np.count_nonzero(
+                np.isnan(block.reshape(len(block), -1)).any(axis=1))
+        return n_nan
+
+    def _prepare_dump(self, item, features):
+        """Get path and (quantized) data of features about to be dumped"""
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        path = Path(self.get_path(item))
+        mkdir_p(path.parent)
+
+        # do not serve previous version of features
+        self.memmaps_.pop(str(path), None)
+        self._forget_shard(item)
+
+        return path, self.quantize(features.data)
+
+    @staticmethod
+    def _write(path, data):
+        """Atomically write features"""
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as fp:
+            np.save(fp, data)
+        os.replace(tmp, path)
 
     def dump(self, item, features):
+        """Save features
+
+        Features are first written to a temporary file which is then renamed,
+        so that an interrupted dump never leaves a truncated file behind.
+
+        Parameters
+        ----------
+        item : dict
+            `pyannote.database` file.
+        features : `pyannote.core.SlidingWindowFeature`
+            Features.
+        """
+        path, data = self._prepare_dump(item, features)
+        self._write(path, data)
+
+    def dump_chunks(self, item, n_frames, chunks):
+        """Save features chunk by chunk
+
+        Chunks are written into a memory-mapped temporary file (which is then
+        renamed) as they come, so that features never need to fit in memory.
+
+        Parameters
+        ----------
+        item : dict
+            `pyannote.database` file.
+        n_frames : int
+            Total number of frames.
+        chunks : iterable
+            (start, features) tuples, where `features` is a numpy array of
+            features for frames #start to #start + len(features) - 1.
+
+        See also
+        --------
+        `pyannote.audio.features.FeatureExtraction.iter_chunks`
+        """
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
         path = Path(self.get_path(item))
         mkdir_p(path.parent)
-        np.save(path, features.data)
+
+        # do not serve previous version of features
+        self.memmaps_.pop(str(path), None)
+        self._forget_shard(item)
+
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        data = None
+        try:
+            for start, features in chunks:
+                features = self.quantize(features)
+                if data is None:
+                    data = open_memmap(tmp, mode='w+', dtype=features.dtype,
+                                       shape=(n_frames, ) + features.shape[1:])
+                data[start:start + len(features)] = features
+            data.flush()
+        except BaseException as e:
+            del data
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise e
+
+        del data
+        os.replace(tmp, path)
+
+    def dump_async(self, item, features):
+        """Save features in a background thread
+
+        Same as `dump` except that it returns as soon as writing is scheduled.
+        At most 4 dumps can be pending at any time: this blocks until one of
+        them is done otherwise. Use `flush` to wait for all pending dumps.
+        `features` must not be modified once passed to this method.
+
+        Parameters
+        ----------
+        item : dict
+            `pyannote.database` file.
+        features : `pyannote.core.SlidingWindowFeature`
+            Features.
+        """
+
+        path, data = self._prepare_dump(item, features)
+
+        if self.writer_ is None:
+            self.writer_ = ThreadPoolExecutor(max_workers=WRITER_JOBS)
+
+        # bounded queue: wait for oldest pending dumps to complete.
+        # this is also where errors raised by background writers surface.
+        while len(self.pending_) >= WRITER_QUEUE:
+            self.pending_.pop(0).result()
+
+        self.pending_.append(self.writer_.submit(self._write, path, data))
+
+    def flush(self):
+        """Wait for all pending `dump_async` to complete
+
+        Raises
+        ------
+        Any error that happened while writing pending features.
+        """
+
+        if self.pid_ != os.getpid():
+            return
+
+        pending, self.pending_ = self.pending_, []
+        for future in pending:
+            future.result()
+
+
+def convert_to_shards(root_dir, shard_size=SHARD_SIZE, remove=False):
+    """Pack precomputed features into a few large shard files
+
+    Features of every file are stored contiguously (C order) in shard files
+    `root_dir/shards/*.bin`, and located with an index file
+    `root_dir/shards/index.json` that maps each uri to its shard, byte offset,
+    shape, dtype and the modification time of the packed `.npy` file. `Precomputed` automatically reads features from shards
+    when this index exists.
+
+    Both features already packed in (previous) shards and those stored as
+    `root_dir/{uri}.npy` files are packed. Previous shards are removed once
+    the new index is written.
+
+    Parameters
+    ----------
+    root_dir : `str`
+        Path to directory where precomputed features are stored.
+    shard_size : int, optional
+        Approximate maximum size of each shard, in bytes. Defaults to 1GB.
+    remove : bool, optional
+        Remove `.npy` files once their content is packed. Defaults to False.
+
+    Returns
+    -------
+    n_files : int
+        Number of packed files.
+    """
+
+    precomputed = Precomputed(root_dir=root_dir)
+    root_dir = precomputed.root_dir
+    shards_dir = root_dir / SHARDS_DIR
+    mkdir_p(shards_dir)
+
+    # gather uris of features stored in their own .npy file...
+    npy = _npy_files(root_dir)
+
+    # ... and of features already packed in shards
+    uris = set(npy)
+    if precomputed.shards_ is not None:
+        uris.update(precomputed.index_)
+
+    # new shards get a unique prefix so that previous ones (which may be in
+    # use by other processes) are not overwritten
+    prefix = f'{int(time.time() * 1e6):x}'
+    shards, index = [], dict()
+    fp, offset = None, 0
+
+    for uri in sorted(uris):
+
+        # .npy files are more recent than (previous) shards. the modification
+        # time of packed .npy files is recorded to detect later dumps.
+        if uri in npy:
+            mtime = npy[uri].stat().st_mtime_ns
+            data = np.load(str(npy[uri]), mmap_mode='r')
+        else:
+            mtime = precomputed.index_[uri][4] \
+                if len(precomputed.index_[uri]) > 4 else 0
+            data = precomputed._load_from_shards(uri)
+
+        # start a new shard when current one is full
+        if fp is None or (offset > 0 and offset + data.nbytes > shard_size):
+            if fp is not None:
+                fp.close()
+            shards.append(f'{prefix}-{len(shards):05d}.bin')
+            fp = open(shards_dir / shards[-1], 'wb')
+            offset = 0
+
+        fp.write(np.ascontiguousarray(data).tobytes())
+        index[uri] = [len(shards) - 1, offset, list(data.shape),
+                      data.dtype.str, mtime]
+
+        # keep every array aligned
+        offset += data.nbytes
+        padding = -offset % SHARD_ALIGNMENT
+        fp.write(b'\0' * padding)
+        offset += padding
+
+    if fp is not None:
+        fp.close()
+
+    # atomically replace index
+    path = shards_dir / SHARDS_INDEX
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with io.open(tmp, 'w') as f:
+        json.dump({'shards': shards, 'files': index}, f)
+    os.replace(tmp, path)
+
+    # remove previous shards
+    for shard in shards_dir.glob('*.bin'):
+        if shard.name not in shards:
+            shard.unlink()
+
+    if remove:
+        for path in npy.values():
+            path.unlink()
+
+    return len(index)
 
 
 class PrecomputedHTK(object):
@@ -269,6 +889,9 @@ class PrecomputedHTK(object):
         self.sliding_window_ = SlidingWindow(start=0.,
                                              duration=self.duration,
                                              step=self.step)
+
+        self.pid_ = None
+
     @property
     def sliding_window(self):
         return self.sliding_window_
@@ -283,22 +906,72 @@ class PrecomputedHTK(object):
         path = '{root_dir}/{uri}.htk'.format(root_dir=root_dir, uri=uri)
         return path
 
-    # http://codereview.stackexchange.com/questions/
-    # 1496/reading-a-binary-file-containing-periodic-samples
     @staticmethod
     def load_htk(file_htk):
+        """Memory-map HTK file
+
+        Returns
+        -------
+        X : (num_samples, num_features) `np.memmap`
+            Big-endian float32 features (zero-copy).
+        sample_period : int
+            Sample period, in 100ns units.
+        """
         with open(file_htk, 'rb') as fp:
-            data = fp.read(12)
-            num_samples, sample_period, sample_size, _ = unpack('>iihh', data)
-            num_features = int(sample_size / 4)
-            num_samples = int(num_samples)
-            X = np.empty((num_samples, num_features))
-            for i in range(num_samples):
-                data = fp.read(sample_size)
-                X[i, :] = unpack('>' + ('f' * (sample_size // 4)), data)
+            num_samples, sample_period, sample_size, _ = unpack(
+                '>iihh', fp.read(12))
+        X = np.memmap(file_htk, dtype='>f4', mode='r', offset=12,
+                      shape=(num_samples, sample_size // 4))
         return X, sample_period
 
-    def __call__(self, item):
+    def _load(self, item):
+        """Get (cached) memory-mapped features"""
+
+        if self.pid_ != os.getpid():
+            self.pid_ = os.getpid()
+            self.memmaps_ = LRUCache(maxsize=CACHE_MAXSIZE)
+
         file_htk = self.get_path(self.root_dir, item)
-        X, _ = self.load_htk(file_htk)
-        return SlidingWindowFeature(X, self.sliding_window_)
+        X = self.memmaps_.get(file_htk, None)
+        if X is None:
+            X, _ = self.load_htk(file_htk)
+            self.memmaps_[file_htk] = X
+        return X
+
+    def __call__(self, item):
+        """Obtain (native-endian float32) features for file"""
+        return SlidingWindowFeature(self._load(item).astype(np.float32),
+                                    self.sliding_window_)
+
+    def crop(self, current_file, segment, mode='center', fixed=None):
+        """Fast version of self(current_file).crop(segment, **kwargs)
+
+        Only cropped frames are read and converted to native-endian float32.
+
+        See also
+        --------
+        `Precomputed.crop`
+        """
+
+        # match default FeatureExtraction.crop behavior
+        if mode == 'center' and fixed is None:
+            fixed = segment.duration
+
+        X = self._load(current_file)
+        features = _crop_frames(X, self.sliding_window_, segment, mode=mode,
+                                fixed=fixed)
+        return features.astype(np.float32)
+
+    def crop_many(self, current_file, segments, mode='center', fixed=None):
+        """Batched version of `crop`
+
+        See also
+        --------
+        `Precomputed.crop_many`
+        """
+        return np.stack([self.crop(current_file, segment, mode=mode,
+                                   fixed=fixed) for segment in segments])
+
+    def shape(self, item):
+        """Faster version of precomputed(item).data.shape"""
+        return self._load(item).shape
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2019 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+Polyphase resampling
+"""
+
+from math import gcd
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+class Resampler(object):
+    """Polyphase resampler
+
+    Output sample #n is computed as
+
+        y[n] = sum_k x[k] h[n x down - k x up + half_len]
+
+    where up / down is the (irreducible) ratio between target and original
+    sample rates, and h is a Kaiser-windowed sinc low-pass filter of length
+    2 x half_len + 1 (in the upsampled domain). Samples outside of the
+    original signal are assumed to be zero.
+
+    Because any output sample only depends on a small neighborhood of the
+    input signal, any range of output samples can be computed from the
+    corresponding range of input samples (see `support` method). Cropping then
+    resampling therefore gives exactly the same result as resampling the whole
+    signal then cropping.
+
+    Parameters
+    ----------
+    orig_sr : int
+        Original sample rate.
+    target_sr : int
+        Target sample rate.
+    num_zeros : int, optional
+        Number of zero-crossings of the sinc filter on each side.
+        Defaults to 32.
+    rolloff : float, optional
+        Cutoff frequency, as a fraction of the lowest Nyquist frequency.
+        Defaults to 0.945.
+    beta : float, optional
+        Kaiser window shape parameter. Defaults to 8.6 (~85dB stopband).
+
+    Usage
+    -----
+    >>> resampler = get_resampler(44100, 16000)
+    >>> (start, end) = resampler.support(n0, n1)
+    >>> y = resampler(x[start:end], offset=start, start=n0, end=n1)
+    """
+
+    def __init__(self, orig_sr, target_sr, num_zeros=32, rolloff=0.945,
+                 beta=8.6):
+        super().__init__()
+
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+
+        g = gcd(orig_sr, target_sr)
+        self.up = target_sr // g
+        self.down = orig_sr // g
+
+        # low-pass filter (in the upsampled domain)
+        cutoff = rolloff / max(self.up, self.down)
+        self.half_len = int(np.ceil(num_zeros / cutoff))
+        m = np.arange(-self.half_len, self.half_len + 1)
+        h = self.up * cutoff * np.sinc(cutoff * m)
+        h *= np.kaiser(len(h), beta)
+
+        # polyphase decomposition: H[phase, t] = h[phase + t x up]
+        self.n_taps = int(np.ceil(len(h) / self.up))
+        h = np.pad(h, (0, self.n_taps * self.up - len(h)), mode='constant')
+        H = h.reshape(self.n_taps, self.up).T
+
+        # taps are stored in reverse order so that they can be applied
+        # directly to (increasing) windows of input samples
+        self.H_ = np.ascontiguousarray(H[:, ::-1], dtype=np.float32)
+
+    def __len__(self):
+        return self.n_taps
+
+    @property
+    def context(self):
+        """Number of input samples needed on both sides of a segment"""
+        return self.n_taps + 1
+
+    def n_samples(self, n_samples):
+        """Number of output samples for `n_samples` input samples"""
+        return -(-n_samples * self.up // self.down)
+
+    def _k_max(self, n):
+        """Index of the last input sample used by output sample #n"""
+        return (n * self.down + self.half_len) // self.up
+
+    def support(self, start, end):
+        """Input samples needed for computing a range of output samples
+
+        Parameters
+        ----------
+        start, end : int
+            Range of output samples.
+
+        Returns
+        -------
+        start, end : int
+            Range of input samples.
+        """
+        return (self._k_max(start) - self.n_taps + 1,
+                self._k_max(end - 1) + 1)
+
+    def __call__(self, x, offset=0, start=0, end=None):
+        """Resample
+
+        Parameters
+        ----------
+        x : (n_samples, n_channels) or (n_samples, ) `np.ndarray`
+            Input samples #offset to #offset + n_samples - 1.
+        offset : int, optional
+            Index of first input sample. Defaults to 0.
+        start, end : int, optional
+            Range of output samples to compute. Defaults to all output samples
+            corresponding to input samples 0 to offset + n_samples.
+
+        Returns
+        -------
+        y : (end - start, n_channels) or (end - start, ) `np.ndarray`
+            Output samples #start to #end - 1.
+        """
+
+        if end is None:
+            end = self.n_samples(offset + len(x))
+
+        if x.ndim == 2:
+            return np.stack([self(x[:, c], offset=offset, start=start, end=end)
+                             for c in range(x.shape[1])], axis=1)
+
+        n_outputs = max(0, end - start)
+        y = np.zeros((n_outputs, ), dtype=np.float32)
+        if n_outputs == 0:
+            return y
+
+        # zero-pad input so that it covers the whole support
+        k_lo, k_hi = self.support(start, end)
+        xp = np.zeros((k_hi - k_lo, ), dtype=np.float32)
+        lo, hi = max(k_lo, offset), min(k_hi, offset + len(x))
+        if hi > lo:
+            xp[lo - k_lo:hi - k_lo] = x[lo - offset:hi - offset]
+
+        # output samples #start + r + q x up (q = 0, 1, ...) all share the
+        # same filter phase and use input windows that are `down` samples
+        # apart from each other: each of them is a strided matrix product.
+        stride = xp.strides[0]
+        for r in range(min(self.up, n_outputs)):
+            a = (start + r) * self.down + self.half_len
+            k, phase = divmod(a, self.up)
+            first = k - self.n_taps + 1 - k_lo
+            n_windows = len(range(r, n_outputs, self.up))
+            windows = as_strided(xp[first:],
+                                 shape=(n_windows, self.n_taps),
+                                 strides=(self.down * stride, stride),
+                                 writeable=False)
+            y[r::self.up] = windows @ self.H_[phase]
+
+        return y
+
+
+@lru_cache(maxsize=None)
+def get_resampler(orig_sr, target_sr):
+    """Get (cached) resampler
+
+    Parameters
+    ----------
+    orig_sr : int
+        Original sample rate.
+    target_sr : int
+        Target sample rate.
+
+    Returns
+    -------
+    resampler : `Resampler`
+    """
+    return Resampler(orig_sr, target_sr)
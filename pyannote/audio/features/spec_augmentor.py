@@ -1,3 +1,4 @@
+import os
 import numpy as np
 from pyannote.core import SlidingWindowFeature
 import random
@@ -94,3 +95,125 @@ class SpecAugmentor(object):
             return SlidingWindowFeature(spec, features.sliding_window)
         else:
             return spec
+
+
+class BatchSpecAugment(object):
+    """Batch-level spectrogram augmentation (https://arxiv.org/abs/1904.08779)
+
+    Frequency and time masks of a whole (batch_size, n_frames, n_features)
+    batch are drawn at once (with one single random draw) and applied with a
+    broadcast multiplication.
+
+    Parameters
+    ----------
+    frequency_masking_para : int, optional
+        Maximum width of frequency masks (F). Defaults to 27.
+    time_masking_para : int, optional
+        Maximum width of time masks (T), further limited to 20% of the number
+        of frames. Defaults to 100.
+    nb_frequency_masks : int, optional
+        Number of frequency masks (m_F). Defaults to 1.
+    nb_time_masks : int, optional
+        Number of time masks (m_T). Defaults to 1.
+    scheduler : optional
+        When provided (together with `max_epoch`), masks width increases
+        linearly with epoch, up to `max_epoch`.
+    max_epoch : int, optional
+    seed : int, optional
+        Random seed (of each process), for reproducibility.
+
+    Usage
+    -----
+    >>> spec_augment = BatchSpecAugment(seed=42)
+    >>> augmented = spec_augment(batch, epoch=epoch)
+    """
+
+    def __init__(self, frequency_masking_para=27, time_masking_para=100,
+                 nb_frequency_masks=1, nb_time_masks=1, scheduler=None,
+                 max_epoch=None, seed=None):
+        super().__init__()
+        self.frequency_masking_para = frequency_masking_para
+        self.time_masking_para = time_masking_para
+        self.nb_frequency_masks = nb_frequency_masks
+        self.nb_time_masks = nb_time_masks
+        self.scheduler = scheduler
+        self.max_epoch = max_epoch
+        self.seed = seed
+        self.pid_ = None
+
+    def _reset(self):
+        """(Re)initialize per-process state"""
+        self.pid_ = os.getpid()
+        self.random_state_ = np.random.RandomState(self.seed)
+
+    def _masking_para(self, n_frames, epoch=None):
+        """Get (epoch-scheduled) maximum width of frequency and time masks"""
+
+        F = self.frequency_masking_para
+        T = self.time_masking_para
+        if self.scheduler is not None and self.max_epoch is not None \
+                and epoch is not None:
+            ratio = min(epoch, self.max_epoch) / self.max_epoch
+            F, T = int(F * ratio), int(T * ratio)
+        return F, int(min(T, 0.2 * n_frames))
+
+    @staticmethod
+    def _masked(u, max_width, size):
+        """Turn (..., n_masks, 2) uniform draws into (..., size) masked bins"""
+        width = np.minimum((u[..., 0] * max_width).astype(int), size)
+        start = (u[..., 1] * (size - width + 1)).astype(int)
+        k = np.arange(size)
+        masked = (k >= start[..., np.newaxis]) & \
+                 (k < (start + width)[..., np.newaxis])
+        return np.any(masked, axis=-2)
+
+    def masks(self, batch_size, n_frames, n_features, epoch=None):
+        """Draw masks
+
+        Returns
+        -------
+        time_mask : (batch_size, n_frames, 1) `np.ndarray`
+        frequency_mask : (batch_size, 1, n_features) `np.ndarray`
+            0 for masked frames (or frequency bins), 1 otherwise.
+        """
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        F, T = self._masking_para(n_frames, epoch=epoch)
+        n_f, n_t = self.nb_frequency_masks, self.nb_time_masks
+        u = self.random_state_.random_sample((batch_size, n_f + n_t, 2))
+
+        frequency_mask = ~self._masked(u[:, :n_f], F, n_features)
+        time_mask = ~self._masked(u[:, n_f:], T, n_frames)
+
+        return (time_mask[:, :, np.newaxis].astype(np.float32),
+                frequency_mask[:, np.newaxis, :].astype(np.float32))
+
+    def __call__(self, batch, epoch=None):
+        """Apply SpecAugment
+
+        Parameters
+        ----------
+        batch : (batch_size, n_frames, n_features) `np.ndarray` or `torch.Tensor`
+            Batch of (mel-)spectrograms.
+        epoch : int, optional
+            Current epoch (used for scheduling masks width).
+
+        Returns
+        -------
+        augmented : (batch_size, n_frames, n_features) `np.ndarray` or `torch.Tensor`
+        """
+
+        batch_size, n_frames, n_features = batch.shape
+        time_mask, frequency_mask = self.masks(batch_size, n_frames,
+                                               n_features, epoch=epoch)
+
+        if isinstance(batch, torch.Tensor):
+            time_mask = torch.from_numpy(time_mask).to(batch)
+            frequency_mask = torch.from_numpy(frequency_mask).to(batch)
+
+        # one single allocation (input batch is left untouched)
+        augmented = batch * time_mask
+        augmented *= frequency_mask
+        return augmented
@@ -26,9 +26,12 @@
 # AUTHORS
 # Hervé BREDIN - http://herve.niderb.fr
 
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 import numpy as np
 
-import librosa
 from librosa.util import valid_audio
 from librosa.util.exceptions import ParameterError
 
@@ -37,6 +40,132 @@ from pyannote.core import SlidingWindow, SlidingWindowFeature
 from soundfile import SoundFile
 import soundfile as sf
 
+from .cache import ResampledAudioCache
+from .resampling import get_resampler
+from .metadata import AUDIO_METADATA
+
+# maximum number of idle SoundFile handles kept open by each process
+MAX_OPEN_FILES = 128
+
+
+class SoundFilePool(object):
+    """Per-process pool of open `SoundFile` handles
+
+    Opening an audio file (and parsing its header) for every single crop is
+    expensive. This pool keeps recently used handles open, in a least
+    recently used fashion.
+
+    Parameters
+    ----------
+    max_open_files : int, optional
+        Maximum number of idle handles kept open. Defaults to 128.
+
+    Usage
+    -----
+    >>> with SOUNDFILE_POOL(current_file['audio']) as audio_file:
+    ...     audio_file.seek(start)
+    ...     data = audio_file.read(n_samples)
+
+    Notes
+    -----
+    A handle is used by at most one thread at a time: it is removed from the
+    pool while in use, and a new one is opened if another thread requests
+    the same file in the meantime.
+
+    Handles are never shared across processes: a forked process starts
+    with an empty pool (as file offsets would otherwise be shared with the
+    parent process).
+    """
+
+    def __init__(self, max_open_files=MAX_OPEN_FILES):
+        super().__init__()
+        self.max_open_files = max_open_files
+        self.pid_ = None
+
+    def _reset(self):
+        """(Re)initialize per-process state"""
+        self.pid_ = os.getpid()
+        self.lock_ = threading.Lock()
+        self.handles_ = OrderedDict()
+
+    @contextmanager
+    def __call__(self, path):
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        path = str(path)
+        pid = self.pid_
+
+        with self.lock_:
+            audio_file = self.handles_.pop(path, None)
+
+        if audio_file is None:
+            audio_file = SoundFile(path, 'r')
+
+        try:
+            yield audio_file
+        finally:
+            self._release(path, audio_file, pid)
+
+    def _release(self, path, audio_file, pid):
+        """Put handle back into the pool"""
+
+        # pool has been reset (e.g. by a fork) in the meantime
+        if pid != self.pid_:
+            audio_file.close()
+            return
+
+        with self.lock_:
+
+            # another handle to this file has been released already
+            if path in self.handles_ or self.max_open_files < 1:
+                audio_file.close()
+                return
+
+            self.handles_[path] = audio_file
+            while len(self.handles_) > self.max_open_files:
+                _, handle = self.handles_.popitem(last=False)
+                handle.close()
+
+    def close(self):
+        """Close all idle handles"""
+        if self.pid_ != os.getpid():
+            self._reset()
+            return
+        with self.lock_:
+            while self.handles_:
+                _, handle = self.handles_.popitem(last=False)
+                handle.close()
+
+
+SOUNDFILE_POOL = SoundFilePool()
+
+
+def coalesce_ranges(ranges):
+    """Group overlapping (or adjacent) ranges
+
+    Parameters
+    ----------
+    ranges : list of (start, end) tuples
+
+    Returns
+    -------
+    groups : list of (start, end, indices) tuples
+        Sorted groups of overlapping ranges, where (start, end) is the union
+        of ranges in the group and `indices` their position in `ranges`.
+    """
+    groups = []
+    for i in sorted(range(len(ranges)), key=lambda i: ranges[i][0]):
+        start, end = ranges[i]
+        if groups and start <= groups[-1][1]:
+            groups[-1][1] = max(groups[-1][1], end)
+            groups[-1][2].append(i)
+        else:
+            groups.append([start, end, [i]])
+    return [tuple(group) for group in groups]
+
+
 def get_audio_duration(current_file):
     """Return audio file duration
 
@@ -55,11 +184,8 @@ def get_audio_duration(current_file):
     if 'duration' in current_file:
         return current_file['duration']
 
-    # otherwise use SoundFile
-    with SoundFile(current_file['audio'], 'r') as f:
-        duration = float(f.frames) / f.samplerate
-
-    return duration
+    # otherwise use (persistent) audio metadata index
+    return AUDIO_METADATA(current_file['audio'])['duration']
 
 
 def get_audio_sample_rate(current_file):
@@ -75,13 +201,15 @@ def get_audio_sample_rate(current_file):
     sample_rate : int
         Sampling rate
     """
-    with SoundFile(current_file['audio'], 'r') as f:
-        sample_rate = f.samplerate
+    return AUDIO_METADATA(current_file['audio'])['sample_rate']
+
 
-    return sample_rate
+# duration (in seconds) of blocks used by `read_audio`
+BLOCK_DURATION = 60.
 
 
-def read_audio(current_file, sample_rate=None, mono=True):
+def read_audio(current_file, sample_rate=None, mono=True,
+               block_duration=BLOCK_DURATION):
     """Read audio file
 
     Parameters
@@ -92,6 +220,9 @@ def read_audio(current_file, sample_rate=None, mono=True):
         Target sampling rate. Defaults to using native sampling rate.
     mono : int, optional
         Convert multi-channel to mono. Defaults to True.
+    block_duration : float, optional
+        Read (and resample) audio file by blocks of that many seconds.
+        Defaults to 60s.
 
     Returns
     -------
@@ -105,24 +236,67 @@ def read_audio(current_file, sample_rate=None, mono=True):
     In case `current_file` contains a `channel` key, data of this (1-indexed)
     channel will be returned.
 
+    Audio file is processed block by block (with a small overlap used as
+    context for resampling) so that peak memory usage is (almost) only that
+    of the returned array, whatever the number of channels and the native
+    sample rate of the file.
     """
 
-    y, file_sample_rate = sf.read(current_file['audio'],
-                                  dtype='float32',
-                                  always_2d=True)
-
-    # extract specific channel if requested
     channel = current_file.get('channel', None)
-    if channel is not None:
-        y = y[:, channel-1:channel]
 
-    # convert to mono
-    if mono and y.shape[1] > 1:
-        y = np.mean(y, axis=1, keepdims=True)
+    with SOUNDFILE_POOL(current_file['audio']) as audio_file:
+
+        file_sample_rate = audio_file.samplerate
+        n_frames = audio_file.frames
+        audio_file.seek(0)
+
+        if sample_rate is None:
+            sample_rate = file_sample_rate
 
-    # resample if sample rates mismatch
-    if file_sample_rate != sample_rate:
-        y = librosa.core.resample(y.T, file_sample_rate, sample_rate).T
+        n_channels = audio_file.channels
+        if channel is not None or mono:
+            n_channels = 1
+
+        resampler = get_resampler(file_sample_rate, sample_rate)
+
+        # add enough context on both sides of each block for resampling
+        margin = 0 if sample_rate == file_sample_rate else resampler.context
+        blocksize = max(1, int(block_duration * file_sample_rate))
+
+        n_samples = resampler.n_samples(n_frames)
+        y = np.empty((n_samples, n_channels), dtype=np.float32)
+
+        # block #b covers [b x blocksize, (b+1) x blocksize + 2 x margin[ but
+        # is only used for [b x blocksize + margin, (b+1) x blocksize + margin[
+        blocks = audio_file.blocks(blocksize=blocksize + 2 * margin,
+                                   overlap=2 * margin,
+                                   dtype='float32', always_2d=True)
+        for b, block in enumerate(blocks):
+
+            start = b * blocksize
+            is_last = start + len(block) >= n_frames
+
+            # extract specific channel if requested
+            if channel is not None:
+                block = block[:, channel-1:channel]
+
+            # convert to mono
+            if mono and block.shape[1] > 1:
+                block = np.mean(block, axis=1, keepdims=True)
+
+            first = 0 if b == 0 else resampler.n_samples(start + margin)
+            last = n_samples if is_last else resampler.n_samples(
+                start + blocksize + margin)
+
+            # resample if sample rates mismatch
+            if file_sample_rate != sample_rate:
+                y[first:last] = resampler(block, offset=start,
+                                          start=first, end=last)
+            else:
+                y[first:last] = block[first - start:last - start]
+
+            if is_last:
+                break
 
     return y, sample_rate
 
@@ -138,9 +312,22 @@ class RawAudio(object):
         Convert multi-channel to mono. Defaults to True.
     augmentation : `pyannote.audio.augmentation.Augmentation`, optional
         Data augmentation.
+    cache_dir : str, optional
+        When provided, resampled waveforms are cached (as memory-mapped .npy
+        files) into this directory and served from there afterwards. Requires
+        `sample_rate` to be set. Defaults to not use any cache.
+    cache_size : int, optional
+        Disk budget of the cache, in bytes. Defaults to no limit.
+    cache_dtype : {'float32', 'int16'}, optional
+        Storage type of cached waveforms. Defaults to 'float32'.
+
+    See also
+    --------
+    `pyannote.audio.features.cache.ResampledAudioCache`
     """
 
-    def __init__(self, sample_rate=None, mono=True, augmentation=None):
+    def __init__(self, sample_rate=None, mono=True, augmentation=None,
+                 cache_dir=None, cache_size=None, cache_dtype='float32'):
 
         super(RawAudio, self).__init__()
         self.sample_rate = sample_rate
@@ -148,6 +335,17 @@ class RawAudio(object):
 
         self.augmentation = augmentation
 
+        self.cache_dir = cache_dir
+        self.cache_ = None
+        if cache_dir is not None:
+            if sample_rate is None:
+                msg = ('`RawAudio` needs to be instantiated with an actual '
+                       '`sample_rate` if one wants to use `cache_dir`.')
+                raise ValueError(msg)
+            self.cache_ = ResampledAudioCache(cache_dir, sample_rate,
+                                              max_size=cache_size,
+                                              dtype=cache_dtype)
+
         if sample_rate is not None:
             self.sliding_window_ = SlidingWindow(start=-.5/sample_rate,
                                                  duration=1./sample_rate,
@@ -197,25 +395,26 @@ class RawAudio(object):
                 )
                 raise ValueError(msg)
 
-        else:
-            y, sample_rate = sf.read(current_file['audio'],
-                                     dtype='float32',
-                                     always_2d=True)
-
-        # extract specific channel if requested
-        channel = current_file.get('channel', None)
-        if channel is not None:
-            y = y[:, channel-1:channel]
+            # extract specific channel if requested
+            channel = current_file.get('channel', None)
+            if channel is not None:
+                y = y[:, channel-1:channel]
 
-        # convert to mono
-        if self.mono:
-            y = np.mean(y, axis=1, keepdims=True)
+            # convert to mono
+            if self.mono:
+                y = np.mean(y, axis=1, keepdims=True)
 
-        # resample if sample rates mismatch
-        if (self.sample_rate is not None) and (self.sample_rate != sample_rate):
-            y = librosa.core.resample(y.T, sample_rate, self.sample_rate).T
+        elif self.cache_ is not None:
+            y = self.cache_.to_float32(self.cache_(current_file,
+                                                   mono=self.mono))
             sample_rate = self.sample_rate
 
+        else:
+            # read, convert to mono and resample block by block
+            y, sample_rate = read_audio(current_file,
+                                        sample_rate=self.sample_rate,
+                                        mono=self.mono)
+
         # augment data
         if self.augmentation is not None:
             y = self.augmentation(y, sample_rate)
@@ -240,6 +439,131 @@ class RawAudio(object):
     def get_context_duration(self):
         return 0.
 
+    def get_n_samples(self, current_file):
+        """Get number of samples of (resampled) waveform, without reading it
+
+        Parameters
+        ----------
+        current_file : dict
+            `pyannote.database` file.
+
+        Returns
+        -------
+        n_samples : int
+            Number of samples (at `self.sample_rate`).
+        """
+
+        if 'waveform' in current_file:
+            return len(current_file['waveform'])
+
+        metadata = AUDIO_METADATA(current_file['audio'])
+        resampler = get_resampler(metadata['sample_rate'], self.sample_rate)
+        return resampler.n_samples(metadata['frames'])
+
+    def _to_mono(self, current_file, data):
+        """Extract requested channel and convert to mono if needed"""
+
+        # extract specific channel if requested
+        channel = current_file.get('channel', None)
+        if channel is not None:
+            data = data[:, channel-1:channel]
+
+        # convert to mono if needed
+        if self.mono:
+            data = np.mean(data, axis=1, keepdims=True)
+
+        return data
+
+    def _read(self, current_file, start, end):
+        """Read waveform samples
+
+        Parameters
+        ----------
+        current_file : dict
+            `pyannote.database` file.
+        start, end : int
+            Range of samples to read (at `self.sample_rate`).
+
+        Returns
+        -------
+        waveform : (n_samples, n_channels) numpy array
+            (Resampled) waveform, converted to mono if needed.
+        start : int
+            Index of the first returned sample. This differs from requested
+            `start` when the latter is negative.
+        """
+
+        # only keep samples that actually exist
+        start = max(0, start)
+
+        if 'waveform' in current_file:
+
+            y = current_file['waveform']
+
+            if len(y.shape) != 2:
+                msg = (
+                    f'Precomputed waveform should be provided as a '
+                    f'(n_samples, n_channels) `np.ndarray`.'
+                )
+                raise ValueError(msg)
+
+            return self._to_mono(current_file, y[start:end]), start
+
+        if self.cache_ is not None:
+
+            # resampled (and converted to mono) waveform is read from cache
+            y = self.cache_(current_file, mono=self.mono)
+            return self.cache_.to_float32(y[start:end]), start
+
+        # read file with SoundFile, which supports various fomats
+        # including NIST sphere. handles are kept open across calls.
+        with SOUNDFILE_POOL(current_file['audio']) as audio_file:
+
+            sample_rate = audio_file.samplerate
+            resampler = get_resampler(sample_rate, self.sample_rate)
+
+            # only keep samples that actually exist
+            end = min(end, resampler.n_samples(audio_file.frames))
+
+            # if the sample rates are mismatched, read the samples needed
+            # by the resampling filter to compute [start, end[ samples
+            if sample_rate != self.sample_rate:
+                k_lo, k_hi = resampler.support(start, end)
+                offset = max(0, k_lo)
+                n_frames = max(0, min(k_hi, audio_file.frames) - offset)
+            else:
+                offset, n_frames = start, max(0, end - start)
+
+            audio_file.seek(offset)
+            data = audio_file.read(n_frames,
+                                   dtype='float32',
+                                   always_2d=True)
+
+        data = self._to_mono(current_file, data)
+
+        # resample if sample rates mismatch
+        if sample_rate != self.sample_rate:
+            data = resampler(data, offset=offset, start=start, end=end)
+
+        return data, start
+
+    def _check_and_augment(self, current_file, segment, data, epoch=None):
+        """Check validity of cropped waveform and augment it"""
+
+        # TODO: how time consuming is this thing (needs profiling...)
+        try:
+            valid = valid_audio(data[:, 0], mono=True)
+        except ParameterError as e:
+            msg = (f"Something went wrong when trying to extract waveform of "
+                   f"file {current_file['database']}/{current_file['uri']} "
+                   f"between {segment.start:.3f}s and {segment.end:.3f}s.")
+            raise ValueError(msg)
+
+        if self.augmentation is not None:
+            data = self.augmentation(data, self.sample_rate, epoch=epoch)
+
+        return data
+
     def crop(self, current_file, segment, mode='center', fixed=None, epoch=None):
         """Fast version of self(current_file).crop(segment, **kwargs)
 
@@ -280,77 +604,65 @@ class RawAudio(object):
         (start, end), = self.sliding_window_.crop(
             segment, mode=mode, fixed=fixed, return_ranges=True)
 
-        # this is expected number of samples.
-        # this will be useful later in case of on-the-fly resampling
-        n_samples = end - start
-
-        if 'waveform' in current_file:
-
-            y = current_file['waveform']
-
-            if len(y.shape) != 2:
-                msg = (
-                    f'Precomputed waveform should be provided as a '
-                    f'(n_samples, n_channels) `np.ndarray`.'
-                )
-                raise ValueError(msg)
-
-            sample_rate = self.sample_rate
-            data = y[start:end]
-
-        else:
-            # read file with SoundFile, which supports various fomats
-            # including NIST sphere
-            with SoundFile(current_file['audio'], 'r') as audio_file:
+        data, _ = self._read(current_file, start, end)
 
-                sample_rate = audio_file.samplerate
+        return self._check_and_augment(current_file, segment, data,
+                                       epoch=epoch)
 
-                # if the sample rates are mismatched,
-                # recompute the start and end
-                if sample_rate != self.sample_rate:
+    def _crop_many(self, current_file, segments, mode='center', fixed=None,
+                   epoch=None):
+        """Same as `crop_many` but returns a list of waveforms"""
 
-                    sliding_window = SlidingWindow(start=-.5/sample_rate,
-                                                   duration=1./sample_rate,
-                                                   step=1./sample_rate)
-                    (start, end), = sliding_window.crop(
-                        segment, mode=mode, fixed=fixed,
-                        return_ranges=True)
+        if self.sample_rate is None:
+            msg = ('`RawAudio` needs to be instantiated with an actual '
+                   '`sample_rate` if one wants to use `crop_many`.')
+            raise ValueError(msg)
 
-                audio_file.seek(start)
-                data = audio_file.read(end - start,
-                                       dtype='float32',
-                                       always_2d=True)
+        ranges = [self.sliding_window_.crop(segment, mode=mode, fixed=fixed,
+                                            return_ranges=True)[0]
+                  for segment in segments]
 
-        # extract specific channel if requested
-        channel = current_file.get('channel', None)
-        if channel is not None:
-            data = data[:, channel-1:channel]
+        # coalesce overlapping (or adjacent) ranges into one single read
+        waveforms = [None] * len(segments)
+        for start, end, indices in coalesce_ranges(ranges):
+            data, offset = self._read(current_file, start, end)
+            for i in indices:
+                first, last = ranges[i]
+                first = max(0, first - offset)
+                last = max(0, last - offset)
+                waveforms[i] = self._check_and_augment(
+                    current_file, segments[i], data[first:last], epoch=epoch)
 
-        # convert to mono if needed
-        if self.mono:
-            data = np.mean(data, axis=1, keepdims=True)
+        return waveforms
 
-        # resample if sample rates mismatch
-        if sample_rate != self.sample_rate:
-            data = librosa.core.resample(data.T,
-                                         sample_rate,
-                                         self.sample_rate).T
-            sample_rate = self.sample_rate
-            data = data[:n_samples]
+    def crop_many(self, current_file, segments, mode='center', fixed=None,
+                  epoch=None):
+        """Batched version of `crop`
 
-        # TODO: how time consuming is this thing (needs profiling...)
-        try:
-            valid = valid_audio(data[:, 0], mono=True)
-        except ParameterError as e:
-            msg = (f"Something went wrong when trying to extract waveform of "
-                   f"file {current_file['database']}/{current_file['uri']} "
-                   f"between {segment.start:.3f}s and {segment.end:.3f}s.")
-            raise ValueError(msg)
+        Segments are sorted and overlapping (or adjacent) segments are read
+        from disk (and resampled) at once. Augmentation (if any) is applied
+        independently to each segment.
 
-        if self.augmentation is not None:
-            data = self.augmentation(data, sample_rate, epoch=epoch)
+        Parameters
+        ----------
+        current_file : dict
+            `pyannote.database` file.
+        segments : iterable of `pyannote.core.Segment`
+            Segments from which to extract waveforms.
+        mode : {'loose', 'strict', 'center'}, optional
+            See `crop`. Defaults to 'center'.
+        fixed : float, optional
+            See `crop`. Should be provided to ensure that all waveforms have
+            the same number of samples.
 
-        return data
+        Returns
+        -------
+        waveforms : (n_segments, n_samples, n_channels) numpy array
+            Waveforms, in the same order as `segments`.
+        """
+        segments = list(segments)
+        return np.stack(self._crop_many(current_file, segments, mode=mode,
+                                        fixed=fixed, epoch=epoch))
 
 # # THIS SCRIPT CAN BE USED TO CRASH-TEST THE ON-THE-FLY RESAMPLING
 
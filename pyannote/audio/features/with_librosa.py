@@ -34,7 +34,7 @@ import librosa
 import numpy as np
 
 from .base import FeatureExtraction
-from .spec_augmentor import SpecAugmentor
+from .spec_augmentor import BatchSpecAugment
 from pyannote.core.segment import SlidingWindow
 
 
@@ -51,13 +51,21 @@ class LibrosaFeatureExtraction(FeatureExtraction):
         Defaults to 0.025 (25ms).
     step : float, optional
         Defaults to 0.010 (10ms).
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
     """
 
     def __init__(self, sample_rate=16000, augmentation=None,
-                 duration=0.025, step=0.01):
+                 duration=0.025, step=0.01,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 statistics=None):
 
         super().__init__(sample_rate=sample_rate,
-                         augmentation=augmentation)
+                         augmentation=augmentation,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, statistics=statistics)
         self.duration = duration
         self.step = step
 
@@ -82,13 +90,21 @@ class LibrosaSpectrogram(LibrosaFeatureExtraction):
         Defaults to 0.025.
     step : float, optional
         Defaults to 0.010.
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
     """
 
     def __init__(self, sample_rate=16000, augmentation=None,
-                 duration=0.025, step=0.010):
+                 duration=0.025, step=0.010,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 statistics=None):
 
         super().__init__(sample_rate=sample_rate, augmentation=augmentation,
-                         duration=duration, step=step)
+                         duration=duration, step=step,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, statistics=statistics)
 
         self.n_fft_ = int(self.duration * self.sample_rate)
         self.hop_length_ = int(self.step * self.sample_rate)
@@ -131,17 +147,35 @@ class LibrosaMelSpectrogram(LibrosaFeatureExtraction):
         Defaults to 0.025.
     step : float, optional
         Defaults to 0.010.
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
     n_mels : int, optional
         Defaults to 96.
+    spec_augment : bool, optional
+        Apply SpecAugment to batches of features (see `augment_batch`).
+        Defaults to False.
+    frequency_masking_para, time_masking_para, nb_frequency_masks,
+    nb_time_masks, scheduler, max_epoch : optional
+        SpecAugment parameters. See `BatchSpecAugment`.
+    norm : bool, optional
+        Normalize each mel-spectrogram. Defaults to True.
+    spec_augment_seed : int, optional
+        SpecAugment random seed. See `BatchSpecAugment`.
     """
 
     def __init__(self, sample_rate=16000, augmentation=None,
                  duration=0.025, step=0.010, n_mels=96, spec_augment=False,
                  frequency_masking_para=27,time_masking_para=100,
-                 nb_frequency_masks=1, nb_time_masks=1, scheduler=None, max_epoch=None, norm=True):
+                 nb_frequency_masks=1, nb_time_masks=1, scheduler=None, max_epoch=None, norm=True,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 statistics=None, spec_augment_seed=None):
 
         super().__init__(sample_rate=sample_rate, augmentation=augmentation,
-                         duration=duration, step=step)
+                         duration=duration, step=step,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, statistics=statistics)
         self.n_mels = n_mels
         self.n_fft_ = int(self.duration * self.sample_rate)
         self.hop_length_ = int(self.step * self.sample_rate)
@@ -154,6 +188,22 @@ class LibrosaMelSpectrogram(LibrosaFeatureExtraction):
         self.max_epoch = max_epoch
         self.norm = norm
 
+        self.spec_augment_ = None
+        if self.spec_augment:
+            self.spec_augment_ = BatchSpecAugment(
+                frequency_masking_para=self.frequency_masking_para,
+                time_masking_para=self.time_masking_para,
+                nb_frequency_masks=self.nb_frequency_masks,
+                nb_time_masks=self.nb_time_masks,
+                scheduler=self.scheduler, max_epoch=self.max_epoch,
+                seed=spec_augment_seed)
+
+    def augment_batch(self, features, epoch=None):
+        """Apply SpecAugment to a whole batch (when `spec_augment` is True)"""
+        if self.spec_augment_ is None:
+            return features
+        return self.spec_augment_(features, epoch=epoch)
+
     def get_dimension(self):
         return self.n_mels
 
@@ -183,16 +233,7 @@ class LibrosaMelSpectrogram(LibrosaFeatureExtraction):
         if self.norm:
             mel_spec = (mel_spec - np.mean(mel_spec)) / np.var(mel_spec)
 
-        if self.spec_augment:
-            spec_augmentor = SpecAugmentor()
-            mel_spec = spec_augmentor(features=mel_spec,
-                                      frequency_masking_para=self.frequency_masking_para,
-                                      time_masking_para=self.time_masking_para,
-                                      nb_frequency_masks=self.nb_frequency_masks,
-                                      nb_time_masks=self.nb_time_masks,
-                                      scheduler=self.scheduler,
-                                      epoch=epoch,
-                                      max_epoch=self.max_epoch)
+        # SpecAugment is applied to whole batches: see `augment_batch`
 
         return mel_spec.T
 
@@ -229,6 +270,10 @@ class LibrosaMFCC(LibrosaFeatureExtraction):
         Defaults to 0.025.
     step : float, optional
         Defaults to 0.010.
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
     e : bool, optional
         Energy. Defaults to True.
     coefs : int, optional
@@ -256,10 +301,14 @@ class LibrosaMFCC(LibrosaFeatureExtraction):
                  duration=0.025, step=0.01,
                  e=False, De=True, DDe=True,
                  coefs=19, D=True, DD=True,
-                 fmin=0.0, fmax=None, n_mels=40):
+                 fmin=0.0, fmax=None, n_mels=40,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 statistics=None):
 
         super().__init__(sample_rate=sample_rate, augmentation=augmentation,
-                         duration=duration, step=step)
+                         duration=duration, step=step,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, statistics=statistics)
 
         self.e = e
         self.coefs = coefs
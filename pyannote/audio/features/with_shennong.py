@@ -33,6 +33,10 @@ Feature extraction with Shennong
 --------------------------------
 """
 
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from shennong.audio import Audio
 from shennong.features.processor.mfcc import MfccProcessor
 import numpy as np
@@ -48,6 +52,10 @@ from shennong.features.processor.pitch import (
     PitchProcessor, PitchPostProcessor)
 from shennong.features.postprocessor.cmvn import CmvnPostProcessor
 
+# number of threads used to estimate pitch when `pitch_async` is True
+PITCH_JOBS = 4
+
+
 class ShennongFeatureExtraction(FeatureExtraction):
     """Shennong feature extraction base class
 
@@ -61,24 +69,100 @@ class ShennongFeatureExtraction(FeatureExtraction):
         Defaults to 0.025.
     step : float, optional
         Defaults to 0.010.
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
     with_cmvn : bool, optional
         Defaults to False
     with_pitch: bool, optional
         Defaults to False
+    pitch_async : bool, optional
+        Estimate pitch on a thread pool, concurrently with the main features.
+        Defaults to False.
+
+    Notes
+    -----
+    Shennong processors are built (and configured) once, lazily, in each
+    process and thread using the feature extractor: see `get_processor`.
     """
 
     def __init__(self, sample_rate=16000, augmentation=None,
-                 duration=0.025, step=0.01):
+                 duration=0.025, step=0.01,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 pitch_async=False, statistics=None):
 
         super().__init__(sample_rate=sample_rate,
-                         augmentation=augmentation)
+                         augmentation=augmentation,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, statistics=statistics)
         self.duration = duration
         self.step = step
+        self.pitch_async = pitch_async
 
         self.sliding_window_ = SlidingWindow(start=-.5*self.duration,
                                              duration=self.duration,
                                              step=self.step)
 
+        self.pid_ = None
+
+    def _reset(self):
+        """(Re)initialize per-process state"""
+        self.pid_ = os.getpid()
+        self.local_ = threading.local()
+        self.lock_ = threading.Lock()
+        self.executor_ = None
+
+    def __getstate__(self):
+        # per-process state is not picklable: it is rebuilt after unpickling
+        state = dict(self.__dict__)
+        for key in ['local_', 'lock_', 'executor_']:
+            state.pop(key, None)
+        state['pid_'] = None
+        return state
+
+    def get_processor(self, key, build):
+        """Get (lazily built) shennong processor
+
+        Processors are built once per process and thread, because they are
+        not meant to be shared between concurrent `process` calls.
+
+        Parameters
+        ----------
+        key : hashable
+            Processor identifier (e.g. its name and parameters).
+        build : callable
+            Called as `build()` to create the processor when it does not
+            exist yet.
+
+        Returns
+        -------
+        processor : shennong processor
+        """
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        processors = getattr(self.local_, 'processors', None)
+        if processors is None:
+            processors = dict()
+            self.local_.processors = processors
+
+        processor = processors.get(key, None)
+        if processor is None:
+            processor = build()
+            processors[key] = processor
+        return processor
+
+    def _build_pitch_processor(self, fmin, fmax):
+        # define pitch estimation parameters
+        processor = PitchProcessor(frame_shift=self.step,
+                                   frame_length=self.duration)
+        processor.sample_rate = self.sample_rate
+        processor.min_f0 = fmin
+        processor.max_f0 = fmax
+        return processor
+
     def get_pitch(self, audio, fmin, fmax):
         """Extract pitch using shennong and output it as a set 
         of features. Can be concatenated with other sets of features
@@ -97,22 +181,46 @@ class ShennongFeatureExtraction(FeatureExtraction):
             Pitch output is an array of shape array.shape = (n, 3) 
             where n is the number of mfcc frames.
         """
-        # define pitch estimation parameters
-        processor = PitchProcessor(frame_shift=self.step,
-                                   frame_length=self.duration)
-        processor.sample_rate = self.sample_rate
-        processor.min_f0 = fmin
-        processor.max_f0 = fmax
+        processor = self.get_processor(
+            ('pitch', fmin, fmax),
+            lambda: self._build_pitch_processor(fmin, fmax))
 
         # estimate pitch
         pitch = processor.process(audio)
 
         # post process pitch to output usable features (see shennong)
-        postprocessor = PitchPostProcessor()
+        postprocessor = self.get_processor('postpitch', PitchPostProcessor)
         postpitch = postprocessor.process(pitch)
 
         return postpitch
 
+    def start_pitch(self, audio, fmin, fmax):
+        """Start pitch estimation
+
+        Pitch is by far the slowest part of feature extraction. When
+        `pitch_async` is True, it is estimated on a (per-process) thread pool
+        while the caller extracts the other features.
+
+        Returns
+        -------
+        result : callable
+            Returns the output of `get_pitch` (waiting for it if needed).
+        """
+
+        if not self.pitch_async:
+            pitch = self.get_pitch(audio, fmin, fmax)
+            return lambda: pitch
+
+        if self.pid_ != os.getpid():
+            self._reset()
+
+        with self.lock_:
+            if self.executor_ is None:
+                self.executor_ = ThreadPoolExecutor(max_workers=PITCH_JOBS)
+
+        future = self.executor_.submit(self.get_pitch, audio, fmin, fmax)
+        return future.result
+
     def concatenate_with_pitch(self, feat, pitch):
         """ When the pitch and the mfcc are not of same length, 
             pad the pitch equally at the begining and at the end
@@ -162,6 +270,13 @@ class ShennongFilterbank(ShennongFeatureExtraction):
         Defaults to 0.025.
     step : float, optional
         Defaults to 0.010.
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
+    pitch_async : bool, optional
+        Estimate pitch concurrently with the main features. See
+        `ShennongFeatureExtraction`.
     e : bool, optional
         Energy. Defaults to True.
     with_pitch: bool, optional
@@ -189,10 +304,15 @@ class ShennongFilterbank(ShennongFeatureExtraction):
                  pitchFmax=500,
                  e=False, D=True, DD=True,
                  melNbFilters=40,
-                 with_pitch=True):
+                 with_pitch=True,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 pitch_async=False, statistics=None):
 
         super().__init__(sample_rate=sample_rate, augmentation=augmentation,
-                         duration=duration, step=step)
+                         duration=duration, step=step,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, pitch_async=pitch_async,
+                         statistics=statistics)
 
         self.e = e
         self.with_pitch = with_pitch
@@ -210,6 +330,25 @@ class ShennongFilterbank(ShennongFeatureExtraction):
     def get_context_duration(self):
         return 0.
 
+    def _build_processor(self, sample_rate):
+
+        # create filterbank processor
+        processor = FilterbankProcessor(sample_rate=sample_rate)
+
+        # use energy ?
+        processor.use_energy = self.e
+
+        # set parameters
+        processor.frame_length = self.duration
+        processor.frame_shift = self.step
+        processor.window_type = self.fftWindow
+        processor.low_freq = self.melLowFreq
+        processor.high_freq = self.melHighFreq
+        processor.num_bins = self.melNbFilters
+        processor.snip_edges = False
+
+        return processor
+
     def get_features(self, y, sample_rate):
         """Feature extraction
 
@@ -236,29 +375,20 @@ class ShennongFilterbank(ShennongFeatureExtraction):
         # create audio object for shennong
         audio = Audio(data=y, sample_rate=sample_rate)
 
-        # create filterbank processor
-        processor = FilterbankProcessor(sample_rate=sample_rate)
-
-        # use energy ?
-        processor.use_energy = self.e
-
-        # set parameters
-        processor.frame_length = self.duration
-        processor.frame_shift = self.step
-        processor.window_type = self.fftWindow
-        processor.low_freq = self.melLowFreq
-        processor.high_freq = self.melHighFreq
-        processor.num_bins = self.melNbFilters
-        processor.snip_edges = False 
+        # start pitch estimation
+        if self.with_pitch:
+            pitch = self.start_pitch(audio, self.pitchFmin, self.pitchFmax)
 
         # process audio to get filterbanks
+        processor = self.get_processor(
+            ('filterbank', sample_rate),
+            lambda: self._build_processor(sample_rate))
         fbank = processor.process(audio)
 
         # Compute Pitch
         if self.with_pitch:
-            # extract pitch
-            pitch = self.get_pitch(audio, self.pitchFmin,
-                                   self.pitchFmax)
+            # wait for pitch
+            pitch = pitch()
 
             ## concatenate mfcc w/pitch - sometimes Kaldi adds to pitch
             ## one frame so give 2 frames of tolerance
@@ -300,6 +430,13 @@ class ShennongBottleneck(ShennongFeatureExtraction):
         Defaults to 0.025.
     step : float, optional
         Defaults to 0.010.
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
+    pitch_async : bool, optional
+        Estimate pitch concurrently with the main features. See
+        `ShennongFeatureExtraction`.
     e : bool, optional
         Energy. Defaults to True.
     with_pitch: bool, optional
@@ -317,10 +454,15 @@ class ShennongBottleneck(ShennongFeatureExtraction):
                  weights='BabelMulti',
                  pitchFmin=20,
                  pitchFmax=500,
-                 with_pitch=True):
+                 with_pitch=True,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 pitch_async=False, statistics=None):
 
         super().__init__(sample_rate=sample_rate, augmentation=augmentation,
-                         duration=duration, step=step)
+                         duration=duration, step=step,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, pitch_async=pitch_async,
+                         statistics=statistics)
 
         self.with_pitch = with_pitch
 
@@ -359,8 +501,14 @@ class ShennongBottleneck(ShennongFeatureExtraction):
         # create audio object for shennong
         audio = Audio(data=y, sample_rate=sample_rate)
 
-        # create processor
-        processor = BottleneckProcessor(weights=self.weights)
+        # start pitch estimation
+        if self.with_pitch:
+            pitch = self.start_pitch(audio, self.pitchFmin, self.pitchFmax)
+
+        # create processor (this loads the pretrained network only once)
+        processor = self.get_processor(
+            ('bottleneck', self.weights),
+            lambda: BottleneckProcessor(weights=self.weights))
 
         # define parameters
 
@@ -372,9 +520,8 @@ class ShennongBottleneck(ShennongFeatureExtraction):
 
         # Compute Pitch
         if self.with_pitch:
-            # extract pitch
-            pitch = self.get_pitch(audio, self.pitchFmin,
-                                   self.pitchFmax)
+            # wait for pitch
+            pitch = pitch()
 
             ## concatenate mfcc w/pitch - sometimes Kaldi adds to pitch
             ## one frame so give 2 frames of tolerance
@@ -434,6 +581,13 @@ class ShennongMfcc(ShennongFeatureExtraction):
         Defaults to 0.025.
     step : float, optional
         Defaults to 0.010.
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
+    pitch_async : bool, optional
+        Estimate pitch concurrently with the main features. See
+        `ShennongFeatureExtraction`.
     e : bool, optional
         Energy. Defaults to True.
     coefs : int, optional
@@ -474,10 +628,15 @@ class ShennongMfcc(ShennongFeatureExtraction):
                  vtln_high=-500, energy_floor=0.0,
                  raw_energy=True, cepstral_lifter=22.0, htk_compat=False,
                  pitchFmin=20, pitchFmax=500, n_mels=40,
-                 with_pitch=True, with_cmvn=True):
+                 with_pitch=True, with_cmvn=True,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 pitch_async=False, statistics=None):
 
         super().__init__(sample_rate=sample_rate, augmentation=augmentation,
-                         duration=duration, step=step)
+                         duration=duration, step=step,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, pitch_async=pitch_async,
+                         statistics=statistics)
 
         self.e = e
         self.coefs = coefs
@@ -511,6 +670,30 @@ class ShennongMfcc(ShennongFeatureExtraction):
     def get_context_duration(self):
         return 0.
 
+    def _build_processor(self, sample_rate):
+
+        # MFCC parameters
+        processor = MfccProcessor(sample_rate=sample_rate)
+        processor.dither = self.dither
+        processor.preemph_coeff = self.preemph_coeff
+        processor.remove_dc_offset = self.remove_dc_offset
+        processor.window_type = self.window_type
+        processor.blackman_coeff = self.blackman_coeff
+        processor.vtln_low = self.vtln_low
+        processor.vtln_high = self.vtln_high
+        processor.energy_floor = self.energy_floor
+        processor.raw_energy = self.raw_energy
+        processor.cepstral_lifter = self.cepstral_lifter
+        processor.htk_compat = self.htk_compat
+
+        processor.low_freq = self.mfccLowFreq
+        processor.high_freq = self.mfccHighFreq # defines it as (nyquist - 100)
+        processor.use_energy = self.e
+        processor.num_ceps = self.coefs
+        processor.snip_edges= False # end with correct number of frames
+
+        return processor
+
     def get_features(self, y, sample_rate):
         """Feature extraction
 
@@ -537,36 +720,22 @@ class ShennongMfcc(ShennongFeatureExtraction):
         # create audio object for shennong
         audio = Audio(data=y, sample_rate=sample_rate)
 
-        # MFCC parameters
-        processor = MfccProcessor(sample_rate=sample_rate)
-        processor.dither = self.dither
-        processor.preemph_coeff = self.preemph_coeff
-        processor.remove_dc_offset = self.remove_dc_offset
-        processor.window_type = self.window_type
-        processor.blackman_coeff = self.blackman_coeff
-        processor.vtln_low = self.vtln_low
-        processor.vtln_high = self.vtln_high
-        processor.energy_floor = self.energy_floor
-        processor.raw_energy = self.raw_energy
-        processor.cepstral_lifter = self.cepstral_lifter
-        processor.htk_compat = self.htk_compat
-
-        processor.low_freq = self.mfccLowFreq
-        processor.high_freq = self.mfccHighFreq # defines it as (nyquist - 100)
-        processor.use_energy = self.e
-        processor.num_ceps = self.coefs
-        processor.snip_edges= False # end with correct number of frames
+        # start pitch estimation
+        if self.with_pitch:
+            pitch = self.start_pitch(audio, self.pitchFmin, self.pitchFmax)
 
         # MFCC extraction
-        #audio = Audio(data=y, sample_rate=sample_rate)
+        processor = self.get_processor(
+            ('mfcc', sample_rate),
+            lambda: self._build_processor(sample_rate))
         mfcc = processor.process(audio)
+
         # compute deltas
         if self.D:
             # define first or second order derivative
-            if not self.DD:
-                derivative_proc = DeltaPostProcessor(order=1)
-            else:
-                derivative_proc = DeltaPostProcessor(order=2)
+            order = 2 if self.DD else 1
+            derivative_proc = self.get_processor(
+                ('delta', order), lambda: DeltaPostProcessor(order=order))
 
             # process Mfccs
             mfcc = derivative_proc.process(mfcc)
@@ -584,9 +753,8 @@ class ShennongMfcc(ShennongFeatureExtraction):
 
         # Compute Pitch
         if self.with_pitch:
-            # extract pitch
-            pitch = self.get_pitch(audio, self.pitchFmin,
-                                   self.pitchFmax)
+            # wait for pitch
+            pitch = pitch()
 
             mfcc = self.concatenate_with_pitch(mfcc.data, pitch.data)
 
@@ -632,6 +800,13 @@ class ShennongSpectrogram(ShennongFeatureExtraction):
         Defaults to 0.025.
     step : float, optional
         Defaults to 0.010.
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
+    pitch_async : bool, optional
+        Estimate pitch concurrently with the main features. See
+        `ShennongFeatureExtraction`.
     dither : float, optional
         Defaults to 1.0
     preemph_coeff : float, optional
@@ -668,11 +843,15 @@ class ShennongSpectrogram(ShennongFeatureExtraction):
                  remove_dc_offset=True, window_type='povey',
                  round_to_power_of_two=True, blackman_coeff=0.97,
                  energy_floor=0.0, raw_energy=True, with_pitch=True,
-                 pitchFmin=20, pitchFmax=500
-                 ):
+                 pitchFmin=20, pitchFmax=500,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 pitch_async=False, statistics=None):
 
         super().__init__(sample_rate=sample_rate, augmentation=augmentation,
-                         duration=duration, step=step)
+                         duration=duration, step=step,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, pitch_async=pitch_async,
+                         statistics=statistics)
 
         # spectrogram parameters
         self.dither = dither
@@ -693,6 +872,23 @@ class ShennongSpectrogram(ShennongFeatureExtraction):
     def get_context_duration(self):
         return 0.
 
+    def _build_processor(self, sample_rate):
+
+        # spectrogram parameters
+        processor = SpectrogramProcessor(sample_rate=sample_rate)
+        processor.window_type = self.window_type
+        processor.dither = self.dither
+        processor.preemph_coeff = self.preemph_coeff
+        processor.remove_dc_offset = self.remove_dc_offset
+        processor.round_to_power_of_two = self.round_to_power_of_two
+        processor.blackman_coeff = self.blackman_coeff
+        processor.energy_floor = self.energy_floor
+        processor.raw_energy = self.raw_energy
+
+        processor.snip_edges= False # end with correct number of frames
+
+        return processor
+
     def get_features(self, y, sample_rate):
         """Feature extraction
 
@@ -719,28 +915,20 @@ class ShennongSpectrogram(ShennongFeatureExtraction):
         # create audio object for shennong
         audio = Audio(data=y, sample_rate=sample_rate)
 
-        # MFCC parameters
-        processor = SpectrogramProcessor(sample_rate=sample_rate)
-        processor.window_type = self.window_type
-        processor.dither = self.dither
-        processor.preemph_coeff = self.preemph_coeff
-        processor.remove_dc_offset = self.remove_dc_offset
-        processor.round_to_power_of_two = self.round_to_power_of_two
-        processor.blackman_coeff = self.blackman_coeff
-        processor.energy_floor = self.energy_floor
-        processor.raw_energy = self.raw_energy
-
-        processor.snip_edges= False # end with correct number of frames
+        # start pitch estimation
+        if self.with_pitch:
+            pitch = self.start_pitch(audio, self.pitchFmin, self.pitchFmax)
 
-        # MFCC extraction
-        #audio = Audio(data=y, sample_rate=sample_rate)
+        # spectrogram extraction
+        processor = self.get_processor(
+            ('spectrogram', sample_rate),
+            lambda: self._build_processor(sample_rate))
         spect = processor.process(audio)
 
         # Compute Pitch
         if self.with_pitch:
-            # extract pitch
-            pitch = self.get_pitch(audio, self.pitchFmin,
-                                   self.pitchFmax)
+            # wait for pitch
+            pitch = pitch()
 
             ## concatenate spect w/pitch - sometimes Kaldi adds to pitch
             ## one frame so give 2 frames of tolerance
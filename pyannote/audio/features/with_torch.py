@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2019 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+Batched feature extraction with torch
+-------------------------------------
+
+Drop-in replacements for `LibrosaSpectrogram`, `LibrosaMelSpectrogram` and
+`LibrosaMFCC` that extract features for a whole (batch, n_samples) batch of
+waveforms at once, with (CPU) torch operations.
+
+When used for training, waveforms are cropped by `prepare` and features are
+extracted by `collate`, i.e. once per batch rather than once per sample.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import scipy.signal
+import scipy.fftpack
+import librosa
+import torch
+import torch.nn.functional as F
+
+from .base import FeatureExtraction
+from pyannote.core.segment import SlidingWindow
+
+# used to avoid log(0)
+AMIN = 1e-10
+
+# dynamic range of log-scaled (mel) spectrograms, in dB
+TOP_DB = 80.
+
+
+@lru_cache(maxsize=None)
+def _dft_basis(n_fft, window):
+    """Windowed real DFT basis, as (n_fft, n_fft // 2 + 1) cos and sin"""
+    w = scipy.signal.get_window(window, n_fft, fftbins=True)
+    n = np.arange(n_fft)[:, np.newaxis]
+    k = np.arange(n_fft // 2 + 1)[np.newaxis, :]
+    angle = 2 * np.pi * n * k / n_fft
+    cos = torch.from_numpy((w[:, np.newaxis] * np.cos(angle)).astype(np.float32))
+    sin = torch.from_numpy((w[:, np.newaxis] * np.sin(angle)).astype(np.float32))
+    return cos, sin
+
+
+@lru_cache(maxsize=None)
+def _mel_basis(sample_rate, n_fft, n_mels, fmin, fmax, htk):
+    """Mel filterbank, as (n_fft // 2 + 1, n_mels) matrix"""
+    mel = librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=n_mels,
+                              fmin=fmin, fmax=fmax, htk=htk)
+    return torch.from_numpy(mel.T.astype(np.float32))
+
+
+@lru_cache(maxsize=None)
+def _dct_basis(n_mels, n_mfcc):
+    """Orthonormal DCT-II, as (n_mels, n_mfcc) matrix"""
+    dct = scipy.fftpack.dct(np.eye(n_mels), type=2, norm='ortho', axis=0)
+    return torch.from_numpy(dct[:n_mfcc].T.astype(np.float32))
+
+
+@lru_cache(maxsize=None)
+def _delta_kernel(order, width):
+    """Savitzky-Golay `order`-th derivative kernel, as (1, 1, width) tensor"""
+    coefs = scipy.signal.savgol_coeffs(width, order, deriv=order, use='dot')
+    return torch.from_numpy(coefs.astype(np.float32)).view(1, 1, width)
+
+
+def stft(waveforms, n_fft, hop_length, window='hann'):
+    """Batched short-time Fourier transform (same as librosa.core.stft)
+
+    Parameters
+    ----------
+    waveforms : (batch_size, n_samples) `torch.Tensor`
+        Waveforms.
+    n_fft : int
+        Window length, in samples.
+    hop_length : int
+        Step, in samples.
+    window : str, optional
+        Window function. Defaults to 'hann'.
+
+    Returns
+    -------
+    real, imag : (batch_size, n_frames, n_fft // 2 + 1) `torch.Tensor`
+        Real and imaginary parts of the STFT (frames are centered).
+    """
+    padded = F.pad(waveforms.unsqueeze(1), (n_fft // 2, n_fft // 2),
+                   mode='reflect').squeeze(1)
+    frames = padded.unfold(-1, n_fft, hop_length)
+    cos, sin = _dft_basis(n_fft, window)
+    return torch.matmul(frames, cos), -torch.matmul(frames, sin)
+
+
+def power_to_db(S, ref=None):
+    """Batched version of librosa.power_to_db
+
+    Parameters
+    ----------
+    S : (batch_size, n_frames, dimension) `torch.Tensor`
+        Power spectrogram.
+    ref : float, optional
+        Reference power. Defaults to the maximum of each spectrogram.
+
+    Returns
+    -------
+    S_db : (batch_size, n_frames, dimension) `torch.Tensor`
+    """
+    batch_size = S.shape[0]
+    log_spec = 10. * torch.log10(torch.clamp(S, min=AMIN))
+    if ref is None:
+        ref = S.reshape(batch_size, -1).max(dim=1)[0].view(batch_size, 1, 1)
+        log_spec = log_spec - 10. * torch.log10(torch.clamp(ref, min=AMIN))
+    else:
+        log_spec = log_spec - 10. * np.log10(max(AMIN, ref))
+    floor = log_spec.reshape(batch_size, -1).max(dim=1)[0] - TOP_DB
+    return torch.max(log_spec,
+                     floor.view(batch_size, 1, 1).expand_as(log_spec))
+
+
+def delta(features, order=1, width=9):
+    """Batched version of librosa.feature.delta (along time axis)
+
+    Parameters
+    ----------
+    features : (batch_size, n_frames, dimension) `torch.Tensor`
+    order : int, optional
+        Derivative order. Defaults to 1.
+    width : int, optional
+        Number of frames. Defaults to 9.
+
+    Returns
+    -------
+    delta : (batch_size, n_frames, dimension) `torch.Tensor`
+    """
+    batch_size, n_frames, dimension = features.shape
+
+    # librosa relies on a Savitzky-Golay filter of polynomial order `order`,
+    # whose `order`-th derivative is constant over each window. Hence, edges
+    # (mode='interp') simply reuse the first (or last) complete window.
+    # Inputs shorter than `width` are filtered with one single window.
+    width = min(width, n_frames - 1 + n_frames % 2)
+    if width <= order:
+        return torch.zeros_like(features)
+
+    x = features.transpose(1, 2).reshape(batch_size * dimension, 1, n_frames)
+    d = F.conv1d(x, _delta_kernel(order, width).to(features.dtype))
+    d = F.pad(d, (width // 2, width // 2), mode='replicate')
+    return d.view(batch_size, dimension, n_frames).transpose(1, 2)
+
+
+class TorchFeatureExtraction(FeatureExtraction):
+    """Batched torch feature extraction base class
+
+    Parameters
+    ----------
+    sample_rate : int, optional
+        Defaults to 16000 (i.e. 16kHz)
+    augmentation : `pyannote.audio.augmentation.Augmentation`, optional
+        Data augmentation.
+    duration : float, optional
+        Defaults to 0.025 (25ms).
+    step : float, optional
+        Defaults to 0.010 (10ms).
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
+    """
+
+    def __init__(self, sample_rate=16000, augmentation=None,
+                 duration=0.025, step=0.01,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 statistics=None):
+
+        super().__init__(sample_rate=sample_rate,
+                         augmentation=augmentation,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, statistics=statistics)
+        self.duration = duration
+        self.step = step
+
+        self.n_fft_ = int(self.duration * self.sample_rate)
+        self.hop_length_ = int(self.step * self.sample_rate)
+
+        self.sliding_window_ = SlidingWindow(start=-.5*self.duration,
+                                             duration=self.duration,
+                                             step=self.step)
+
+    def get_frame_info(self):
+        return self.sliding_window_
+
+    def get_batch_features(self, waveforms):
+        """Extract features from a batch of waveforms
+
+        Parameters
+        ----------
+        waveforms : (batch_size, n_samples) `torch.Tensor`
+            Waveforms.
+
+        Returns
+        -------
+        features : (batch_size, n_frames, dimension) `torch.Tensor`
+            Features.
+        """
+        msg = ('`TorchFeatureExtraction` subclasses must implement '
+               '`get_batch_features` method.')
+        raise NotImplementedError(msg)
+
+    def get_features(self, y, sample_rate):
+        """Feature extraction
+
+        Parameters
+        ----------
+        y : (n_samples, 1) numpy array
+            Waveform
+        sample_rate : int
+            Sample rate
+
+        Returns
+        -------
+        data : (n_frames, n_dimensions) numpy array
+            Features
+        """
+        waveforms = torch.from_numpy(
+            np.ascontiguousarray(y[:, 0], dtype=np.float32)).unsqueeze(0)
+        with torch.no_grad():
+            return self.get_batch_features(waveforms)[0].numpy()
+
+    def prepare(self, current_file, segment, mode='center', fixed=None,
+                epoch=None):
+        """Crop (augmented) waveform, whose features are extracted by `collate`
+
+        Parameters
+        ----------
+        current_file : dict
+            `pyannote.database` file.
+        segment : `pyannote.core.Segment`
+            Segment from which to extract features.
+        mode : 'center'
+            Only 'center' mode is supported.
+        fixed : float, optional
+            Fixed duration. Defaults to `segment` duration.
+
+        Returns
+        -------
+        waveform : (n_samples, 1) numpy array
+
+        Notes
+        -----
+        Unlike `crop`, waveforms are not extended with `get_context_duration`
+        seconds of context (which is fine as long as it is 0, as for all
+        `TorchFeatureExtraction` defined here).
+        """
+        if mode != 'center':
+            msg = '`prepare` only supports "center" mode.'
+            raise ValueError(msg)
+        if fixed is None:
+            fixed = segment.duration
+        return self.raw_audio_.crop(current_file, segment, mode='center',
+                                    fixed=fixed, epoch=epoch)
+
+    def collate(self, waveforms):
+        """Extract features of a batch of waveforms prepared by `prepare`
+
+        Parameters
+        ----------
+        waveforms : list of (n_samples, 1) numpy arrays
+            Same-duration waveforms.
+
+        Returns
+        -------
+        features : (batch_size, n_frames, dimension) numpy array
+            Same as stacking `crop` outputs for feature extractors without
+            context (see `prepare`). Edge frames differ otherwise.
+        """
+        waveforms = np.stack(waveforms)[:, :, 0].astype(np.float32)
+        n_frames = self.sliding_window_.samples(
+            waveforms.shape[1] / self.sample_rate, mode='center')
+        with torch.no_grad():
+            features = self.get_batch_features(torch.from_numpy(waveforms))
+        return self._standardize(features[:, :n_frames].numpy())
+
+
+class TorchSpectrogram(TorchFeatureExtraction):
+    """Batched spectrogram (same as `LibrosaSpectrogram`)
+
+    Parameters
+    ----------
+    sample_rate : int, optional
+        Defaults to 16000 (i.e. 16kHz)
+    augmentation : `pyannote.audio.augmentation.Augmentation`, optional
+        Data augmentation.
+    duration : float, optional
+        Defaults to 0.025.
+    step : float, optional
+        Defaults to 0.010.
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
+    """
+
+    def get_dimension(self):
+        return self.n_fft_ // 2 + 1
+
+    def get_batch_features(self, waveforms):
+        real, imag = stft(waveforms, self.n_fft_, self.hop_length_,
+                          window='hamming')
+        return torch.sqrt(real ** 2 + imag ** 2)
+
+
+class TorchMelSpectrogram(TorchFeatureExtraction):
+    """Batched mel-spectrogram (same as `LibrosaMelSpectrogram`)
+
+    Parameters
+    ----------
+    sample_rate : int, optional
+        Defaults to 16000 (i.e. 16kHz)
+    augmentation : `pyannote.audio.augmentation.Augmentation`, optional
+        Data augmentation.
+    duration : float, optional
+        Defaults to 0.025.
+    step : float, optional
+        Defaults to 0.010.
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
+    n_mels : int, optional
+        Defaults to 96.
+    norm : bool, optional
+        Normalize each mel-spectrogram. Defaults to True.
+    """
+
+    def __init__(self, sample_rate=16000, augmentation=None,
+                 duration=0.025, step=0.010, n_mels=96, norm=True,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 statistics=None):
+
+        super().__init__(sample_rate=sample_rate, augmentation=augmentation,
+                         duration=duration, step=step,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, statistics=statistics)
+        self.n_mels = n_mels
+        self.norm = norm
+
+    def get_dimension(self):
+        return self.n_mels
+
+    def get_batch_features(self, waveforms):
+
+        real, imag = stft(waveforms, self.n_fft_, self.hop_length_)
+        mel_basis = _mel_basis(self.sample_rate, self.n_fft_, self.n_mels,
+                               0.0, None, False)
+        mel_spec = power_to_db(torch.matmul(real ** 2 + imag ** 2, mel_basis))
+
+        if self.norm:
+            batch_size = mel_spec.shape[0]
+            flat = mel_spec.reshape(batch_size, -1)
+            mean = flat.mean(dim=1).view(batch_size, 1, 1)
+            var = flat.var(dim=1, unbiased=False).view(batch_size, 1, 1)
+            mel_spec = (mel_spec - mean) / var
+
+        return mel_spec
+
+
+class TorchMFCC(TorchFeatureExtraction):
+    """Batched MFCC (same as `LibrosaMFCC`)
+
+    Parameters
+    ----------
+    sample_rate : int, optional
+        Defaults to 16000 (i.e. 16kHz)
+    augmentation : `pyannote.audio.augmentation.Augmentation`, optional
+        Data augmentation.
+    duration : float, optional
+        Defaults to 0.025.
+    step : float, optional
+        Defaults to 0.010.
+    cache_size, cache_policy, cache_chunk : optional
+        In-memory feature cache used by `crop`. See `FeatureExtraction`.
+    statistics : optional
+        Corpus-level standardization. See `FeatureExtraction`.
+    e : bool, optional
+        Energy. Defaults to False.
+    coefs : int, optional
+        Number of coefficients. Defaults to 19.
+    De : bool, optional
+        Keep energy first derivative. Defaults to True.
+    D : bool, optional
+        Add first order derivatives. Defaults to True.
+    DDe : bool, optional
+        Keep energy second derivative. Defaults to True.
+    DD : bool, optional
+        Add second order derivatives. Defaults to True.
+    fmin, fmax : float, optional
+        Mel filterbank frequency range. Defaults to 0 to Nyquist frequency.
+    n_mels : int, optional
+        Number of mel bands. Defaults to 40.
+    """
+
+    def __init__(self, sample_rate=16000, augmentation=None,
+                 duration=0.025, step=0.01,
+                 e=False, De=True, DDe=True,
+                 coefs=19, D=True, DD=True,
+                 fmin=0.0, fmax=None, n_mels=40,
+                 cache_size=None, cache_policy='lru', cache_chunk=None,
+                 statistics=None):
+
+        super().__init__(sample_rate=sample_rate, augmentation=augmentation,
+                         duration=duration, step=step,
+                         cache_size=cache_size, cache_policy=cache_policy,
+                         cache_chunk=cache_chunk, statistics=statistics)
+
+        self.e = e
+        self.coefs = coefs
+        self.De = De
+        self.DDe = DDe
+        self.D = D
+        self.DD = DD
+
+        self.n_mels = n_mels
+        self.fmin = fmin
+        self.fmax = fmax
+
+    def get_dimension(self):
+        n_features = 0
+        n_features += self.e
+        n_features += self.De
+        n_features += self.DDe
+        n_features += self.coefs
+        n_features += self.coefs * self.D
+        n_features += self.coefs * self.DD
+        return n_features
+
+    def get_batch_features(self, waveforms):
+
+        real, imag = stft(waveforms, self.n_fft_, self.hop_length_)
+        mel_basis = _mel_basis(self.sample_rate, self.n_fft_, self.n_mels,
+                               self.fmin, self.fmax, True)
+        S = power_to_db(torch.matmul(real ** 2 + imag ** 2, mel_basis),
+                        ref=1.0)
+
+        # adding one because C0 is the energy
+        mfcc = torch.matmul(S, _dct_basis(self.n_mels, self.coefs + 1))
+
+        stack = []
+
+        if self.e:
+            stack.append(mfcc[:, :, :1])
+
+        stack.append(mfcc[:, :, 1:])
+
+        if self.De or self.D:
+            mfcc_d = delta(mfcc, order=1)
+            if self.De:
+                stack.append(mfcc_d[:, :, :1])
+            if self.D:
+                stack.append(mfcc_d[:, :, 1:])
+
+        if self.DDe or self.DD:
+            mfcc_dd = delta(mfcc, order=2)
+            if self.DDe:
+                stack.append(mfcc_dd[:, :, :1])
+            if self.DD:
+                stack.append(mfcc_dd[:, :, 1:])
+
+        return torch.cat(stack, dim=2)
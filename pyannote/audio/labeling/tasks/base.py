@@ -49,6 +49,8 @@ from pyannote.generators.fragment import random_subsegment
 from pyannote.generators.fragment import SlidingSegments
 
 from pyannote.audio.train.trainer import Trainer
+from pyannote.audio.train.shared import SharedMemoryBatches
+from pyannote.audio.train.prefetch import BoundedPrefetch
 
 from .. import TASK_MULTI_CLASS_CLASSIFICATION
 from .. import TASK_MULTI_LABEL_CLASSIFICATION
@@ -88,9 +90,19 @@ class LabelingTaskGenerator:
         Total audio duration per epoch, in days.
         Defaults to one day (1).
     parallel : int, optional
-        Number of prefetching background generators. Defaults to 1. Each
-        generator will prefetch enough batches to cover a whole epoch. Set
+        Number of prefetching background generators. Defaults to 1. Set
         `parallel` to 0 to not use background generators.
+    prefetch : int, optional
+        Maximum number of batches prefetched by (all) background generators.
+        Defaults to 16.
+    prefetch_bytes : int, optional
+        Maximum memory used by prefetched batches, in bytes. Background
+        generators wait whenever either limit is reached. Defaults to no
+        limit.
+    workers : int, optional
+        When set, batches are generated by that many worker processes (each
+        with its own seeded sampler) into shared memory, instead of
+        `parallel` background generators. Defaults to 0 (no worker process).
     exhaustive : bool, optional
         Ensure training files are covered exhaustively (useful in case of
         non-uniform label distribution).
@@ -113,12 +125,17 @@ class LabelingTaskGenerator:
     def __init__(self, feature_extraction, protocol, subset='train',
                  frame_info=None, frame_crop=None,
                  duration=3.2, step=None,
-                 batch_size=32, per_epoch=1, parallel=1,
+                 batch_size=32, per_epoch=1, parallel=1, workers=0,
+                 prefetch=16, prefetch_bytes=None,
                  exhaustive=False, shuffle=False,
                  mask_dimension=None, mask_logscale=False):
 
         self.feature_extraction = feature_extraction
 
+        # batched feature extractors (e.g. `TorchMFCC`) only crop waveforms
+        # when generating samples and extract features at collation time
+        self.batched_ = hasattr(self.feature_extraction, 'collate')
+
         if frame_info is None:
             frame_info = self.feature_extraction.sliding_window
         self.frame_info = frame_info
@@ -134,6 +151,9 @@ class LabelingTaskGenerator:
         self.batch_size = batch_size
         self.per_epoch = per_epoch
         self.parallel = parallel
+        self.workers = workers
+        self.prefetch = prefetch
+        self.prefetch_bytes = prefetch_bytes
         self.exhaustive = exhaustive
         self.shuffle = shuffle
 
@@ -259,9 +279,27 @@ class LabelingTaskGenerator:
             uri = get_unique_identifier(current_file)
             self.data_[uri]['y'] = self.initialize_y(current_file)
 
+    def collate_X(self, X):
+        """Collate features of a batch of samples
+
+        Batched feature extractors (e.g. `TorchMFCC`) extract features here,
+        and batch-level data augmentation (e.g. SpecAugment) is applied here
+        as well.
+        """
+
+        if self.batched_:
+            X = self.feature_extraction.collate(X)
+        else:
+            X = np.stack(X)
+
+        augment_batch = getattr(self.feature_extraction, 'augment_batch', None)
+        if augment_batch is None:
+            return X
+        return augment_batch(X, epoch=self.iteration)
+
     @property
     def signature(self):
-        signature = {'X': {'@': (None, np.stack)},
+        signature = {'X': {'@': (None, self.collate_X)},
                      'y': {'@': (None, np.stack)}}
 
         if self.mask_dimension is not None:
@@ -295,20 +333,30 @@ class LabelingTaskGenerator:
 
         return specs
 
-    def _samples(self):
+    def _samples(self, nb_sequences_per_epoch=None):
         if self.exhaustive:
             return self._sliding_samples()
         else:
-            return self._random_samples()
+            return self._random_samples(
+                nb_sequences_per_epoch=nb_sequences_per_epoch)
 
-    def _random_samples(self):
+    def _random_samples(self, nb_sequences_per_epoch=None):
         """Random samples
 
+        Parameters
+        ----------
+        nb_sequences_per_epoch : int, optional
+            Number of samples after which `iteration` is incremented.
+            Defaults to `self.nb_sequences_per_epoch`.
+
         Returns
         -------
         samples : generator
             Generator that yields {'X': ..., 'y': ...} samples indefinitely.
         """
+        if nb_sequences_per_epoch is None:
+            nb_sequences_per_epoch = self.nb_sequences_per_epoch
+
         i = 0
         uris = list(self.data_)
         durations = np.array([self.data_[uri]['duration'] for uri in uris])
@@ -330,17 +378,17 @@ class LabelingTaskGenerator:
             # choose fixed-duration subsegment at random
             subsegment = next(random_subsegment(segment, self.duration))
 
-            X = self.feature_extraction.crop(current_file,
-                                             subsegment, mode='center',
-                                             fixed=self.duration,
-                                             epoch=self.iteration)
+            crop = self.feature_extraction.prepare if self.batched_ \
+                else self.feature_extraction.crop
+            X = crop(current_file, subsegment, mode='center',
+                     fixed=self.duration, epoch=self.iteration)
 
             y = self.crop_y(datum['y'], subsegment)
             sample = {'X': X, 'y': y}
 
             # Update counters
             i = i + 1
-            if (i % self.nb_sequences_per_epoch) == 0:
+            if (i % nb_sequences_per_epoch) == 0:
                 self.iteration = self.iteration + 1
                 i = 0
 
@@ -391,8 +439,10 @@ class LabelingTaskGenerator:
                 # make a copy of current file
                 current_file = dict(datum['current_file'])
 
-                # compute features for the whole file
-                features = self.feature_extraction(current_file)
+                # compute features for the whole file (unless they are
+                # extracted at collation time)
+                if not self.batched_:
+                    features = self.feature_extraction(current_file)
 
                 # randomly shift 'annotated' segments start time so that
                 # we avoid generating exactly the same subsequence twice
@@ -410,8 +460,13 @@ class LabelingTaskGenerator:
 
                 for sequence in sliding_segments.from_file(current_file):
 
-                    X = features.crop(sequence, mode='center',
-                                      fixed=self.duration)
+                    if self.batched_:
+                        X = self.feature_extraction.prepare(
+                            current_file, sequence, mode='center',
+                            fixed=self.duration)
+                    else:
+                        X = features.crop(sequence, mode='center',
+                                          fixed=self.duration)
                     y = self.crop_y(datum['y'], sequence)
                     sample = {'X': X, 'y': y}
 
@@ -454,42 +509,46 @@ class LabelingTaskGenerator:
         duration_per_batch = self.duration * self.batch_size
         return int(np.ceil(duration_per_epoch / duration_per_batch))
 
-    def __call__(self):
-        """(Parallelized) batch generator"""
-
-        # number of batches needed to complete an epoch
-        batches_per_epoch = self.batches_per_epoch
+    def _worker_batches(self):
+        """Batch generator of each worker process (see `workers`)"""
 
-        generators = []
+        # each worker only produces its share of every epoch
+        nb_sequences_per_epoch = int(np.ceil(
+            self.nb_sequences_per_epoch / self.workers))
 
-        if self.parallel:
-            for _ in range(self.parallel):
-
-                # batchify sampler and make sure at least
-                # `batches_per_epoch` batches are prefetched.
-                batches = batchify(self._samples(), self.signature,
-                                   batch_size=self.batch_size,
-                                   prefetch=batches_per_epoch)
+        return batchify(self._samples(
+                            nb_sequences_per_epoch=nb_sequences_per_epoch),
+                        self.signature, batch_size=self.batch_size,
+                        prefetch=0)
 
-                # add batch generator to the list of (background) generators
-                generators.append(batches)
-        else:
-
-            # batchify sampler without prefetching
-            batches = batchify(self._samples(), self.signature,
-                               batch_size=self.batch_size, prefetch=0)
+    def __call__(self):
+        """(Parallelized) batch generator"""
 
-            # add it to the list of generators
-            # NOTE: this list will only contain one generator
-            generators.append(batches)
+        if self.workers:
+            # batches are served straight from shared memory and are
+            # therefore only valid until the next one is requested
+            batches = SharedMemoryBatches(self._worker_batches,
+                                          n_workers=self.workers)
+            for batch in batches:
+                yield batch
 
-        # loop on (background) generators indefinitely
-        while True:
-            for batches in generators:
-                # yield `batches_per_epoch` batches from current generator
-                # so that each epoch is covered by exactly one generator
-                for _ in range(batches_per_epoch):
-                    yield next(batches)
+        if self.parallel:
+            # background generators share one bounded prefetch buffer
+            # (see `prefetch` and `prefetch_bytes`), whose telemetry is
+            # available through `self.prefetch_.telemetry()`
+            self.prefetch_ = BoundedPrefetch(
+                [batchify(self._samples(), self.signature,
+                          batch_size=self.batch_size, prefetch=0)
+                 for _ in range(self.parallel)],
+                max_batches=self.prefetch, max_bytes=self.prefetch_bytes)
+            for batch in self.prefetch_:
+                yield batch
+
+        # batchify sampler without prefetching
+        batches = batchify(self._samples(), self.signature,
+                           batch_size=self.batch_size, prefetch=0)
+        for batch in batches:
+            yield batch
 
 
 class LabelingTask(Trainer):
@@ -508,17 +567,25 @@ class LabelingTask(Trainer):
         Defaults to one day (1).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
+    workers : int, optional
+        Number of worker processes generating batches into shared memory
+        (instead of `parallel` background generators). Defaults to 0.
     """
 
     def __init__(self, duration=3.2, batch_size=32, per_epoch=1,
-                 parallel=1):
+                 parallel=1, workers=0, prefetch=16, prefetch_bytes=None):
         super(LabelingTask, self).__init__()
         self.duration = duration
         self.batch_size = batch_size
         self.per_epoch = per_epoch
         self.parallel = parallel
+        self.workers = workers
+        self.prefetch = prefetch
+        self.prefetch_bytes = prefetch_bytes
 
 
     def get_batch_generator(self, feature_extraction, protocol, subset='train',
@@ -548,7 +615,9 @@ class LabelingTask(Trainer):
             feature_extraction, protocol, subset=subset,
             frame_info=frame_info, frame_crop=frame_crop,
             duration=self.duration, step=self.step, per_epoch=self.per_epoch,
-            batch_size=self.batch_size, parallel=self.parallel)
+            batch_size=self.batch_size, parallel=self.parallel,
+            workers=self.workers,
+            prefetch=self.prefetch, prefetch_bytes=self.prefetch_bytes)
 
     @property
     def weight(self):
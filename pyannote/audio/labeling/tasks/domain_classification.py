@@ -62,8 +62,10 @@ class DomainClassificationGenerator(LabelingTaskGenerator):
         Defaults to one day (1).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
     """
 
     def __init__(self, feature_extraction, protocol, subset='train',
@@ -107,8 +109,10 @@ class DomainClassification(LabelingTask):
         Defaults to one day (1).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
     """
 
     def __init__(self, domain='domain', **kwargs):
@@ -137,4 +141,6 @@ class DomainClassification(LabelingTask):
             duration=self.duration,
             per_epoch=self.per_epoch,
             batch_size=self.batch_size,
-            parallel=self.parallel)
+            parallel=self.parallel,
+            workers=self.workers,
+            prefetch=self.prefetch, prefetch_bytes=self.prefetch_bytes)
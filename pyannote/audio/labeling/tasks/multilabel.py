@@ -69,8 +69,13 @@ class MultilabelGenerator(LabelingTaskGenerator):
         Defaults to one day (1).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
+    workers : int, optional
+        When set, batches are generated by that many worker processes into
+        shared memory, instead of `parallel` background generators.
 
     Usage
     -----
@@ -94,7 +99,8 @@ class MultilabelGenerator(LabelingTaskGenerator):
 
     def __init__(self, feature_extraction, protocol, subset='train',
                  frame_info=None, frame_crop=None, duration=3.2,
-                 batch_size=32, per_epoch=1, parallel=1,
+                 batch_size=32, per_epoch=1, parallel=1, workers=0,
+                 prefetch=16, prefetch_bytes=None,
                  overlap=False, speech=False, labels=None, shuffle=True):
         self.overlap = overlap
         self.speech = speech
@@ -103,7 +109,9 @@ class MultilabelGenerator(LabelingTaskGenerator):
                          frame_info=frame_info, frame_crop=frame_crop,
                          duration=duration,
                          batch_size=batch_size, per_epoch=per_epoch,
-                         parallel=parallel, shuffle=shuffle)
+                         parallel=parallel, workers=workers,
+                         prefetch=prefetch, prefetch_bytes=prefetch_bytes,
+                         shuffle=shuffle)
 
     def postprocess_y(self, Y):
         # number of speakers for each frame
@@ -153,8 +161,13 @@ class Multilabel(LabelingTask):
         Defaults to one day (1).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
+    workers : int, optional
+        When set, batches are generated by that many worker processes into
+        shared memory, instead of `parallel` background generators.
 
     Usage
     -----
@@ -214,6 +227,9 @@ class Multilabel(LabelingTask):
             per_epoch=self.per_epoch,
             batch_size=self.batch_size,
             parallel=self.parallel,
+            workers=self.workers,
+            prefetch=self.prefetch,
+            prefetch_bytes=self.prefetch_bytes,
             overlap=self.overlap,
             speech=self.speech,
             labels=self.labels_)
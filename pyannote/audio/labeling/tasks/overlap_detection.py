@@ -37,6 +37,8 @@ from pyannote.generators.fragment import SlidingSegments
 from pyannote.generators.batch import batchify
 
 from pyannote.audio.features import RawAudio
+from pyannote.audio.train.shared import SharedMemoryBatches
+from pyannote.audio.train.prefetch import BoundedPrefetch
 
 from .base import LabelingTask
 from .base import LabelingTaskGenerator
@@ -74,14 +76,20 @@ class OverlapDetectionGenerator(LabelingTaskGenerator):
         Defaults to one day (1).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
+    workers : int, optional
+        When set, batches are generated by that many worker processes into
+        shared memory, instead of `parallel` background generators.
     """
 
     def __init__(self, feature_extraction, protocol, subset='train',
                  frame_info=None, frame_crop=None, duration=3.2,
                  snr_min=0, snr_max=10,
-                 batch_size=32, per_epoch=1, parallel=1):
+                 batch_size=32, per_epoch=1, parallel=1, workers=0,
+                 prefetch=16, prefetch_bytes=None):
 
         self.snr_min = snr_min
         self.snr_max = snr_max
@@ -91,7 +99,9 @@ class OverlapDetectionGenerator(LabelingTaskGenerator):
                          frame_info=frame_info, frame_crop=frame_crop,
                          duration=duration,
                          batch_size=batch_size, per_epoch=per_epoch,
-                         parallel=parallel, shuffle=True)
+                         parallel=parallel, workers=workers,
+                         prefetch=prefetch, prefetch_bytes=prefetch_bytes,
+                         shuffle=True)
 
     def overlap_samples(self):
         """Random overlap samples
@@ -208,7 +218,7 @@ class OverlapDetectionGenerator(LabelingTaskGenerator):
 
     @property
     def signature(self):
-        return {'X': {'@': (None, np.stack)},
+        return {'X': {'@': (None, self.collate_X)},
                 'y': {'@': (None, np.stack)}}
 
     @property
@@ -221,14 +231,12 @@ class OverlapDetectionGenerator(LabelingTaskGenerator):
     def __call__(self):
         """(Parallelized) batch generator"""
 
-        # number of batches needed to complete an epoch
-        batches_per_epoch = self.batches_per_epoch
-
-        def generator():
+        def generator(nb_sequences_per_epoch):
 
             sliding_samples = self.sliding_samples()
             overlap_samples = self.overlap_samples()
 
+            i = 0
             while True:
 
                 # get fixed duration random sequence
@@ -253,51 +261,54 @@ class OverlapDetectionGenerator(LabelingTaskGenerator):
 
                 # run feature extraction
                 original['duration'] = self.duration
-                original['X'] = self.feature_extraction.crop(
+                crop = self.feature_extraction.prepare if self.batched_ \
+                    else self.feature_extraction.crop
+                original['X'] = crop(
                     original, Segment(0, self.duration), mode='center',
-                    fixed=self.duration)
+                    fixed=self.duration, epoch=self.iteration)
 
                 del original['waveform']
                 del original['duration']
 
+                # update counters
+                i = i + 1
+                if (i % nb_sequences_per_epoch) == 0:
+                    self.iteration = self.iteration + 1
+                    i = 0
+
                 yield original
 
-        generators = []
+        if self.workers:
+            # batches are served straight from shared memory and are
+            # therefore only valid until the next one is requested
+            # and each worker only produces its share of every epoch
+            nb_sequences_per_epoch = int(np.ceil(
+                self.nb_sequences_per_epoch / self.workers))
+            batches = SharedMemoryBatches(
+                lambda: batchify(generator(nb_sequences_per_epoch),
+                                 self.signature, batch_size=self.batch_size,
+                                 prefetch=0),
+                n_workers=self.workers)
+            for batch in batches:
+                yield batch
 
         if self.parallel:
-            for _ in range(self.parallel):
-
-                # initialize one sample generator
-                samples = generator()
-
-                # batchify it and make sure at least
-                # `batches_per_epoch` batches are prefetched.
-                batches = batchify(samples, self.signature,
-                                   batch_size=self.batch_size,
-                                   prefetch=batches_per_epoch)
-
-                # add batch generator to the list of (background) generators
-                generators.append(batches)
-        else:
-
-            # initialize one sample generator
-            samples = generator()
-
-            # batchify it without prefetching
-            batches = batchify(samples, self.signature,
-                               batch_size=self.batch_size, prefetch=0)
-
-            # add it to the list of generators
-            # NOTE: this list will only contain one generator
-            generators.append(batches)
-
-        # loop on (background) generators indefinitely
-        while True:
-            for batches in generators:
-                # yield `batches_per_epoch` batches from current generator
-                # so that each epoch is covered by exactly one generator
-                for _ in range(batches_per_epoch):
-                    yield next(batches)
+            # background generators share one bounded prefetch buffer
+            self.prefetch_ = BoundedPrefetch(
+                [batchify(generator(self.nb_sequences_per_epoch),
+                          self.signature,
+                          batch_size=self.batch_size, prefetch=0)
+                 for _ in range(self.parallel)],
+                max_batches=self.prefetch, max_bytes=self.prefetch_bytes)
+            for batch in self.prefetch_:
+                yield batch
+
+        # batchify sample generator without prefetching
+        batches = batchify(generator(self.nb_sequences_per_epoch),
+                           self.signature, batch_size=self.batch_size,
+                           prefetch=0)
+        for batch in batches:
+            yield batch
 
     @property
     def specifications(self):
@@ -322,8 +333,13 @@ class OverlapDetection(LabelingTask):
         Defaults to one day (1).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
+    workers : int, optional
+        When set, batches are generated by that many worker processes into
+        shared memory, instead of `parallel` background generators.
 
     Usage
     -----
@@ -370,4 +386,6 @@ class OverlapDetection(LabelingTask):
             duration=self.duration,
             per_epoch=self.per_epoch,
             batch_size=self.batch_size,
-            parallel=self.parallel)
+            parallel=self.parallel,
+            workers=self.workers,
+            prefetch=self.prefetch, prefetch_bytes=self.prefetch_bytes)
@@ -71,8 +71,10 @@ class SpeakerChangeDetectionGenerator(LabelingTaskGenerator):
         Total audio duration per epoch, in days. Defaults to one day (1).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
 
     """
 
@@ -197,8 +199,10 @@ class SpeakerChangeDetection(LabelingTask):
         Defaults to one day (1).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
 
     Usage
     -----
@@ -246,4 +250,6 @@ class SpeakerChangeDetection(LabelingTask):
             frame_crop=frame_crop, subset='train', collar=self.collar,
             regression=self.regression, non_speech=self.non_speech,
             duration=self.duration, batch_size=self.batch_size,
-            per_epoch=self.per_epoch, parallel=self.parallel)
+            per_epoch=self.per_epoch, parallel=self.parallel,
+            workers=self.workers,
+            prefetch=self.prefetch, prefetch_bytes=self.prefetch_bytes)
@@ -63,8 +63,10 @@ class SpeechActivityDetectionGenerator(LabelingTaskGenerator):
         Defaults to one day (1).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
     """
 
     def postprocess_y(self, Y):
@@ -118,8 +120,10 @@ class SpeechActivityDetection(LabelingTask):
         Defaults to one day (1).
     parallel : int, optional
         Number of prefetching background generators. Defaults to 1.
-        Each generator will prefetch enough batches to cover a whole epoch.
         Set `parallel` to 0 to not use background generators.
+    prefetch, prefetch_bytes : int, optional
+        Maximum number of batches (defaults to 16) and memory, in bytes
+        (defaults to no limit), prefetched by background generators.
     """
 
     def get_batch_generator(self, feature_extraction, protocol, subset='train',
@@ -142,7 +146,9 @@ class SpeechActivityDetection(LabelingTask):
             duration=self.duration,
             per_epoch=self.per_epoch,
             batch_size=self.batch_size,
-            parallel=self.parallel)
+            parallel=self.parallel,
+            workers=self.workers,
+            prefetch=self.prefetch, prefetch_bytes=self.prefetch_bytes)
 
 
 class DomainAwareSpeechActivityDetection(SpeechActivityDetection):
@@ -29,6 +29,7 @@
 import dask
 import numpy as np
 from .features.utils import read_audio
+from .features.normalization import short_term_moments
 from pyannote.core import Segment, Timeline
 from pyannote.core import SlidingWindow, SlidingWindowFeature
 
@@ -294,6 +295,145 @@ class StreamAccumulate(object):
 
 
 
+class StreamShortTermStandardization(object):
+    """This module applies short-term mean/variance normalization
+
+    Output is the same as `ShortTermStandardization` applied to the whole
+    (concatenated) stream, but delayed by half a window: frames are only
+    normalized once their whole window has been received (or on
+    "end-of-stream"). Only the last window of frames is kept in memory.
+
+    Parameters
+    ----------
+    duration : float, optional
+        Window duration in seconds. Defaults to 3 seconds.
+
+    Usage
+    -----
+    >>> normalize = StreamShortTermStandardization(duration=3.)
+    >>> for chunk in chunks:
+    ...     normalized = normalize.process(chunk, sliding_window=frames)
+    >>> normalized = normalize.process(last_chunk, final=True)
+    """
+
+    def __init__(self, duration=3.):
+        super(StreamShortTermStandardization, self).__init__()
+        self.duration = duration
+        self.initialized_ = False
+
+    def initialize(self, sequence):
+        self._initialize(sequence.sliding_window, sequence.data.shape[1])
+
+    def _initialize(self, sw, dimension):
+
+        # common time base
+        self.frames_ = SlidingWindow(start=sw.start,
+                                     duration=sw.duration,
+                                     step=sw.step)
+        self.half_ = self.frames_.samples(self.duration, mode='center') // 2
+
+        self.buffer_ = np.zeros((0, dimension))
+        # index (in buffer) of first frame that is not normalized yet
+        self.first_ = 0
+        self.initialized_ = True
+
+    def process(self, data, sliding_window=None, final=False):
+        """Normalize next chunk of frames
+
+        Parameters
+        ----------
+        data : (n_samples, n_features) `numpy.ndarray`
+            Next (adjacent) chunk of frames.
+        sliding_window : `SlidingWindow`, optional
+            Sliding window of the first chunk. Only needed by the first call
+            following initialization (or "end-of-stream").
+        final : bool, optional
+            Whether this is the last chunk. Resets internal state so that a
+            new stream can be processed. Defaults to False.
+
+        Returns
+        -------
+        normalized : (n_normalized, n_features) `numpy.ndarray`
+            Normalized frames, starting right after the ones returned by
+            the previous call.
+        """
+
+        if not self.initialized_:
+            self._initialize(sliding_window, data.shape[1])
+
+        buffer = np.concatenate([self.buffer_, data], axis=0)
+        n_samples = len(buffer)
+
+        end = n_samples if final else max(self.first_,
+                                          n_samples - self.half_)
+        mu, sigma = short_term_moments(buffer, self.half_,
+                                       start=self.first_, end=end)
+        sigma[sigma == 0.] = 1e-6
+        normalized = (buffer[self.first_:end] - mu) / sigma
+
+        # only keep frames needed by the next windows
+        drop = max(0, end - self.half_)
+        self.buffer_ = buffer[drop:]
+        self.frames_ = SlidingWindow(start=self.frames_[drop].start,
+                                     duration=self.frames_.duration,
+                                     step=self.frames_.step)
+        self.first_ = end - drop
+
+        if final:
+            self.initialized_ = False
+
+        return normalized
+
+    def __call__(self, sequence=Stream.NoNewData):
+
+        if isinstance(sequence, More):
+            sequence = sequence.output
+
+        # no new data
+        if sequence is Stream.NoNewData:
+            return sequence
+
+        # if input stream has ended
+        if not isinstance(sequence, SlidingWindowFeature):
+
+            # if buffer has been emptied already, return "end-of-stream"
+            if not self.initialized_:
+                return Stream.EndOfStream
+
+            # normalize remaining frames
+            frames = SlidingWindow(start=self.frames_[self.first_].start,
+                                   duration=self.frames_.duration,
+                                   step=self.frames_.step)
+            normalized = self.process(self.buffer_[:0], final=True)
+
+            if len(normalized) == 0:
+                return Stream.EndOfStream
+            return SlidingWindowFeature(normalized, frames)
+
+        if self.initialized_:
+
+            # check that feature sequence uses the common time base
+            sw = sequence.sliding_window
+            assert sw.duration == self.frames_.duration
+            assert sw.step == self.frames_.step
+
+            # check that first frame is exactly the one that is expected
+            expected = self.frames_[len(self.buffer_)]
+            assert np.allclose(expected.start, sw[0].start)
+
+        else:
+            self.initialize(sequence)
+
+        frames = SlidingWindow(start=self.frames_[self.first_].start,
+                               duration=self.frames_.duration,
+                               step=self.frames_.step)
+        normalized = self.process(sequence.data)
+
+        if len(normalized) == 0:
+            return Stream.NoNewData
+        return SlidingWindowFeature(normalized, frames)
+
+
 class StreamBinarize(object):
     """This module binarizes input score sequence
     """
@@ -120,3 +120,11 @@ class Logging(Callback):
             global_step=trainer.epoch_,
             bins='fd',
         )
+
+        # producer/consumer stalls of bounded prefetching (if any)
+        prefetch = getattr(trainer.batch_generator_, 'prefetch_', None)
+        if prefetch is not None:
+            for key, value in prefetch.telemetry(reset=True).items():
+                trainer.tensorboard_.add_scalar(
+                    f'profiling/prefetch/{key}', value,
+                    global_step=trainer.epoch_)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2019 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+# Bounded background prefetching of batches
+"""
+
+import time
+import threading
+import collections
+
+
+def nbytes(batch):
+    """Memory used by a batch (dict, list or tuple of arrays), in bytes"""
+
+    if isinstance(batch, dict):
+        return sum(nbytes(value) for value in batch.values())
+
+    if isinstance(batch, (list, tuple)):
+        return sum(nbytes(value) for value in batch)
+
+    # numpy array
+    if hasattr(batch, 'nbytes'):
+        return int(batch.nbytes)
+
+    # torch tensor
+    if hasattr(batch, 'element_size'):
+        return int(batch.element_size() * batch.nelement())
+
+    return 0
+
+
+class BoundedPrefetch(object):
+    """Prefetch batches in background threads, within a memory budget
+
+    One background thread per batch generator pushes batches into a shared
+    buffer. Threads block (backpressure) as soon as the buffer holds
+    `max_batches` batches, or would exceed `max_bytes` bytes. One batch is
+    always accepted into an empty buffer, whatever its size.
+
+    Parameters
+    ----------
+    generators : iterable of iterators
+        (Infinite) batch generators. Batches are dictionaries of numpy arrays
+        (or lists thereof).
+    max_batches : int, optional
+        Maximum number of prefetched batches. Defaults to 16.
+    max_bytes : int, optional
+        Maximum memory used by prefetched batches, in bytes.
+        Defaults to no limit.
+
+    Usage
+    -----
+    >>> batches = BoundedPrefetch([generator() for _ in range(4)],
+    ...                           max_batches=32, max_bytes=2e9)
+    >>> for batch in batches:
+    ...     train(batch)
+    ...     telemetry = batches.telemetry(reset=True)
+
+    Telemetry
+    ---------
+    producer_stalls : number of times a generator had a batch ready but had
+        to wait for room in the buffer (prefetching is ahead of training).
+    consumer_stalls : number of times a batch was requested from an empty
+        buffer (training is waiting for data: more `generators` would help).
+    producer_wait, consumer_wait : corresponding time spent waiting, in
+        seconds.
+    max_batches, max_bytes : peak number of batches and memory (in bytes)
+        held by the buffer.
+    """
+
+    def __init__(self, generators, max_batches=16, max_bytes=None):
+        super().__init__()
+
+        self.max_batches = max(1, int(max_batches))
+        self.max_bytes = None if max_bytes is None else int(max_bytes)
+
+        self.buffer_ = collections.deque()
+        self.bytes_ = 0
+        self.running_ = 0
+        self.error_ = None
+        self.lock_ = threading.Lock()
+        self.not_empty_ = threading.Condition(self.lock_)
+        self.not_full_ = threading.Condition(self.lock_)
+        self.telemetry(reset=True)
+
+        self.threads_ = []
+        for generator in generators:
+            thread = threading.Thread(target=self._produce,
+                                      args=(generator, ), daemon=True)
+            self.threads_.append(thread)
+            self.running_ += 1
+
+        for thread in self.threads_:
+            thread.start()
+
+    def telemetry(self, reset=False):
+        """Get (and optionally reset) producer/consumer stall telemetry
+
+        Parameters
+        ----------
+        reset : bool, optional
+            Reset counters after reading them. Defaults to False.
+
+        Returns
+        -------
+        telemetry : dict
+            See `BoundedPrefetch` docstring.
+        """
+
+        with self.lock_:
+            telemetry = dict(getattr(self, 'telemetry_', {}))
+            if reset:
+                self.telemetry_ = {
+                    'producer_stalls': 0, 'producer_wait': 0.,
+                    'consumer_stalls': 0, 'consumer_wait': 0.,
+                    'max_batches': len(self.buffer_),
+                    'max_bytes': self.bytes_}
+        return telemetry
+
+    def _full(self, size):
+        if not self.buffer_:
+            return False
+        if len(self.buffer_) >= self.max_batches:
+            return True
+        return self.max_bytes is not None and \
+            self.bytes_ + size > self.max_bytes
+
+    def _produce(self, generator):
+        """Background thread main loop"""
+
+        try:
+            for batch in generator:
+                size = nbytes(batch)
+
+                with self.lock_:
+
+                    if self._full(size):
+                        self.telemetry_['producer_stalls'] += 1
+                        t = time.time()
+                        while self._full(size):
+                            self.not_full_.wait()
+                        self.telemetry_['producer_wait'] += time.time() - t
+
+                    self.buffer_.append((batch, size))
+                    self.bytes_ += size
+
+                    telemetry = self.telemetry_
+                    telemetry['max_batches'] = max(telemetry['max_batches'],
+                                                   len(self.buffer_))
+                    telemetry['max_bytes'] = max(telemetry['max_bytes'],
+                                                 self.bytes_)
+
+                    self.not_empty_.notify()
+
+        except Exception as e:
+            with self.lock_:
+                self.error_ = e
+                self.not_empty_.notify_all()
+
+        finally:
+            with self.lock_:
+                self.running_ -= 1
+                self.not_empty_.notify_all()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+
+        with self.lock_:
+
+            if not self.buffer_ and self.error_ is None and self.running_:
+                self.telemetry_['consumer_stalls'] += 1
+                t = time.time()
+                while not self.buffer_ and self.error_ is None \
+                        and self.running_:
+                    self.not_empty_.wait()
+                self.telemetry_['consumer_wait'] += time.time() - t
+
+            # do not let remaining generators hide a failing one
+            if self.error_ is not None:
+                raise self.error_
+
+            if not self.buffer_:
+                raise StopIteration()
+
+            batch, size = self.buffer_.popleft()
+            self.bytes_ -= size
+            self.not_full_.notify_all()
+
+        return batch
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2019 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+# Batches produced by worker processes into shared memory
+"""
+
+import queue
+import random
+import traceback
+import multiprocessing as mp
+import numpy as np
+import torch
+
+# seconds between two checks that worker processes are still alive
+WORKER_TIMEOUT = 5.
+
+
+class SharedMemoryBatches(object):
+    """Batches produced by worker processes into shared memory
+
+    Each worker process has its own (seeded) batch generator and writes
+    collated batches into one of a few preallocated shared-memory slots.
+    Batches are then served to the consumer as numpy arrays that are views
+    of these slots (i.e. without any copy nor pickling).
+
+    Parameters
+    ----------
+    get_batches : callable
+        Called in each worker process (after seeding) to get an (infinite)
+        iterator of batches. Batches are dictionaries of numpy arrays (or
+        `torch.Tensor`) whose shapes must not change from one batch to the
+        next. It is also called once in the main process to get a first
+        batch, from which shared-memory slots are allocated.
+    n_workers : int, optional
+        Number of worker processes. Defaults to 1.
+    n_slots : int, optional
+        Number of shared-memory slots. Defaults to 2 x `n_workers` + 1.
+    seed : int, optional
+        Worker #i uses `seed` + i as random seed. Defaults to drawing `seed`
+        from `np.random`.
+
+    Usage
+    -----
+    >>> batches = SharedMemoryBatches(get_batches, n_workers=4)
+    >>> for batch in batches:
+    ...     # `batch` is only valid until the next one is requested:
+    ...     # its shared-memory slot is then given back to workers.
+    ...     train(batch)
+
+    Notes
+    -----
+    Worker processes are forked when iteration starts (and terminated when
+    the iterator is closed or garbage collected). They use one single torch
+    thread each. Iteration fails with a `RuntimeError` as soon as a worker
+    raises an exception or dies (e.g. killed by the out-of-memory killer)
+    instead of waiting forever for its batches.
+    """
+
+    def __init__(self, get_batches, n_workers=1, n_slots=None, seed=None):
+        super().__init__()
+        self.get_batches = get_batches
+        self.n_workers = n_workers
+        if n_slots is None:
+            n_slots = 2 * n_workers + 1
+        self.n_slots = n_slots
+        self.seed = seed
+
+    @staticmethod
+    def _worker(i, seed, get_batches, slots, free, ready):
+        """Worker main loop"""
+
+        try:
+            np.random.seed(seed + i)
+            random.seed(seed + i)
+            torch.manual_seed(seed + i)
+            torch.set_num_threads(1)
+
+            for batch in get_batches():
+                slot = free.get()
+                for key, value in batch.items():
+                    np.copyto(slots[slot][key], np.asarray(value))
+                ready.put((slot, None))
+
+        except Exception as e:
+            ready.put((None, traceback.format_exc()))
+
+    def __iter__(self):
+
+        # first batch (produced in the main process) tells which arrays need
+        # to be allocated for each slot
+        batch = {key: np.asarray(value)
+                 for key, value in next(iter(self.get_batches())).items()}
+
+        context = mp.get_context('fork')
+        buffers = [{key: context.RawArray('b', max(1, value.nbytes))
+                    for key, value in batch.items()}
+                   for _ in range(self.n_slots)]
+        slots = [{key: np.frombuffer(buffer[key], dtype=value.dtype,
+                                     count=value.size).reshape(value.shape)
+                  for key, value in batch.items()}
+                 for buffer in buffers]
+
+        # `ready` supports timeouts so that dead workers can be detected
+        free, ready = context.SimpleQueue(), context.Queue()
+        for slot in range(self.n_slots):
+            free.put(slot)
+
+        seed = self.seed
+        if seed is None:
+            seed = np.random.randint(2 ** 31 - self.n_workers)
+
+        workers = [context.Process(target=self._worker,
+                                   args=(i, seed, self.get_batches, slots,
+                                         free, ready),
+                                   daemon=True)
+                   for i in range(self.n_workers)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            yield batch
+
+            previous = None
+            while True:
+                try:
+                    slot, error = ready.get(timeout=WORKER_TIMEOUT)
+                except queue.Empty:
+                    for i, worker in enumerate(workers):
+                        if not worker.is_alive():
+                            msg = (f'Batch generation worker process #{i} '
+                                   f'(pid {worker.pid}) died unexpectedly '
+                                   f'with exit code {worker.exitcode}.')
+                            raise RuntimeError(msg)
+                    continue
+
+                if error is not None:
+                    msg = f'Batch generation failed in worker process:\n{error}'
+                    raise RuntimeError(msg)
+
+                # consumer is done with previous batch: recycle its slot
+                if previous is not None:
+                    free.put(previous)
+                previous = slot
+
+                yield slots[slot]
+
+        finally:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
+            ready.close()
+            # shared memory is released once served batches are released too
+            del slots, buffers
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2019 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+Benchmark reverberation data augmentation
+
+Usage:
+  augmentation.py [--batch-size=<n> --duration=<seconds> --batches=<n> --rt60=<seconds>] [<rir>...]
+  augmentation.py -h | --help
+
+Options:
+  <rir>                  Room impulse response audio files. Defaults to 20
+                         synthetic (exponentially decaying noise) 16kHz
+                         room impulse responses.
+  --batch-size=<n>       Batch size [default: 32].
+  --duration=<seconds>   Duration of waveforms [default: 3.2].
+  --batches=<n>          Number of batches [default: 20].
+  --rt60=<seconds>       Reverberation time of synthetic room impulse
+                         responses [default: 0.6].
+"""
+
+import os
+import time
+import tempfile
+import numpy as np
+import soundfile as sf
+from docopt import docopt
+
+from pyannote.audio.augmentation import AddReverb
+from pyannote.audio.augmentation import Compose
+
+
+def main():
+
+    arguments = docopt(__doc__)
+    batch_size = int(arguments['--batch-size'])
+    duration = float(arguments['--duration'])
+    n_batches = int(arguments['--batches'])
+    rt60 = float(arguments['--rt60'])
+    sample_rate = 16000
+
+    rirs = arguments['<rir>']
+    synthetic = not rirs
+    if synthetic:
+        rirs = []
+
+    try:
+        if synthetic:
+            n_taps = int(rt60 * sample_rate)
+            decay = np.exp(-6.9 * np.arange(n_taps) / n_taps)
+            for _ in range(20):
+                fd, rir = tempfile.mkstemp(suffix='.wav')
+                os.close(fd)
+                rirs.append(rir)
+                h = 0.1 * np.random.randn(n_taps) * decay
+                h[0] = 1.
+                sf.write(rir, h.astype(np.float32), sample_rate)
+
+        # room impulse responses are loaded (and kept in memory) here
+        reverb = AddReverb(files=[{'uri': os.path.basename(rir),
+                                   'audio': rir} for rir in rirs])
+        n_taps = max(len(h) for h in reverb.get_rirs(sample_rate))
+
+    finally:
+        if synthetic:
+            for rir in rirs:
+                os.remove(rir)
+
+    n_samples = int(duration * sample_rate)
+    batches = [np.random.randn(batch_size, n_samples, 1).astype(np.float32)
+               for _ in range(n_batches)]
+    audio_duration = n_batches * batch_size * duration
+
+    def direct(batch):
+        rirs = reverb.get_rirs(sample_rate)
+        return np.stack([
+            np.convolve(waveform[:, 0],
+                        rirs[np.random.randint(len(rirs))])[:n_samples]
+            for waveform in batch])
+
+    for name, augment in [
+        ('np.convolve', direct),
+        ('per waveform', lambda batch: np.stack([
+            reverb(waveform, sample_rate) for waveform in batch])),
+        ('batch', lambda batch: reverb.apply_batch(batch, sample_rate)),
+        # two augmentations in a row
+        ('composed (x2)', lambda batch: Compose([reverb, reverb]).apply_batch(
+            batch, sample_rate))]:
+
+        t = time.perf_counter()
+        for batch in batches:
+            augment(batch)
+        elapsed = time.perf_counter() - t
+
+        print(f'{name:14s} '
+              f'{1000 * elapsed / n_batches:8.2f} ms per batch | '
+              f'{audio_duration / elapsed:8.0f} seconds of audio per second')
+
+    print(f'({batch_size} x {duration:g}s waveforms, '
+          f'room impulse responses up to {n_taps} taps)')
+
+
+if __name__ == '__main__':
+    main()
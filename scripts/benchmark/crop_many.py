@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2019 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+Check (and benchmark) batched feature extraction of many crops
+
+Compares `FeatureExtraction.crop_many` with `FeatureExtraction.crop` on
+random (overlapping) crops, and fails when they differ by more than
+`--tolerance` (relative to the largest feature value).
+
+Usage:
+  crop_many.py [--duration=<seconds> --crops=<n> --tolerance=<t>] [<audio>]
+  crop_many.py -h | --help
+
+Options:
+  <audio>                Audio file. Defaults to a 1 minute long 16kHz
+                         white noise file.
+  --duration=<seconds>   Duration of random crops [default: 2.0].
+  --crops=<n>            Number of random crops [default: 100].
+  --tolerance=<t>        Maximum relative difference [default: 1e-4].
+"""
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import soundfile as sf
+from docopt import docopt
+
+from pyannote.core import Segment
+from pyannote.audio.features import LibrosaMFCC
+from pyannote.audio.features import LibrosaSpectrogram
+from pyannote.audio.features import LibrosaMelSpectrogram
+from pyannote.audio.features.utils import get_audio_duration
+
+
+def check(current_file, duration, n_crops, tolerance):
+
+    file_duration = current_file['duration']
+    starts = np.random.rand(n_crops) * (file_duration - duration)
+    segments = [Segment(start, start + duration) for start in starts]
+
+    success = True
+    for name, feature_extraction in [
+        ('spectrogram', LibrosaSpectrogram()),
+        ('mel', LibrosaMelSpectrogram()),
+        ('mfcc', LibrosaMFCC())]:
+
+        t = time.perf_counter()
+        X_ref = np.stack([
+            feature_extraction.crop(current_file, segment, mode='center',
+                                    fixed=duration)
+            for segment in segments])
+        t_ref = time.perf_counter() - t
+
+        t = time.perf_counter()
+        X = feature_extraction.crop_many(current_file, segments,
+                                         mode='center', fixed=duration)
+        t_many = time.perf_counter() - t
+
+        error = np.max(np.abs(X - X_ref)) / np.max(np.abs(X_ref))
+        success = success and error <= tolerance
+
+        print(f'{name:12s} '
+              f'crop {1000 * t_ref / n_crops:8.3f} ms per crop | '
+              f'crop_many {1000 * t_many / n_crops:8.3f} ms per crop | '
+              f'max. relative difference {error:g}')
+
+    return success
+
+
+def main():
+
+    arguments = docopt(__doc__)
+    duration = float(arguments['--duration'])
+    n_crops = int(arguments['--crops'])
+    tolerance = float(arguments['--tolerance'])
+
+    audio = arguments['<audio>']
+    if audio is None:
+        fd, audio = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+
+    try:
+        if arguments['<audio>'] is None:
+            noise = 0.1 * np.random.randn(60 * 16000, 1)
+            sf.write(audio, noise.astype(np.float32), 16000)
+
+        current_file = {'audio': audio}
+        current_file['duration'] = get_audio_duration(current_file)
+        success = check(current_file, duration, n_crops, tolerance)
+
+    finally:
+        if arguments['<audio>'] is None:
+            os.remove(audio)
+
+    if not success:
+        sys.exit(f'crop_many and crop differ by more than {tolerance:g}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2019 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+Benchmark batched (torch) feature extraction against librosa
+
+Usage:
+  features.py [--batch-size=<n> --duration=<seconds> --batches=<n>] [<audio>]
+  features.py -h | --help
+
+Options:
+  <audio>                Audio file. Defaults to a 10 minutes long 16kHz
+                         white noise file.
+  --batch-size=<n>       Batch size [default: 32].
+  --duration=<seconds>   Duration of random crops [default: 3.2].
+  --batches=<n>          Number of batches [default: 20].
+"""
+
+import os
+import time
+import tempfile
+import numpy as np
+import soundfile as sf
+from docopt import docopt
+
+from pyannote.core import Segment
+from pyannote.audio.features import LibrosaMFCC
+from pyannote.audio.features import LibrosaSpectrogram
+from pyannote.audio.features import LibrosaMelSpectrogram
+from pyannote.audio.features import TorchMFCC
+from pyannote.audio.features import TorchSpectrogram
+from pyannote.audio.features import TorchMelSpectrogram
+from pyannote.audio.features.utils import get_audio_duration
+
+
+def benchmark(audio, batch_size, duration, n_batches):
+
+    current_file = {'audio': audio}
+    file_duration = get_audio_duration(current_file)
+
+    starts = np.random.rand(n_batches, batch_size) * (file_duration - duration)
+    batches = [[Segment(start, start + duration) for start in batch]
+               for batch in starts]
+
+    for name, reference, batched in [
+        ('spectrogram', LibrosaSpectrogram(), TorchSpectrogram()),
+        ('mel', LibrosaMelSpectrogram(), TorchMelSpectrogram()),
+        ('mfcc', LibrosaMFCC(), TorchMFCC())]:
+
+        # crop waveforms beforehand so that only feature extraction is timed
+        waveforms = [[batched.prepare(current_file, segment, fixed=duration)
+                      for segment in batch] for batch in batches]
+
+        t = time.perf_counter()
+        for batch in waveforms:
+            X_ref = np.stack([
+                reference.get_features(y, reference.sample_rate)
+                for y in batch])
+        t_ref = time.perf_counter() - t
+
+        t = time.perf_counter()
+        for batch in waveforms:
+            X = batched.collate(batch)
+        t_batched = time.perf_counter() - t
+
+        # last batch has been computed both ways
+        n_frames = min(len(X_ref[0]), len(X[0]))
+        error = np.max(np.abs(X[:, :n_frames] - X_ref[:, :n_frames]))
+        scale = np.max(np.abs(X_ref))
+
+        print(f'{name:12s} '
+              f'librosa {1000 * t_ref / n_batches:8.2f} ms per batch | '
+              f'torch {1000 * t_batched / n_batches:8.2f} ms per batch | '
+              f'speedup x{t_ref / t_batched:5.1f} | '
+              f'max. relative difference {error / scale:g}')
+
+
+def main():
+
+    arguments = docopt(__doc__)
+    batch_size = int(arguments['--batch-size'])
+    duration = float(arguments['--duration'])
+    n_batches = int(arguments['--batches'])
+
+    audio = arguments['<audio>']
+    if audio is None:
+        fd, audio = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+
+    try:
+        if arguments['<audio>'] is None:
+            noise = 0.1 * np.random.randn(600 * 16000, 1)
+            sf.write(audio, noise.astype(np.float32), 16000)
+        benchmark(audio, batch_size, duration, n_batches)
+
+    finally:
+        if arguments['<audio>'] is None:
+            os.remove(audio)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2019 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""
+Benchmark on-the-fly resampling of random crops
+
+Usage:
+  resampling.py [--sample-rate=<Hz> --duration=<seconds> --crops=<n>] [<audio>]
+  resampling.py -h | --help
+
+Options:
+  <audio>                Audio file. Defaults to a 10 minutes long 44.1kHz
+                         white noise file.
+  --sample-rate=<Hz>     Target sample rate [default: 16000].
+  --duration=<seconds>   Duration of random crops [default: 2.0].
+  --crops=<n>            Number of random crops [default: 500].
+"""
+
+import os
+import time
+import tempfile
+import numpy as np
+import librosa
+import soundfile as sf
+from docopt import docopt
+from soundfile import SoundFile
+
+from pyannote.core import Segment
+from pyannote.core import SlidingWindow
+from pyannote.audio.features import RawAudio
+from pyannote.audio.features.utils import get_audio_duration
+
+
+def librosa_crop(current_file, segment, sample_rate, fixed):
+    """Previous implementation of `RawAudio.crop` (for reference)"""
+
+    target = SlidingWindow(start=-.5/sample_rate,
+                           duration=1./sample_rate,
+                           step=1./sample_rate)
+    (start, end), = target.crop(segment, mode='center', fixed=fixed,
+                                return_ranges=True)
+    n_samples = end - start
+
+    with SoundFile(current_file['audio'], 'r') as audio_file:
+        file_sample_rate = audio_file.samplerate
+        native = SlidingWindow(start=-.5/file_sample_rate,
+                               duration=1./file_sample_rate,
+                               step=1./file_sample_rate)
+        (start, end), = native.crop(segment, mode='center', fixed=fixed,
+                                    return_ranges=True)
+        audio_file.seek(start)
+        data = audio_file.read(end - start, dtype='float32', always_2d=True)
+
+    data = np.mean(data, axis=1, keepdims=True)
+    data = librosa.core.resample(data.T, file_sample_rate, sample_rate).T
+    return data[:n_samples]
+
+
+def benchmark(audio, sample_rate, duration, n_crops):
+
+    current_file = {'audio': audio}
+    file_duration = get_audio_duration(current_file)
+    raw_audio = RawAudio(sample_rate=sample_rate)
+
+    starts = np.random.rand(n_crops) * (file_duration - duration)
+    segments = [Segment(start, start + duration) for start in starts]
+
+    for name, crop in [
+        ('librosa', lambda s: librosa_crop(current_file, s, sample_rate,
+                                           duration)),
+        ('polyphase', lambda s: raw_audio.crop(current_file, s,
+                                               mode='center',
+                                               fixed=duration))]:
+
+        t = time.perf_counter()
+        for segment in segments:
+            crop(segment)
+        elapsed = time.perf_counter() - t
+        print(f'{name:10s} {1000 * elapsed / n_crops:8.3f} ms per crop')
+
+    # compare cropped and whole-file resampling
+    waveform = raw_audio(current_file)
+    error = max(
+        np.max(np.abs(raw_audio.crop(current_file, s, mode='center',
+                                     fixed=duration) -
+                      waveform.crop(s, mode='center', fixed=duration)))
+        for s in segments[:10])
+    print(f'max. difference with whole-file resampling: {error:g}')
+
+
+def main():
+
+    arguments = docopt(__doc__)
+    sample_rate = int(arguments['--sample-rate'])
+    duration = float(arguments['--duration'])
+    n_crops = int(arguments['--crops'])
+
+    audio = arguments['<audio>']
+    if audio is None:
+        fd, audio = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+
+    try:
+        if arguments['<audio>'] is None:
+            noise = 0.1 * np.random.randn(600 * 44100, 1)
+            sf.write(audio, noise.astype(np.float32), 44100)
+        benchmark(audio, sample_rate, duration, n_crops)
+
+    finally:
+        if arguments['<audio>'] is None:
+            os.remove(audio)
+
+
+if __name__ == '__main__':
+    main()